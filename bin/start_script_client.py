@@ -0,0 +1,88 @@
+# Forwards "start script" requests from global hotkeys to the script server
+# that is running in myscripts, so that a key press does not have to pay for
+# interpreter startup, imports and script lookup. Falls back to start_script.py
+# if the server is not running.
+#
+# Only import modules that are cheap to load.
+import json
+import os
+import runpy
+import socket
+import sys
+
+# Must match the default port of `_scriptserver.ScriptServer`.
+_SCRIPT_SERVER_PORT = 4312
+
+_CONNECT_TIMEOUT_SECS = 0.5
+_RESPONSE_TIMEOUT_SECS = 5.0
+
+
+def _parse_bool(value: str):
+    value = value.lower()
+    if value == "auto":
+        return None
+    return value in ("yes", "true", "t", "y", "1")
+
+
+def _parse_args(argv):
+    restart_instance = True
+    cd = True
+    i = 0
+    while i < len(argv) and argv[i].startswith("--"):
+        key, _, value = argv[i][2:].partition("=")
+        if key == "restart-instance":
+            restart_instance = _parse_bool(value)
+        elif key == "cd":
+            cd = _parse_bool(value)
+        else:
+            return None
+        i += 1
+    if i >= len(argv):
+        return None
+    return {
+        "file": os.path.abspath(argv[i]) if os.path.exists(argv[i]) else argv[i],
+        "args": argv[i + 1 :],
+        "restartInstance": restart_instance,
+        "cd": cd,
+    }
+
+
+def _send_request(req) -> bool:
+    body = json.dumps(req).encode("utf-8")
+    try:
+        with socket.create_connection(
+            ("127.0.0.1", _SCRIPT_SERVER_PORT), timeout=_CONNECT_TIMEOUT_SECS
+        ) as sock:
+            sock.settimeout(_RESPONSE_TIMEOUT_SECS)
+            sock.sendall(
+                b"POST /start-script HTTP/1.1\r\n"
+                b"Host: 127.0.0.1\r\n"
+                b"Content-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                + body
+            )
+
+            # The server responds as soon as the script has been found, so
+            # only the status line is needed.
+            resp = b""
+            while b"\r\n" not in resp:
+                data = sock.recv(1024)
+                if not data:
+                    break
+                resp += data
+    except OSError:
+        return False
+
+    status_line = resp.split(b"\r\n", 1)[0].split()
+    return len(status_line) >= 2 and status_line[1] == b"200"
+
+
+if __name__ == "__main__":
+    req = _parse_args(sys.argv[1:])
+    if req is None or not _send_request(req):
+        # Fall back to starting the script in this process.
+        start_script = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "start_script.py"
+        )
+        sys.argv = [start_script] + sys.argv[1:]
+        runpy.run_path(start_script, run_name="__main__")
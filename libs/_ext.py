@@ -6,7 +6,6 @@ import shutil
 import subprocess
 from typing import Any, Callable, Dict, Generator, List, Literal, Optional, Tuple
 
-from _pkgmanager import require_package
 from _script import (
     Script,
     _load_script_config_file,
@@ -101,6 +100,8 @@ def edit_script(
         workspace_file = create_myscript_workspace()
         open_in_vscode([workspace_file, file], line_number=line)
     else:
+        from _pkgmanager import require_package
+
         require_package("neovim")
 
         args = ["nvim"]
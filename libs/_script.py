@@ -18,9 +18,6 @@ from fnmatch import fnmatch
 from pathlib import Path
 from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
 
-from _cpp import setup_cmake
-from _filelock import FileLock
-from _pkgmanager import require_package
 from _shutil import (
     IgnoreSigInt,
     convert_to_unix_path,
@@ -34,16 +31,13 @@ from _shutil import (
     quote_arg,
     run_elevated,
     setup_nodejs,
-    update_json,
     write_temp_file,
 )
-from utils.android import setup_android_env
 from utils.browser import open_url
 from utils.clip import get_clip, get_selection
 from utils.dotenv import load_dotenv
-from utils.email import send_email_md
+from utils.jsonstore import JsonStore, get_json_store
 from utils.jsonutil import load_json, save_json
-from utils.menu.csvmenu import CsvMenu
 from utils.process import start_process
 from utils.script.path import (
     ScriptDirectory,
@@ -301,38 +295,27 @@ def exec_cmd(cmd):
     subprocess.check_call(args)
 
 
-def get_all_variables() -> Dict[str, str]:
-    file = get_variable_file()
-
-    with FileLock("access_variable"):
-        return load_json(file, default={})
+def _get_variable_store() -> JsonStore:
+    return get_json_store(get_variable_file())
 
 
-def get_variable(name) -> Optional[str]:
-    with FileLock("access_variable"):
-        variables = load_json(get_variable_file(), default={})
+def get_all_variables() -> Dict[str, str]:
+    return _get_variable_store().load()
 
-        if name not in variables:
-            return None
 
-        value = variables[name]
-        if not value:
-            return None
+def get_variable(name) -> Optional[str]:
+    value = _get_variable_store().get(name)
+    if not value:
+        return None
 
-        return variables[name]
+    return value
 
 
 def set_variable(name: str, val: str, set_env_var=True):
     logging.debug("set variable: %s=%s" % (name, val))
     assert val is not None
 
-    with FileLock("access_variable"):
-        file = get_variable_file()
-        variables = load_json(file, default={})
-
-        variables[name] = val
-
-        save_json(file, variables)
+    _get_variable_store().update({name: val})
 
     if set_env_var:
         os.environ[name] = val
@@ -344,11 +327,7 @@ def set_variable_value(variables: Dict[str, str], name: str, value: str):
 
 
 def update_variables(variables: Dict[str, str]):
-    config_file = get_variable_file()
-    with FileLock("access_variable"):
-        data = load_json(config_file, default={})
-        data.update(variables)
-        save_json(config_file, data)
+    _get_variable_store().update(variables)
 
 
 def write_setting(setting, name, val):
@@ -430,8 +409,16 @@ def _is_in_x_window_system() -> bool:
 
 
 class Script:
-    def __init__(self, script_path: str, name=None):
+    def __init__(
+        self,
+        script_path: str,
+        name=None,
+        mtime: Optional[float] = None,
+        cfg: Optional[Dict[str, Any]] = None,
+        variable_names: Optional[List[str]] = None,
+    ):
         self.__cached_source: Optional[str] = None
+        self.__cached_variable_names = variable_names
 
         if os.path.isfile(script_path):
             script_path = os.path.abspath(script_path)
@@ -474,7 +461,7 @@ class Script:
             self.real_ext = None
 
         self.mtime = 0.0
-        self.refresh_script()
+        self.refresh_script(mtime=mtime, cfg=cfg)
 
     def clear_source_cache(self):
         self.__cached_source = None
@@ -489,7 +476,7 @@ class Script:
     def __lt__(self, other):
         return self.mtime > other.mtime  # sort by modified time descendently by default
 
-    def refresh_script(self) -> bool:
+    def get_file_mtime(self) -> float:
         assert self.script_path
 
         mtime = os.path.getmtime(self.script_path)
@@ -501,16 +488,35 @@ class Script:
         if os.path.exists(default_script_config_file):
             mtime = max(mtime, os.path.getmtime(default_script_config_file))
 
+        return mtime
+
+    def refresh_script(
+        self, mtime: Optional[float] = None, cfg: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Reload the script config if any of the script files has been modified.
+
+        `mtime` and `cfg` can be provided by the caller (e.g. from the script
+        index) to skip the file stats and the config parsing.
+        """
+        if mtime is None:
+            mtime = self.get_file_mtime()
+
         if mtime > self.mtime:
             self.mtime = mtime
 
             # Reload script config
-            self.cfg = self.load_config()
+            self.cfg = cfg if cfg is not None else self.load_config()
+            if cfg is None:
+                self.__cached_variable_names = None
 
             return True
         else:
             return False
 
+    def get_cached_variable_names(self) -> Optional[List[str]]:
+        return self.__cached_variable_names
+
     def __str__(self):
         s = self.name
 
@@ -585,6 +591,8 @@ class Script:
         assert isinstance(read_var_from_csv, str)
 
         if read_var_from_csv:
+            from utils.menu.csvmenu import CsvMenu
+
             menu = CsvMenu(csv_file=read_var_from_csv)
             row_index = menu.select_row()
             if row_index >= 0:
@@ -752,6 +760,39 @@ class Script:
         assert isinstance(self.cfg["terminal"], str)
         return self.cfg["terminal"]
 
+    def needs_user_input(self, args: List[str]) -> bool:
+        """
+        Return whether `execute(args)` would ask for input with a menu before
+        the script is started.
+        """
+        cfg = self.load_config()
+
+        if cfg["var.required"]:
+            assert isinstance(cfg["var.required"], str)
+            variables = self.get_variables()
+            if any(not variables.get(name, "") for name in cfg["var.required"].split()):
+                return True
+
+        if not args:
+            # Only the first of these options that is set is used.
+            for name in [
+                "args.selectionAsFile",
+                "args.userInput",
+                "args.selection",
+                "args.clipboard",
+                "args.clipboardAsFile",
+                "args.selectFiles",
+                "args.selectDir",
+            ]:
+                if cfg[name]:
+                    return name in (
+                        "args.userInput",
+                        "args.selectFiles",
+                        "args.selectDir",
+                    )
+
+        return False
+
     def execute(
         self,
         args: List[str] = [],
@@ -901,6 +942,8 @@ class Script:
         use_shell_execute_win32 = False
 
         if self.cfg["adk"]:
+            from utils.android import setup_android_env
+
             setup_android_env(
                 env=env,
                 jdk_version=self.cfg["adk.jdk_version"],
@@ -910,6 +953,8 @@ class Script:
             )
 
         if self.cfg["cmake"]:
+            from _cpp import setup_cmake
+
             setup_cmake(env=env, cmake_version=self.cfg["cmake.version"])
 
         setup_env_var(env)
@@ -991,6 +1036,8 @@ class Script:
 
         elif ext in [".md", ".txt"]:
             if script_path.endswith(".email.md"):
+                from utils.email import send_email_md
+
                 send_email_md(content=self.render(variables=variables))
             else:
                 if template:
@@ -1269,6 +1316,8 @@ class Script:
 
         # Install dependant packages
         if self.cfg["packages"]:
+            from _pkgmanager import require_package
+
             packages = self.cfg["packages"].split()
             for pkg in packages:
                 require_package(pkg, wsl=self.cfg["wsl"], env=env)
@@ -1668,6 +1717,11 @@ class Script:
             return True
 
     def get_variable_names(self) -> List[str]:
+        if self.__cached_variable_names is None:
+            self.__cached_variable_names = self.__find_variable_names()
+        return list(self.__cached_variable_names)
+
+    def __find_variable_names(self) -> List[str]:
         VARIABLE_NAME_PATT = r"\b([A-Z_$][A-Z_$0-9]{4,})\b"
         if self.cfg["variableNames"] == "auto":
             if self.ext in SCRIPT_EXTENSIONS:
@@ -1703,8 +1757,9 @@ class Script:
         return variable_names
 
     def update_script_access_time(self):
-        config_file = _get_script_access_time_file()
-        update_json(config_file, {self.script_path: time.time()})
+        get_json_store(_get_script_access_time_file()).update(
+            {self.script_path: time.time()}
+        )
 
 
 def get_script_variables(script: Script) -> Dict[str, str]:
@@ -1729,6 +1784,11 @@ def find_script(patt: str) -> Optional[str]:
 
     # Fuzzy search
     logging.debug(f"fuzzy search by: {patt}")
+    if not glob.has_magic(patt):
+        from _scriptindex import get_script_path_index
+
+        return get_script_path_index().find(patt)
+
     for d in get_script_directories():
         path = os.path.join(d.path, "**", patt)
 
@@ -2012,83 +2072,72 @@ def _get_script_access_time_file() -> str:
     return os.path.join(get_data_dir(), "script_access_time.json")
 
 
-_script_access_time_file_mtime = 0.0
-_cached_script_access_time: Dict[str, float] = {}
+def get_all_script_access_time() -> Dict[str, float]:
+    return get_json_store(_get_script_access_time_file()).load()
 
 
-def get_all_script_access_time() -> Dict[str, float]:
-    global _script_access_time_file_mtime
-    global _cached_script_access_time
+script_dir_config_file = ".scriptdirconfig.json"
 
-    config_file = _get_script_access_time_file()
-    if not os.path.exists(config_file):
-        return {}
 
-    mtime = os.path.getmtime(config_file)
-    if mtime > _script_access_time_file_mtime:
-        _script_access_time_file_mtime = mtime
-        _cached_script_access_time = load_json(config_file, default={})
+def get_default_script_dir_config():
+    return {"includeExts": ""}
 
-    return _cached_script_access_time
 
+def _should_ignore_script_dir(dir: str, file: str) -> bool:
+    if (
+        file == "tmp"
+        or file == "generated"
+        or file == ".config"
+        or file == ".venv"
+        or file == "node_modules"
+        or file == "build"
+    ):
+        return True
 
-script_dir_config_file = ".scriptdirconfig.json"
+    # Ignore folder starting with `_`
+    if file.startswith("_"):
+        return True
 
+    # Ignore folder if `<folder>.ignore` exists
+    if os.path.exists(os.path.join(dir, file + ".ignore")):
+        return True
 
-def get_default_script_dir_config():
-    return {"includeExts": ""}
+    return False
 
 
-def _get_scripts_recursive(
-    directory: ScriptDirectory, include_exts=[]
-) -> Iterator[str]:
+def _is_script_file(file: str, directory: ScriptDirectory, include_exts) -> bool:
+    if directory.glob:
+        return fnmatch(file, directory.glob)
+
+    # Filter by script extensions
+    ext = os.path.splitext(file)[1].lower()
+    return (
+        ext in SCRIPT_EXTENSIONS
+        or ext in include_exts
+        or ext in BINARY_EXTENSIONS
+        or file.endswith(".excalidraw.png")
+    )
+
+
+def get_script_dir_include_exts(directory: ScriptDirectory) -> List[str]:
     dir_config = load_json(
         os.path.join(directory.path, script_dir_config_file),
         default=get_default_script_dir_config(),
     )
-    include_exts += dir_config["includeExts"].split()
-
-    def should_ignore(dir: str, file: str):
-        if (
-            file == "tmp"
-            or file == "generated"
-            or file == ".config"
-            or file == ".venv"
-            or file == "node_modules"
-            or file == "build"
-        ):
-            return True
-
-        # Ignore folder starting with `_`
-        if file.startswith("_"):
-            return True
+    return dir_config["includeExts"].split()
 
-        # Ignore folder if `<folder>.ignore` exists
-        if os.path.exists(os.path.join(dir, file + ".ignore")):
-            return True
 
-        return False
+def _get_scripts_recursive(
+    directory: ScriptDirectory, include_exts=[]
+) -> Iterator[str]:
+    include_exts += get_script_dir_include_exts(directory)
 
     for root, dirs, files in os.walk(directory.path, topdown=True):
-        dirs[:] = [d for d in dirs if not should_ignore(root, d)]
+        dirs[:] = [d for d in dirs if not _should_ignore_script_dir(root, d)]
 
         for file in files:
-            ext = os.path.splitext(file)[1].lower()
-
-            if directory.glob:
-                if not fnmatch(file, directory.glob):
-                    continue
-            else:
-                # Filter by script extensions
-                if (
-                    ext not in SCRIPT_EXTENSIONS
-                    and ext not in include_exts
-                    and ext not in BINARY_EXTENSIONS
-                    and not file.endswith(".excalidraw.png")
-                ):
-                    continue
-
-            yield os.path.join(root, file)
+            if _is_script_file(file, directory, include_exts):
+                yield os.path.join(root, file)
 
 
 def get_all_scripts() -> Iterator[str]:
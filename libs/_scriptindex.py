@@ -0,0 +1,381 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from _script import (
+    SCRIPT_EXTENSIONS,
+    Script,
+    _is_script_file,
+    _should_ignore_script_dir,
+    get_default_script_config,
+    get_script_dir_include_exts,
+)
+from utils.script.path import (
+    ScriptDirectory,
+    get_data_dir,
+    get_default_script_config_path,
+    get_script_config_file_path,
+    get_script_directories,
+)
+
+_INDEX_VERSION = 1
+
+# Directories modified within this period are rescanned on the next refresh, as
+# a change made in the same mtime tick as the scan would be missed otherwise.
+_RACY_MTIME_SECS = 2.0
+
+# The script directories are checked for changes at most once in this period,
+# unless a script is not found in the index.
+_PATH_INDEX_CHECK_INTERVAL_SECS = 5.0
+
+
+def get_script_index_file() -> str:
+    return os.path.join(get_data_dir(), "script_index.json")
+
+
+def _get_default_config_hash() -> str:
+    return hashlib.md5(
+        json.dumps(get_default_script_config(), sort_keys=True).encode("utf-8")
+    ).hexdigest()
+
+
+def _get_mtime(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except FileNotFoundError:
+        return 0.0
+
+
+class ScriptIndex:
+    """
+    On-disk catalog of all scripts.
+
+    For each directory, the index remembers its mtime and its entries so that
+    unchanged directories are not listed again. For each script, it remembers
+    the combined mtime of the script and its config files along with the parsed
+    config and the variable names, so that unchanged scripts can be created
+    without reading any file.
+    """
+
+    def __init__(self, index_file: Optional[str] = None):
+        self.index_file = index_file if index_file else get_script_index_file()
+
+        self.__dirs: Dict[str, Dict[str, Any]] = {}
+        self.__scripts: Dict[str, Dict[str, Any]] = {}
+        self.__loaded = False
+        self.__modified = False
+
+    def load(self):
+        self.__loaded = True
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return
+
+        if (
+            data.get("version") != _INDEX_VERSION
+            or data.get("defaultConfigHash") != _get_default_config_hash()
+        ):
+            logging.debug("Script index is outdated, ignore: %s" % self.index_file)
+            return
+
+        self.__dirs = data["dirs"]
+        self.__scripts = data["scripts"]
+
+    def save(self):
+        if not self.__modified:
+            return
+
+        data = {
+            "version": _INDEX_VERSION,
+            "defaultConfigHash": _get_default_config_hash(),
+            "dirs": self.__dirs,
+            "scripts": self.__scripts,
+        }
+        os.makedirs(os.path.dirname(self.index_file), exist_ok=True)
+        tmp_file = "%s.%d.tmp" % (self.index_file, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_file, self.index_file)
+        self.__modified = False
+
+    def __scan_dir(
+        self, path: str, scan_time: float, visited_dirs: Dict[str, Dict[str, Any]]
+    ) -> Optional[Dict[str, Any]]:
+        try:
+            mtime = os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+        entry = self.__dirs.get(path)
+        if entry is None or entry["mtime"] != mtime:
+            logging.debug("Scan script directory: %s" % path)
+            files: List[str] = []
+            dirs: List[str] = []
+            for dir_entry in os.scandir(path):
+                if dir_entry.is_dir():
+                    # Same as `os.walk()`, do not follow symbolic links.
+                    if not dir_entry.is_symlink() and not _should_ignore_script_dir(
+                        path, dir_entry.name
+                    ):
+                        dirs.append(dir_entry.name)
+                else:
+                    files.append(dir_entry.name)
+
+            entry = {
+                # Do not trust the mtime if the directory was just modified.
+                "mtime": mtime if scan_time - mtime > _RACY_MTIME_SECS else 0.0,
+                "files": sorted(files),
+                "dirs": sorted(dirs),
+            }
+            self.__modified = True
+
+        visited_dirs[path] = entry
+        return entry
+
+    def __iter_directory(
+        self,
+        directory: ScriptDirectory,
+        scan_time: float,
+        visited_dirs: Dict[str, Dict[str, Any]],
+    ) -> Iterator[Tuple[str, float]]:
+        include_exts = get_script_dir_include_exts(directory)
+
+        pending = [directory.path]
+        while pending:
+            root = pending.pop()
+            entry = self.__scan_dir(root, scan_time, visited_dirs)
+            if entry is None:
+                continue
+
+            files = set(entry["files"])
+            default_config_mtime: Optional[float] = None
+
+            for file in entry["files"]:
+                # Hide files starting with '_'
+                if file.startswith("_"):
+                    continue
+                if not _is_script_file(file, directory, include_exts):
+                    continue
+
+                script_path = os.path.join(root, file)
+                mtime = _get_mtime(script_path)
+                if mtime == 0.0:  # file has been removed
+                    continue
+
+                config_file = get_script_config_file_path(script_path)
+                if os.path.basename(config_file) in files:
+                    mtime = max(mtime, _get_mtime(config_file))
+
+                # The default config file is shared by the scripts in the same
+                # directory.
+                if default_config_mtime is None:
+                    default_config_file = get_default_script_config_path(script_path)
+                    default_config_mtime = (
+                        _get_mtime(default_config_file)
+                        if os.path.basename(default_config_file) in files
+                        else 0.0
+                    )
+
+                yield script_path, max(mtime, default_config_mtime)
+
+            pending.extend(os.path.join(root, d) for d in reversed(entry["dirs"]))
+
+    def scan(self) -> Iterator[Tuple[str, float]]:
+        """
+        Enumerate all scripts along with their combined mtime, only listing the
+        directories that have changed since the last scan.
+        """
+        if not self.__loaded:
+            self.load()
+
+        scan_time = time.time()
+        visited_dirs: Dict[str, Dict[str, Any]] = {}
+        for directory in get_script_directories():
+            yield from self.__iter_directory(directory, scan_time, visited_dirs)
+
+        # Forget about the directories that no longer exist.
+        if len(visited_dirs) != len(self.__dirs):
+            self.__modified = True
+        self.__dirs = visited_dirs
+
+    def get_script(
+        self, script_path: str, mtime: float, name: Optional[str] = None
+    ) -> Script:
+        """
+        Create a script, reusing the indexed config if the script is unchanged.
+        """
+        entry = self.__scripts.get(script_path)
+        if entry is not None and entry["mtime"] == mtime:
+            return Script(
+                script_path,
+                name=name,
+                mtime=mtime,
+                cfg=dict(entry["cfg"]),
+                variable_names=entry["variableNames"],
+            )
+        else:
+            return Script(script_path, name=name, mtime=mtime)
+
+    def update_script(self, script: Script, mtime: float):
+        # Same as directories, do not index a script that was just modified.
+        if time.time() - mtime <= _RACY_MTIME_SECS:
+            if self.__scripts.pop(script.script_path, None) is not None:
+                self.__modified = True
+            return
+
+        entry = self.__scripts.get(script.script_path)
+        variable_names = script.get_cached_variable_names()
+        if (
+            entry is None
+            or entry["mtime"] != mtime
+            or entry["variableNames"] != variable_names
+        ):
+            self.__scripts[script.script_path] = {
+                "mtime": mtime,
+                "cfg": script.cfg,
+                "variableNames": variable_names,
+            }
+            self.__modified = True
+
+    def remove_scripts_except(self, script_paths):
+        deleted = [path for path in self.__scripts if path not in script_paths]
+        for path in deleted:
+            del self.__scripts[path]
+        if deleted:
+            self.__modified = True
+
+
+class ScriptPathIndex:
+    """
+    In-memory index of the script files under each script directory, keyed by
+    every path suffix of the files, e.g. "a/b.py" and "b.py" for "<dir>/a/b.py",
+    which are the paths that `find_script()` can be given.
+
+    The index is rebuilt once any of the directories has been modified. As that
+    takes a stat of every directory, it is only checked periodically, when a
+    script cannot be found, or after `invalidate()`.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__last_check_time = 0.0
+        self.__dir_mtimes: Dict[str, float] = {}
+        self.__roots: List[str] = []
+        self.__paths: List[Dict[str, List[str]]] = []
+
+    def invalidate(self):
+        """
+        Check the directories on the next lookup, e.g. after a script directory
+        watcher has reported added or removed files.
+        """
+        with self.__lock:
+            self.__last_check_time = 0.0
+
+    def __is_outdated(self, roots: List[str]) -> bool:
+        self.__last_check_time = time.time()
+        if roots != self.__roots:
+            return True
+        for path, mtime in self.__dir_mtimes.items():
+            if _get_mtime(path) != mtime:
+                return True
+        return False
+
+    def __build(self, roots: List[str]):
+        logging.debug("Build script path index")
+        build_time = time.time()
+        self.__dir_mtimes.clear()
+        self.__roots = roots
+        self.__paths = []
+        for root in roots:
+            paths: Dict[str, List[str]] = {}
+            # Directories along with their path relative to the root.
+            pending: List[Tuple[str, str]] = [(root, "")]
+            visited_dirs: Set[Tuple[int, int]] = set()
+            while pending:
+                dir, rel_dir = pending.pop()
+                try:
+                    st = os.stat(dir)
+                    dir_entries = list(os.scandir(dir))
+                except (FileNotFoundError, NotADirectoryError):
+                    continue
+
+                # Symbolic links may form a cycle.
+                if (st.st_dev, st.st_ino) in visited_dirs:
+                    continue
+                visited_dirs.add((st.st_dev, st.st_ino))
+
+                # Do not trust the mtime if the directory was just modified.
+                self.__dir_mtimes[dir] = (
+                    st.st_mtime if build_time - st.st_mtime > _RACY_MTIME_SECS else 0.0
+                )
+
+                for dir_entry in dir_entries:
+                    # Same as `glob()`, skip hidden files and directories but
+                    # follow symbolic links.
+                    name = dir_entry.name
+                    if name.startswith("."):
+                        continue
+                    if dir_entry.is_dir():
+                        pending.append((dir_entry.path, rel_dir + name + os.sep))
+                    elif os.path.splitext(name)[1] in SCRIPT_EXTENSIONS:
+                        # Index the file by all suffixes of its relative path.
+                        rel_path = os.path.normcase(rel_dir + name)
+                        i = 0
+                        while i >= 0:
+                            paths.setdefault(rel_path[i:], []).append(dir_entry.path)
+                            i = rel_path.find(os.sep, i)
+                            if i >= 0:
+                                i += 1
+            self.__paths.append(paths)
+
+    def find(self, patt: str) -> Optional[str]:
+        """
+        Find the script whose path ends with `patt` in the first script directory
+        that contains any. Raise an error if there are multiple such scripts.
+        """
+        key = os.path.normcase(os.path.normpath(patt))
+        roots = [d.path for d in get_script_directories()]
+        with self.__lock:
+            checked = False
+            if (
+                roots != self.__roots
+                or time.time() - self.__last_check_time
+                > _PATH_INDEX_CHECK_INTERVAL_SECS
+            ):
+                checked = True
+                if self.__is_outdated(roots):
+                    self.__build(roots)
+
+            path = self.__find(key)
+
+            # The script may have just been added or removed.
+            if not checked and (path is None or not os.path.exists(path)):
+                if self.__is_outdated(roots):
+                    self.__build(roots)
+                    path = self.__find(key)
+
+            return path
+
+    def __find(self, key: str) -> Optional[str]:
+        for paths in self.__paths:
+            match = paths.get(key)
+            if match is None:
+                continue
+            elif len(match) == 1:
+                return match[0]
+            else:
+                raise RuntimeError("Found multiple scripts: %s" % str(match))
+        return None
+
+
+_script_path_index = ScriptPathIndex()
+
+
+def get_script_path_index() -> ScriptPathIndex:
+    return _script_path_index
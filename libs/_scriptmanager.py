@@ -6,24 +6,35 @@ import re
 import shutil
 import subprocess
 import sys
+import threading
 import time
 from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 from _script import (
     Script,
+    _should_ignore_script_dir,
     execute_script_autorun,
     get_all_script_access_time,
-    get_all_scripts,
 )
+from _scriptindex import ScriptIndex, get_script_path_index
 from _shutil import (
     get_ahk_exe,
     get_selected_files,
     pause,
     refresh_env_vars,
 )
-from utils.jsonutil import load_json, save_json
+from utils.fswatch import watch_directory
+from utils.jsonstore import get_json_store
+from utils.jsonutil import save_json
+from utils.patternset import PatternSet
 from utils.process import start_process
-from utils.script.path import get_data_dir, get_my_script_root, get_script_history_file
+from utils.script.path import (
+    get_data_dir,
+    get_default_script_config_path,
+    get_my_script_root,
+    get_script_directories,
+    get_script_history_file,
+)
 from utils.template import render_template_file
 from utils.term import clear_terminal
 
@@ -72,7 +83,7 @@ def register_global_hotkeys_sxhkd(scripts: List[Script]):
             s += "{}\n".format(hotkey_def)
             s += (
                 "  python3"
-                f" {get_my_script_root()}/bin/start_script.py"
+                f" {get_my_script_root()}/bin/start_script_client.py"
                 " --restart-instance=auto"
                 f" {script.script_path}\n\n"
             )
@@ -119,7 +130,7 @@ def register_global_hotkeys_sway(scripts: List[Script]):
                     hotkey_chain_arr[0],
                     "exec",
                     "python3",
-                    f"{get_my_script_root()}/bin/start_script.py",
+                    f"{get_my_script_root()}/bin/start_script_client.py",
                     "--restart-instance=auto",
                     script.script_path,
                 ]
@@ -312,7 +323,7 @@ def register_global_hotkeys_mac(scripts: List[Script]):
             s += "{} : ".format(hotkey_def)
             s += (
                 "python3"
-                f" {get_my_script_root()}/bin/start_script.py"
+                f" {get_my_script_root()}/bin/start_script_client.py"
                 " --restart-instance=auto"
                 f" {script.script_path}\n\n"
             )
@@ -337,16 +348,24 @@ def _get_next_scheduled_script_run_time_file():
 
 class ScriptManager:
     def __init__(self, start_daemon=True, startup=False):
-        self.next_scheduled_script_run_time: Dict[str, float] = load_json(
-            _get_next_scheduled_script_run_time_file(), default={}
+        self.__next_scheduled_script_run_time_store = get_json_store(
+            _get_next_scheduled_script_run_time_file()
+        )
+        self.next_scheduled_script_run_time: Dict[str, float] = (
+            self.__next_scheduled_script_run_time_store.load()
         )
         self.start_daemon = start_daemon
         self.scripts_autorun: List[Script] = []
         self.scripts: List[Script] = []
         self.startup = startup
 
-        self.__match_scripts: List[Tuple[re.Pattern, Script]] = []
+        self.__clipboard_matcher: Optional[PatternSet[Script]] = None
         self.__scheduled_script: List[Script] = []
+        self.__script_index = ScriptIndex()
+
+        self.__changed_files: Set[Tuple[str, str]] = set()
+        self.__changed_files_lock = threading.Lock()
+        self.__watch_stop_event: Optional[threading.Event] = None
 
     def update_script_access_time(self):
         access_time = get_all_script_access_time()
@@ -357,6 +376,13 @@ class ScriptManager:
                     access_time[script.script_path],
                 )
 
+    def get_script_by_path(self, script_path: str) -> Optional[Script]:
+        script_path = os.path.normcase(os.path.abspath(script_path))
+        for script in self.scripts:
+            if os.path.normcase(script.script_path) == script_path:
+                return script
+        return None
+
     def sort_scripts(self):
         self.update_script_access_time()
         self.scripts[:] = sorted(
@@ -377,7 +403,7 @@ class ScriptManager:
         self.__scheduled_script.clear()
 
         any_script_reloaded = False
-        for i, file in enumerate(get_all_scripts()):
+        for i, (file, mtime) in enumerate(self.__script_index.scan()):
             if i % 20 == 0:
                 if on_progress is not None:
                     on_progress(i)
@@ -385,35 +411,26 @@ class ScriptManager:
             existing_scripts.add(file)
             if file in script_dict:
                 script = script_dict[file]
-                reloaded = script.refresh_script()
+                reloaded = script.refresh_script(mtime=mtime)
             else:
-                script = Script(file)
+                script = self.__script_index.get_script(file, mtime=mtime)
                 self.scripts.append(script)
                 reloaded = True
+            self.__script_index.update_script(script, mtime=mtime)
 
             if script.cfg["runEveryNSec"] or script.cfg["runAtTime"]:
                 self.__scheduled_script.append(script)
 
             if reloaded:
                 any_script_reloaded = True
-                should_run_script = False
-                if script.cfg["autoRun"] and script.is_supported():
-                    self.scripts_autorun.append(script)
-                    if autorun:
-                        should_run_script = True
-
-                if script.cfg["runAtStartup"] and self.startup:
-                    logging.info("runAtStartup: %s" % script.name)
-                    should_run_script = True
-
-                # Check if auto run script
-                if should_run_script:
-                    execute_script_autorun(script)
+                self.__on_script_reloaded(script, autorun=autorun)
 
         # Remove deleted scripts
         self.scripts[:] = [
             script for script in self.scripts if script.script_path in existing_scripts
         ]
+        self.__script_index.remove_scripts_except(existing_scripts)
+        self.__script_index.save()
 
         # Sort
         self.scripts.sort()
@@ -423,26 +440,175 @@ class ScriptManager:
 
         return any_script_reloaded
 
-    def update_clipboard_script_map(self):
-        self.__match_scripts.clear()
+    def __on_script_reloaded(self, script: Script, autorun: bool):
+        should_run_script = False
+        if script.cfg["autoRun"] and script.is_supported():
+            self.scripts_autorun.append(script)
+            if autorun:
+                should_run_script = True
+
+        if script.cfg["runAtStartup"] and self.startup:
+            logging.info("runAtStartup: %s" % script.name)
+            should_run_script = True
+
+        # Check if auto run script
+        if should_run_script:
+            execute_script_autorun(script)
+
+    def refresh_scripts(self, scripts: List[Script], autorun=True) -> bool:
+        """
+        Only refresh the given scripts, unlike `reload_scripts()` which
+        enumerates all script directories.
+        """
+        any_script_reloaded = False
+        for script in scripts:
+            if not script.refresh_script():
+                continue
+
+            any_script_reloaded = True
+            self.__script_index.update_script(script, mtime=script.mtime)
+
+            if script in self.__scheduled_script:
+                self.__scheduled_script.remove(script)
+            if script.cfg["runEveryNSec"] or script.cfg["runAtTime"]:
+                self.__scheduled_script.append(script)
+
+            if script in self.scripts_autorun:
+                self.scripts_autorun.remove(script)
+            self.__on_script_reloaded(script, autorun=autorun)
+
+        self.__script_index.save()
+        return any_script_reloaded
+
+    def __watch_script_directory(self, path: str, stop_event: threading.Event):
+        try:
+            for action, file in watch_directory(
+                path, stop_event=stop_event, ignore_dir=_should_ignore_script_dir
+            ):
+                with self.__changed_files_lock:
+                    self.__changed_files.add((action, file))
+        except Exception as ex:
+            logging.warning(f"Failed to watch script directory: {path}: {ex}")
+            # Fall back to reload all scripts periodically.
+            stop_event.set()
+
+    def start_watching_scripts(self):
+        if self.__watch_stop_event is not None:
+            return
+
+        self.__watch_stop_event = threading.Event()
+        for d in get_script_directories():
+            threading.Thread(
+                target=self.__watch_script_directory,
+                args=(d.path, self.__watch_stop_event),
+                daemon=True,
+            ).start()
+
+    def stop_watching_scripts(self):
+        if self.__watch_stop_event is not None:
+            self.__watch_stop_event.set()
+            self.__watch_stop_event = None
+
+    def is_watching_scripts(self) -> bool:
+        return (
+            self.__watch_stop_event is not None
+            and not self.__watch_stop_event.is_set()
+        )
+
+    def pop_changed_files(self) -> Set[Tuple[str, str]]:
+        """
+        Return the (action, file) tuples collected by the script directory
+        watchers since the last call.
+        """
+        with self.__changed_files_lock:
+            changed_files = self.__changed_files
+            self.__changed_files = set()
+        return changed_files
+
+    def __get_scripts_to_refresh(
+        self, changed_files: Set[Tuple[str, str]]
+    ) -> Optional[List[Script]]:
+        """
+        Map the changed files to the scripts to refresh. Return None if the
+        script directories need to be rescanned, e.g. a file has been added or
+        removed.
+        """
+        script_dict = {script.script_path: script for script in self.scripts}
+        scripts: Dict[str, Script] = {}
+        for action, file in changed_files:
+            if action != "MODIFIED":
+                return None
+
+            if file in script_dict:
+                scripts[file] = script_dict[file]
+            elif os.path.basename(file) == os.path.basename(
+                get_default_script_config_path(file)
+            ):
+                dir_path = os.path.dirname(file)
+                for script in self.scripts:
+                    if os.path.dirname(script.script_path) == dir_path:
+                        scripts[script.script_path] = script
+            elif file.endswith(".config.json"):
+                name = file[: -len(".config.json")]
+                for script in self.scripts:
+                    if os.path.splitext(script.script_path)[0] == name:
+                        scripts[script.script_path] = script
+
+        return list(scripts.values())
+
+    def update_clipboard_script_map(self) -> PatternSet[Script]:
+        matcher: PatternSet[Script] = PatternSet()
         for script in self.scripts:
             patt = script.cfg["matchClipboard"]
             if patt:
-                self.__match_scripts.append((re.compile(patt), script))
+                try:
+                    matcher.add(patt, script)
+                except re.error as e:
+                    logging.warning(
+                        f'Invalid matchClipboard pattern "{patt}" in {script.name}: {e}'
+                    )
+        self.__clipboard_matcher = matcher
+        return matcher
+
+    def __get_clipboard_matcher(self) -> PatternSet[Script]:
+        matcher = self.__clipboard_matcher
+        if matcher is None:
+            matcher = self.update_clipboard_script_map()
+        return matcher
 
     def match_clipboard(self, s: str) -> Iterator[Script]:
-        for regex, script in self.__match_scripts:
-            if re.search(regex, s):
-                yield script
+        return self.__get_clipboard_matcher().search(s)
+
+    def find_clipboard_matches(self, s: str) -> List[Tuple[Script, re.Match]]:
+        """
+        Return all matches of the matchClipboard patterns of all scripts.
+        """
+        return list(self.__get_clipboard_matcher().finditer(s))
 
     def refresh_all_scripts(
         self,
         on_progress: Optional[Callable[[int], None]] = None,
         on_register_hotkeys: Optional[Callable[[Dict[str, Script]], None]] = None,
+        changed_files: Optional[Set[Tuple[str, str]]] = None,
     ):
         begin_time = time.time()
 
-        if self.reload_scripts(autorun=self.start_daemon, on_progress=on_progress):
+        scripts_to_refresh = (
+            self.__get_scripts_to_refresh(changed_files)
+            if changed_files is not None
+            else None
+        )
+        if scripts_to_refresh is not None:
+            reloaded = self.refresh_scripts(
+                scripts_to_refresh, autorun=self.start_daemon
+            )
+        else:
+            get_script_path_index().invalidate()
+            reloaded = self.reload_scripts(
+                autorun=self.start_daemon, on_progress=on_progress
+            )
+
+        if reloaded:
             # Register hotkeys
             if on_register_hotkeys is not None:
                 hotkeys: Dict[str, Script] = {}
@@ -456,6 +622,8 @@ class ScriptManager:
             if self.start_daemon:
                 register_global_hotkeys(self.scripts)
                 self.update_clipboard_script_map()
+            else:
+                self.__clipboard_matcher = None
 
         self.sort_scripts()
 
@@ -477,7 +645,7 @@ class ScriptManager:
         if not self.start_daemon:
             return
 
-        has_any_script_to_run = False
+        updated_run_time: Dict[str, float] = {}
         now_ts = time.time()
         for script in self.__scheduled_script:
             run_every_n_seconds = script.cfg["runEveryNSec"]
@@ -504,27 +672,28 @@ class ScriptManager:
                         dt += datetime.timedelta(days=1)
                     next_run_ts = dt.timestamp()
                     self.next_scheduled_script_run_time[script.script_path] = next_run_ts
-                    has_any_script_to_run = True
+                    updated_run_time[script.script_path] = next_run_ts
 
                 if now_ts > next_run_ts:
                     should_run = True
                     while now_ts > next_run_ts:
                         next_run_ts += 24 * 3600
                     self.next_scheduled_script_run_time[script.script_path] = next_run_ts
+                    updated_run_time[script.script_path] = next_run_ts
 
             elif run_every_n_seconds:
                 if next_run_ts == 0 or now_ts > next_run_ts:
                     should_run = True
                     next_run_ts = now_ts + int(run_every_n_seconds)
                     self.next_scheduled_script_run_time[script.script_path] = next_run_ts
+                    updated_run_time[script.script_path] = next_run_ts
 
             if should_run:
                 if script.is_running():
                     logging.warning(f"Script is still running, skip scheduled task: {script.name}")
                 else:
                     logging.info(f"Run scheduled task: {script.name}")
-                    has_any_script_to_run = True
                     yield script
 
-        if has_any_script_to_run:
-            save_json(_get_next_scheduled_script_run_time_file(), self.next_scheduled_script_run_time)
+        if updated_run_time:
+            self.__next_scheduled_script_run_time_store.update(updated_run_time)
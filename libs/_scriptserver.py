@@ -1,7 +1,6 @@
 import json
 import logging
 import os
-import re
 import subprocess
 import threading
 from functools import partial
@@ -15,18 +14,17 @@ from utils.script.path import get_data_dir, get_my_script_root
 
 HOST_NAME = "127.0.0.1"
 
+# Scripts started by the clients are executed one at a time.
+_start_script_lock = threading.Lock()
+
 
 def _match_scripts_with_param(
     script_manager: ScriptManager, param: str
 ) -> List[Tuple[Script, str]]:
-    result: List[Tuple[Script, str]] = []
-    for script in script_manager.scripts:
-        patt = script.cfg["matchClipboard"]
-        assert isinstance(patt, str)
-        if patt:
-            for match in re.finditer(patt, param):
-                result.append((script, match.group(0)))
-    return result
+    return [
+        (script, match.group(0))
+        for script, match in script_manager.find_clipboard_matches(param)
+    ]
 
 
 class MyHTTPRequestHandler(BaseHTTPRequestHandler):
@@ -93,7 +91,48 @@ class MyHTTPRequestHandler(BaseHTTPRequestHandler):
 
     def do_POST(self):
         try:
-            if self.path == "/system":
+            if self.path == "/start-script":
+                req = self._get_req_data()
+                known_script = self.__script_manager.get_script_by_path(req["file"])
+                if known_script is None:
+                    # Let the client fall back to start_script.py
+                    self.send_error(404, f"Script not found: {req['file']}")
+                    return
+
+                # The scripts of the script manager are owned by the UI thread,
+                # so start a new instance, same as start_script.py would.
+                script = Script(known_script.script_path, name=known_script.name)
+
+                # Scripts that run in the foreground would be attached to the
+                # terminal of this process, which is not what the client wants.
+                cfg = script.load_config()
+                if not cfg["newWindow"] and not cfg["background"]:
+                    self.send_error(409, f"Script runs in foreground: {script.name}")
+                    return
+
+                # Menus asking for input would be drawn on the terminal of this
+                # process from the server thread.
+                args = req.get("args", [])
+                if script.needs_user_input(args):
+                    self.send_error(409, f"Script asks for input: {script.name}")
+                    return
+
+                # Respond before the script is started so that the client can
+                # exit immediately.
+                self.send_response(200)
+                self.end_headers()
+                self.wfile.flush()
+
+                logging.info("start script: %s" % script.script_path)
+                with _start_script_lock:
+                    if not script.execute(
+                        args=args,
+                        cd=req.get("cd", True),
+                        restart_instance=req.get("restartInstance", True),
+                    ):
+                        logging.warning(f"Failed to start script: {script.name}")
+
+            elif self.path == "/system":
                 data = self._get_req_data()
                 out = subprocess.check_output(
                     args=data["args"], universal_newlines=True, encoding="utf-8"
@@ -22,7 +22,7 @@ from pathlib import Path
 from time import sleep
 from typing import Dict, List, Optional, Union
 
-from utils.jsonutil import load_json, save_json
+from utils.jsonutil import load_json, save_json, update_json
 from utils.printc import printc
 
 logger = logging.getLogger(__name__)
@@ -1149,15 +1149,6 @@ def wait_for_new_file(file_pattern, allow_exists=False):
                         time.sleep(0.1)
 
 
-def update_json(file, dict_):
-    dir = os.path.dirname(file)
-    if dir:
-        os.makedirs(dir, exist_ok=True)
-    data = load_json(file, default={})
-    data.update(dict_)
-    save_json(file, data)
-
-
 def screen_record(out_file, rect=None, mouse_cursor=True):
     args = [
         "ffmpeg",
@@ -2,13 +2,28 @@ import datetime
 import glob
 import logging
 import os
+import queue
 import re
 import subprocess
 import sys
 import threading
 import time
-from collections import namedtuple
-from typing import Optional
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Set,
+    TextIO,
+    Tuple,
+    Union,
+)
 
 from _shutil import (
     call2,
@@ -23,6 +38,84 @@ from _shutil import (
 
 logger = logging.getLogger(__name__)
 
+# The device that the adb commands run by each thread are sent to, see
+# `use_device()`. If it is not set, adb picks the device, e.g. ANDROID_SERIAL.
+_device = threading.local()
+
+
+def get_current_device() -> Optional[str]:
+    return getattr(_device, "serial", None)
+
+
+@contextmanager
+def use_device(serial: Optional[str]):
+    """
+    Send the adb commands run by the current thread inside the block to the
+    device with the serial number.
+    """
+    prev_serial = get_current_device()
+    _device.serial = serial
+    try:
+        yield
+    finally:
+        _device.serial = prev_serial
+
+
+def _get_output() -> Optional[TextIO]:
+    return getattr(_device, "output", None)
+
+
+def _get_output_args() -> Dict[str, Any]:
+    """
+    Return the subprocess arguments that send the output of a command to the
+    file set for the current thread by `run_on_devices()`, if any.
+    """
+    output = _get_output()
+    return {"stdout": output, "stderr": subprocess.STDOUT} if output else {}
+
+
+class _DeviceOutputHandler(logging.Handler):
+    """
+    Writes the log records of the threads whose output is redirected to their
+    output files.
+    """
+
+    def emit(self, record: logging.LogRecord):
+        output = _get_output()
+        if output is not None:
+            output.write(self.format(record) + "\n")
+            output.flush()
+
+
+@contextmanager
+def _redirect_device_output():
+    """
+    Inside the block, the log records of the threads whose output is redirected
+    go to their output files instead of the existing handlers, e.g. the console.
+    """
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+
+    def output_filter(record: logging.LogRecord) -> bool:
+        return _get_output() is None
+
+    for h in handlers:
+        h.addFilter(output_filter)
+    handler = _DeviceOutputHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname).1s %(message)s"))
+    root.addHandler(handler)
+    try:
+        yield
+    finally:
+        root.removeHandler(handler)
+        for h in handlers:
+            h.removeFilter(output_filter)
+
+
+def _adb() -> List[str]:
+    serial = get_current_device()
+    return ["adb", "-s", serial] if serial else ["adb"]
+
 
 ANDROID_SDK_INSTALL_DIR = os.path.join(
     os.path.expandvars("%LOCALAPPDATA%"), "Android", "Sdk"
@@ -30,10 +123,10 @@ ANDROID_SDK_INSTALL_DIR = os.path.join(
 
 
 def reset_debug_sysprops():
-    subprocess.check_call(["adb", "root"])
+    subprocess.check_call([*_adb(), "root"])
     try:
         lines = subprocess.check_output(
-            ["adb", "shell", "getprop -Z | grep :debug_oculus_prop:"],
+            [*_adb(), "shell", "getprop -Z | grep :debug_oculus_prop:"],
             universal_newlines=True,
         ).splitlines()
 
@@ -50,18 +143,22 @@ def reset_debug_sysprops():
 
 def wake_up_device():
     out = subprocess.check_output(
-        ["adb", "shell", "dumpsys power | grep 'mWakefulness='"],
+        [*_adb(), "shell", "dumpsys power | grep 'mWakefulness='"],
         universal_newlines=True,
+        stderr=_get_output(),
     )
     if "Asleep" in out:
         logging.info("Device is asleep, wake up by press power button.")
-        subprocess.check_call(["adb", "shell", "input", "keyevent", "26"])  # power key
+        subprocess.check_call(
+            [*_adb(), "shell", "input", "keyevent", "26"], **_get_output_args()
+        )  # power key
 
 
 def get_main_activity(pkg):
     out = subprocess.check_output(
-        ["adb", "shell", f"dumpsys package | grep -i {pkg}/ | grep Activity"],
+        [*_adb(), "shell", f"dumpsys package | grep -i {pkg}/ | grep Activity"],
         universal_newlines=True,
+        stderr=_get_output(),
     )
     lines = out.strip().splitlines()
     line = lines[0].strip()
@@ -75,7 +172,7 @@ def start_app(pkg, use_monkey=False, wake_up=True):
 
     if use_monkey:
         args = [
-            "adb",
+            *_adb(),
             "shell",
             "monkey",
             "-p",
@@ -97,9 +194,11 @@ def start_app(pkg, use_monkey=False, wake_up=True):
             )
     else:
         pkg_activity = get_main_activity(pkg)
-        args = ["adb", "shell", "am", "start", "-n", pkg_activity]
+        args = [*_adb(), "shell", "am", "start", "-n", pkg_activity]
         logger.info("shell_cmd: %s" % " ".join(args))
-        out = subprocess.check_output(args, universal_newlines=True)
+        out = subprocess.check_output(
+            args, universal_newlines=True, stderr=_get_output()
+        )
         logger.debug(out)
 
 
@@ -109,21 +208,21 @@ def clear_logcat():
     # Retry on error
     while True:
         try:
-            subprocess.check_call(["adb", "logcat", "-c"])
+            subprocess.check_call([*_adb(), "logcat", "-c"])
             break
         except subprocess.CalledProcessError:
             logger.debug("WARNING: clear logcat failed. Retrying")
 
 
 def kill_app(pkg):
-    args = ["adb", "shell", "am", "force-stop", pkg]
+    args = [*_adb(), "shell", "am", "force-stop", pkg]
     call_echo(args)
 
 
 def restart_app(pkg, use_monkey=False, wake_up=True):
     logger.info("Stop app: " + pkg)
-    args = ["adb", "shell", "am", "force-stop", pkg]
-    call2(args)
+    args = [*_adb(), "shell", "am", "force-stop", pkg]
+    call2(args, **_get_output_args())
 
     start_app(pkg, use_monkey=use_monkey, wake_up=wake_up)
 
@@ -131,8 +230,217 @@ def restart_app(pkg, use_monkey=False, wake_up=True):
 def restart_current_app():
     pkg, activity = get_active_pkg_and_activity()
 
-    call2(["adb", "shell", "am", "force-stop", pkg])
-    call2(["adb", "shell", "am", "start", "-n", "%s/%s" % (pkg, activity)])
+    call2([*_adb(), "shell", "am", "force-stop", pkg])
+    call2([*_adb(), "shell", "am", "start", "-n", "%s/%s" % (pkg, activity)])
+
+
+def _get_process_names() -> Dict[int, str]:
+    """
+    Return the command line of every process on the device, from a single `ps`
+    snapshot.
+    """
+    out = subprocess.check_output(
+        [*_adb(), "shell", "ps -A -o PID,CMDLINE 2>/dev/null || ps"],
+        universal_newlines=True,
+        stderr=subprocess.DEVNULL,
+    )
+    return _parse_process_names(out)
+
+
+def _parse_process_names(ps_output: str) -> Dict[int, str]:
+    lines = ps_output.splitlines()
+    if not lines:
+        return {}
+
+    proc_names = {}
+    header = lines[0].split()
+    if header == ["PID", "CMDLINE"]:
+        for line in lines[1:]:
+            cols = line.split(None, 1)
+            if len(cols) == 2 and cols[0].isdigit():
+                proc_names[int(cols[0])] = cols[1]
+    else:
+        # The legacy toolbox `ps` prints "USER PID PPID ... NAME", where the
+        # rows have an unlabeled state column before the name, e.g.
+        # "root 1 0 8908 632 c0163d18 0000e46c S /init".
+        pid_col = header.index("PID")
+        for line in lines[1:]:
+            cols = line.split()
+            if len(cols) > pid_col + 1 and cols[pid_col].isdigit():
+                proc_names[int(cols[pid_col])] = cols[-1]
+    return proc_names
+
+
+class _ProcessNameResolver:
+    """
+    Maps pids to process names. Unknown pids are looked up in batches by taking
+    a new `ps` snapshot in a background thread, instead of running one adb
+    command for each pid, so that reading the log is never blocked by adb.
+    """
+
+    def __init__(self):
+        self.__proc_names: Dict[int, Optional[str]] = {}
+        self.__lock = threading.Lock()
+
+        # The snapshots are taken on another thread.
+        self.__serial = get_current_device()
+
+        # Pids to look up in the next snapshot.
+        self.__pending_pids: Set[int] = set()
+        self.__refreshing = False
+
+        # Take the first snapshot while the first lines are being read.
+        with self.__lock:
+            self.__start_refresh()
+
+    def __start_refresh(self):
+        if not self.__refreshing:
+            self.__refreshing = True
+            threading.Thread(target=self.__refresh, daemon=True).start()
+
+    def __refresh(self):
+        while True:
+            with self.__lock:
+                pids = self.__pending_pids
+                self.__pending_pids = set()
+
+            proc_names: Dict[int, str] = {}
+            try:
+                with use_device(self.__serial):
+                    proc_names = _get_process_names()
+            except (subprocess.CalledProcessError, ValueError) as ex:
+                logger.warning("Failed to list processes: %s" % ex)
+
+            with self.__lock:
+                self.__proc_names.update(proc_names)
+                # The process has exited before the snapshot was taken.
+                for pid in pids:
+                    self.__proc_names.setdefault(pid, None)
+
+                # Take another snapshot for the pids seen in the meantime.
+                self.__pending_pids.difference_update(proc_names)
+                if not self.__pending_pids:
+                    self.__refreshing = False
+                    return
+
+    def is_resolved(self, pid: int) -> bool:
+        """
+        Return whether the name of the process is known. If not, it is looked
+        up in the background and can be read with `get()` later.
+        """
+        if pid in self.__proc_names:
+            return True
+
+        with self.__lock:
+            if pid in self.__proc_names:
+                return True
+            self.__pending_pids.add(pid)
+            self.__start_refresh()
+            return False
+
+    def get(self, pid: int) -> Optional[str]:
+        return self.__proc_names.get(pid)
+
+
+def _create_logcat_filter(
+    level: Optional[str], regex: Optional[str], exclude: Optional[str]
+) -> Callable[[str, str], bool]:
+    """
+    Combine the level and message filters into a single function that returns
+    whether a line with the level and the message (tag included) is shown.
+    """
+    if level:
+        level_patt = re.compile(level)
+        levels = frozenset(lvl for lvl in "VDIWEFAS" if level_patt.search(lvl))
+    else:
+        levels = None
+    include = re.compile(regex).search if regex else None
+    exclude_ = re.compile(exclude).search if exclude else None
+
+    if levels is None and include is None and exclude_ is None:
+        return lambda lvl, message: True
+
+    def line_filter(lvl: str, message: str) -> bool:
+        return (
+            (levels is None or lvl in levels)
+            and (include is None or include(message) is not None)
+            and (exclude_ is None or exclude_(message) is None)
+        )
+
+    return line_filter
+
+
+# Number of lines that are buffered while the output falls behind adb.
+_LOGCAT_QUEUE_SIZE = 10000
+
+
+def _read_logcat_lines(args: List[str]) -> Generator[List[str], None, None]:
+    """
+    Read lines from `adb logcat` in a background thread, so that adb is never
+    blocked while lines are being filtered, and yield them in batches. An empty
+    batch is yielded whenever no line arrives for a while.
+
+    The adb process and the thread are stopped when the generator is closed.
+    """
+    q: "queue.Queue[Union[str, BaseException, None]]" = queue.Queue(
+        maxsize=_LOGCAT_QUEUE_SIZE
+    )
+    stopped = threading.Event()
+    ps = subprocess.Popen(args, stdout=subprocess.PIPE)
+
+    def put(item: Union[str, BaseException, None]) -> bool:
+        while not stopped.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read_lines():
+        try:
+            assert ps.stdout is not None
+            for line in ps.stdout:
+                if not put(line.strip().decode(errors="ignore")):
+                    return
+            if ps.wait() != 0:
+                raise subprocess.CalledProcessError(ps.returncode, ps.args)
+            put(None)
+        except BaseException as ex:
+            put(ex)
+
+    thread = threading.Thread(target=read_lines, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            try:
+                # Use a timeout so that the main thread can still be interrupted
+                # on Windows.
+                item = q.get(timeout=0.5)
+            except queue.Empty:
+                yield []
+                continue
+
+            lines: List[str] = []
+            while isinstance(item, str):
+                lines.append(item)
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+            if lines:
+                yield lines
+
+            if item is None:
+                return
+            elif isinstance(item, BaseException):
+                raise item
+    finally:
+        stopped.set()
+        ps.kill()
+        thread.join()
+        ps.wait()
 
 
 def logcat(
@@ -147,122 +455,133 @@ def logcat(
     ignore_duplicates=False,
     show_fatal_error=False,
 ):
-    LOGCAT_PATTERN = re.compile(
-        r"^(\d{2}-\d{2}\s\d{2}:\d{2}:\d{2}\.\d{3})\s+(\d+)\s+(\d+)\s+([A-Z])\s+(.*)$"
-    )
-
     wait_for_device()
-    fnull = open(os.devnull, "w")
 
-    if ignore_duplicates:
-        last_message = None
-        dup_messages = 0
+    last_message: Optional[str] = None
+    dup_messages = 0
 
-    if level:
-        level = re.compile(level)
-    if exclude:
-        exclude = re.compile(exclude)
-    if regex:
-        regex = re.compile(regex)
+    line_filter = _create_logcat_filter(level=level, regex=regex, exclude=exclude)
     if exclude_proc:
         exclude_proc = re.compile(exclude_proc)
 
-    args = ["adb", "logcat"]
+    args = [*_adb(), "logcat"]
 
     if show_log_after_secs is not None:
-        out = subprocess.check_output(["adb", "shell", "date '+%m-%d %H:%M:%S'"])
+        out = subprocess.check_output([*_adb(), "shell", "date '+%m-%d %H:%M:%S'"])
         out_str = out.decode().strip()
         dt_start = datetime.datetime.strptime(out_str, "%m-%d %H:%M:%S")
         dt_start += datetime.timedelta(seconds=show_log_after_secs)
         args += ["-T", dt_start.strftime("%m-%d %H:%M:%S") + ".000"]
 
     if clear:
-        call2(["adb", "logcat", "-c"])
+        call2([*_adb(), "logcat", "-c"])
 
     if highlight is None:
         highlight = {}
 
-    pid_proc_map = {}
+    proc_resolver = _ProcessNameResolver()
     last_proc = None
 
+    # Lines are printed together, which is much faster than one by one.
+    out_lines: List[str] = []
+
+    def flush():
+        if out_lines:
+            print("\n".join(out_lines))
+            out_lines.clear()
+
+    show_fatal_error_pid = None
+
+    # Lines waiting for the names of their processes to be looked up. Later lines
+    # wait behind them, so that lines are still shown in order.
+    pending_lines: Deque[Tuple[str, int, str, str]] = deque()
+
+    def show_line(line: str, pid: int, lvl: str, message: str):
+        nonlocal show_fatal_error_pid, last_proc, last_message, dup_messages
+
+        proc = proc_resolver.get(pid)
+        if show_fatal_error and lvl == "F":
+            if pkg is not None and pkg in line:
+                show_fatal_error_pid = pid
+            if show_fatal_error_pid != pid:
+                return
+        else:
+            # Filter by package
+            if pkg is not None:
+                if proc is None:
+                    return
+                else:
+                    # Filter by process name (include)
+                    if pkg not in proc:
+                        return
+
+                    # Exclude by process name (exclude)
+                    if exclude_proc and re.search(exclude_proc, proc):
+                        return
+
+            if ignore_duplicates:
+                if message == last_message:
+                    flush()
+                    dup_messages += 1
+                    print("\r(%d) " % dup_messages, end="")
+                    return
+
+        # Output process name
+        if last_proc != proc:
+            flush()
+            print2("%s (%d)" % (proc, pid))
+            last_proc = proc
+
+        out_lines.append(line)
+
+        if ignore_duplicates:
+            last_message = message
+            dup_messages = 0
+
+    def show_pending_lines():
+        while pending_lines and proc_resolver.is_resolved(pending_lines[0][1]):
+            show_line(*pending_lines.popleft())
+
     while True:
         show_fatal_error_pid = None
+
         try:
-            for line in read_proc_lines(args):
-                match = re.match(LOGCAT_PATTERN, line)
-                if match is None:
-                    logger.debug(line)
-                    continue
-
-                pid = int(match.group(2))
-                if pid <= 0:
-                    continue
-
-                # Get process name
-                if pid not in pid_proc_map:
-                    try:
-                        proc = subprocess.check_output(
-                            ["adb", "shell", f"cat /proc/{pid}/cmdline"],
-                            universal_newlines=True,
-                            stderr=fnull,
-                        ).strip()
-                    except subprocess.CalledProcessError:
-                        proc = None
-                    pid_proc_map[pid] = proc
-                else:
-                    proc = pid_proc_map[pid]
-
-                lvl = match.group(4)
-                if show_fatal_error and lvl == "F":
-                    if pkg is not None and pkg in line:
-                        show_fatal_error_pid = pid
-                    if show_fatal_error_pid == pid:
-                        pass
-                    else:
-                        continue
-                else:
-                    # Filter by level
-                    if level and not re.search(level, lvl):
-                        continue
-
-                    # Filter by tag or message
-                    message = match.group(5)
-                    if regex and not re.search(regex, message):
-                        continue
-
-                    # Exclude by tag or message
-                    if exclude and re.search(exclude, message):
-                        continue
-
-                    # Filter by package
-                    if pkg is not None:
-                        if proc is None:
+            with closing(_read_logcat_lines(args)) as batches:
+                for lines in batches:
+                    show_pending_lines()
+
+                    for line in lines:
+                        # Lines are in the "threadtime" format:
+                        # "<date> <time> <pid> <tid> <level> <tag>: <message>"
+                        cols = line.split(None, 5)
+                        if (
+                            len(cols) < 6
+                            or not cols[2].isdigit()
+                            or not cols[3].isdigit()
+                            or len(cols[4]) != 1
+                        ):
+                            logger.debug(line)
                             continue
-                        else:
-                            # Filter by process name (include)
-                            if pkg not in proc:
-                                continue
-
-                            # Exclude by process name (exclude)
-                            if exclude_proc and re.search(exclude_proc, proc):
-                                continue
-
-                    if ignore_duplicates:
-                        if message == last_message:
-                            dup_messages += 1
-                            print("\r(%d) " % dup_messages, end="")
+
+                        pid = int(cols[2])
+                        if pid <= 0:
                             continue
 
-                # Output process name
-                if last_proc != proc:
-                    print2("%s (%d)" % (proc, pid))
-                    last_proc = proc
+                        lvl = cols[4]
+                        message = cols[5]
 
-                print(line)
+                        # Filter by level, tag or message before looking up the
+                        # process name.
+                        is_fatal_error = show_fatal_error and lvl == "F"
+                        if not is_fatal_error and not line_filter(lvl, message):
+                            continue
+
+                        if pending_lines or not proc_resolver.is_resolved(pid):
+                            pending_lines.append((line, pid, lvl, message))
+                        else:
+                            show_line(line, pid, lvl, message)
 
-                if ignore_duplicates:
-                    last_message = message
-                    dup_messages = 0
+                    flush()
 
         except Exception as ex:
             print2(ex)
@@ -270,7 +589,9 @@ def logcat(
 
 def get_apk_path(pkg):
     out = subprocess.check_output(
-        ["adb", "shell", "pm", "path", pkg], universal_newlines=True
+        [*_adb(), "shell", "pm", "path", pkg],
+        universal_newlines=True,
+        stderr=_get_output(),
     )
     apk_path = out.splitlines()[0]
     apk_path = apk_path.replace("package:", "")
@@ -295,10 +616,10 @@ def backup_pkg(
         # 'package:/data/app/com.github.uiautomator-1AfatTFmPxzjNwUtT-5h7w==/base.apk'
         apk_path = get_apk_path(pkg)
 
-        subprocess.check_call(["adb", "pull", apk_path, f"{pkg}.apk"], cwd=out_dir)
+        subprocess.check_call([*_adb(), "pull", apk_path, f"{pkg}.apk"], cwd=out_dir)
 
     # Check root permission
-    if subprocess.call(["adb", "shell", "type", "su"]) == 0:
+    if subprocess.call([*_adb(), "shell", "type", "su"]) == 0:
         su = ["su", "-c"]
     else:
         su = []
@@ -306,25 +627,25 @@ def backup_pkg(
     if backup_user_data:
         logging.info("Backup app data")
         subprocess.call(
-            ["adb", "exec-out"]
+            [*_adb(), "exec-out"]
             + su
             + [
                 f"tar -cf /sdcard/{pkg}.tar --exclude='data/data/{pkg}/cache' /data/data/{pkg}"
             ]
         )
-        subprocess.call(["adb", "pull", f"/sdcard/{pkg}.tar"], cwd=out_dir)
-        subprocess.call(["adb", "shell", "rm", f"/sdcard/{pkg}.tar"])
+        subprocess.call([*_adb(), "pull", f"/sdcard/{pkg}.tar"], cwd=out_dir)
+        subprocess.call([*_adb(), "shell", "rm", f"/sdcard/{pkg}.tar"])
 
     if backup_obb:
         logging.info("Backup obb")
-        subprocess.call(["adb", "pull", f"/sdcard/android/obb/{pkg}"], cwd=obb_dir)
+        subprocess.call([*_adb(), "pull", f"/sdcard/android/obb/{pkg}"], cwd=obb_dir)
 
 
 def adb_tar(d, out_tar):
     temp_tar = "/data/local/tmp/backup.tar"
     subprocess.check_call(
         [
-            "adb",
+            *_adb(),
             "exec-out",
             "tar",
             "-cf",
@@ -332,12 +653,12 @@ def adb_tar(d, out_tar):
             d,
         ]
     )
-    subprocess.check_call(["adb", "pull", temp_tar, out_tar])
-    subprocess.check_call(["adb", "shell", "rm", temp_tar])
+    subprocess.check_call([*_adb(), "pull", temp_tar, out_tar])
+    subprocess.check_call([*_adb(), "shell", "rm", temp_tar])
 
 
 def adb_untar(tar_file):
-    subprocess.check_call(["adb", "push", tar_file, "/data/local/tmp/"])
+    subprocess.check_call([*_adb(), "push", tar_file, "/data/local/tmp/"])
     adb_shell(["tar", "-xf", f"/data/local/tmp/{tar_file}"])
 
 
@@ -346,6 +667,10 @@ def screenshot(out_file=None, scale=None):
 
     if out_file is None:
         out_file = datetime.datetime.now().strftime("screencap_%y%m%d%H%M%S.png")
+        serial = get_current_device()
+        if serial:
+            # Avoid overwriting the screenshots taken on other devices.
+            out_file = "%s_%s" % (re.sub(r"[^\w.-]", "_", serial), out_file)
         src_file = os.path.basename(out_file)
     else:
         os.makedirs(os.path.dirname(os.path.abspath(out_file)), exist_ok=True)
@@ -355,13 +680,13 @@ def screenshot(out_file=None, scale=None):
         try:
             logger.info("Taking screenshot")
             subprocess.check_call(
-                ["adb", "shell", "screencap", "-p", "/sdcard/%s" % src_file]
+                [*_adb(), "shell", "screencap", "-p", "/sdcard/%s" % src_file]
             )
-            logger.debug(["adb", "pull", "-a", "/sdcard/%s" % src_file, out_file])
+            logger.debug([*_adb(), "pull", "-a", "/sdcard/%s" % src_file, out_file])
             subprocess.check_call(
-                ["adb", "pull", "-a", "/sdcard/%s" % src_file, out_file]
+                [*_adb(), "pull", "-a", "/sdcard/%s" % src_file, out_file]
             )
-            subprocess.check_call(["adb", "shell", "rm", "/sdcard/%s" % src_file])
+            subprocess.check_call([*_adb(), "shell", "rm", "/sdcard/%s" % src_file])
 
             break
         except subprocess.CalledProcessError as ex:
@@ -376,7 +701,7 @@ def screenshot(out_file=None, scale=None):
 def get_active_pkg_and_activity():
     out = subprocess.check_output(
         [
-            "adb",
+            *_adb(),
             "shell",
             "dumpsys activity activities | grep -E 'mFocusedActivity"
             "|mResumedActivity"
@@ -392,7 +717,7 @@ def get_active_pkg_and_activity():
 
 def get_device_name():
     out = subprocess.check_output(
-        ["adb", "shell", "getprop", "ro.build.fingerprint"]
+        [*_adb(), "shell", "getprop", "ro.build.fingerprint"]
     ).decode()
     model = out.split("/")[1]
     return model
@@ -427,7 +752,7 @@ def get_adk_path():
 
 
 def get_prop(name):
-    return subprocess.check_output(["adb", "shell", "getprop", name]).decode().strip()
+    return subprocess.check_output([*_adb(), "shell", "getprop", name]).decode().strip()
 
 
 def setup_jdk(jdk_version=None, env=None):
@@ -569,9 +894,9 @@ def setup_android_env(
 
 def adb_shell(command, check=True, check_output=False, echo=False, **kwargs):
     if isinstance(command, list):
-        args = ["adb", "shell"] + command
+        args = [*_adb(), "shell"] + command
     else:
-        args = ["adb", "shell", command]
+        args = [*_adb(), "shell", command]
 
     if echo:
         print2("> " + " ".join(args))
@@ -583,7 +908,7 @@ def adb_shell(command, check=True, check_output=False, echo=False, **kwargs):
 
 
 def wait_for_device():
-    subprocess.check_call(["adb", "wait-for-device"])
+    subprocess.check_call([*_adb(), "wait-for-device"])
 
 
 def wait_until_boot_complete():
@@ -592,7 +917,7 @@ def wait_until_boot_complete():
         try:
             if (
                 subprocess.check_output(
-                    ["adb", "shell", "getprop", "sys.boot_completed"],
+                    [*_adb(), "shell", "getprop", "sys.boot_completed"],
                     universal_newlines=True,
                 ).strip()
                 == "1"
@@ -607,27 +932,35 @@ def wait_until_boot_complete():
             time.sleep(2)
 
 
+# Whether `su` is available on each device.
+_super_su: Dict[Optional[str], bool] = {}
+
+
 def adb_shell2(command, check=True, root=True):
-    if root and not hasattr(adb_shell2, "super_su"):
+    serial = get_current_device()
+    if root and serial not in _super_su:
         # Check root permission
-        adb_shell2.super_su = subprocess.call(["adb", "shell", "type", "su"]) == 0
-        if not adb_shell2.super_su:
-            subprocess.check_call(["adb", "root"])
+        _super_su[serial] = (
+            subprocess.call([*_adb(), "shell", "type", "su"], **_get_output_args())
+            == 0
+        )
+        if not _super_su[serial]:
+            subprocess.check_call([*_adb(), "root"], **_get_output_args())
 
     if isinstance(command, list):
         command = " ".join(command)
 
-    args = ["adb", "shell"]
-    if adb_shell2.super_su:
+    args = [*_adb(), "shell"]
+    if _super_su.get(serial):
         args += ["su", "-c", command]
     else:
         args.append(command)
 
-    subprocess.run(args, check=check)
+    subprocess.run(args, check=check, **_get_output_args())
 
 
 def pm_list_packages():
-    s = check_output(["adb", "shell", "pm", "list", "packages"]).decode()
+    s = check_output([*_adb(), "shell", "pm", "list", "packages"]).decode()
     s = s.replace("package:", "")
     lines = s.splitlines()
     lines = sorted(lines)
@@ -648,7 +981,7 @@ def adb_install(
 ) -> AdbInstallResult:
     # Get package name
     out = subprocess.check_output(
-        ["aapt", "dump", "badging", apk], universal_newlines=True
+        ["aapt", "dump", "badging", apk], universal_newlines=True, stderr=_get_output()
     )
     match = re.search(r"package: name='(.+?)'", out)
     if match is None:
@@ -670,8 +1003,9 @@ def adb_install(
             apk_path_device = get_apk_path(pkg_name)
             file_size = int(
                 subprocess.check_output(
-                    ["adb", "shell", "wc -c %s | awk '{print $1}'" % apk_path_device],
+                    [*_adb(), "shell", "wc -c %s | awk '{print $1}'" % apk_path_device],
                     universal_newlines=True,
+                    stderr=_get_output(),
                 )
             )
 
@@ -688,7 +1022,7 @@ def adb_install(
         logger.info("Install %s" % apk)
         try:
             adb_install_cmd = [
-                "adb",
+                *_adb(),
                 "install",
                 "-r",  # Replace existing apps without clearing data
                 "-d",  # Allow downgrade
@@ -706,13 +1040,17 @@ def adb_install(
             if "INSTALL_FAILED_UPDATE_INCOMPATIBLE" in msg:
                 pkg = re.findall("[Pp]ackage ([a-z0-9A-Z.]+)", msg)[0]
                 logging.warning("Uninstalling %s..." % pkg)
-                subprocess.check_call(["adb", "uninstall", pkg])
-                subprocess.check_call(adb_install_cmd + [apk])
+                subprocess.check_call(
+                    [*_adb(), "uninstall", pkg], **_get_output_args()
+                )
+                subprocess.check_call(adb_install_cmd + [apk], **_get_output_args())
             elif "INSTALL_FAILED_CONFLICTING_PROVIDE" in msg:
                 pkg = re.findall("already used by ([a-z0-9A-Z.]+)", msg)[0]
                 logging.warning("Uninstalling %s..." % pkg)
-                subprocess.check_call(["adb", "uninstall", pkg])
-                subprocess.check_call(adb_install_cmd + [apk])
+                subprocess.check_call(
+                    [*_adb(), "uninstall", pkg], **_get_output_args()
+                )
+                subprocess.check_call(adb_install_cmd + [apk], **_get_output_args())
             else:
                 raise ex
 
@@ -722,7 +1060,7 @@ def adb_install(
                 for permission in apk_info.permissions:
                     ret_code = subprocess.call(
                         [
-                            "adb",
+                            *_adb(),
                             "shell",
                             "pm",
                             "grant",
@@ -763,11 +1101,14 @@ def adb_install2(
         pkg = os.path.splitext(os.path.basename(file))[0]
         if os.path.exists(tar_file):
             logger.info("Restoring app data")
-            subprocess.check_call(["adb", "push", tar_file, "/data/local/tmp/"])
+            subprocess.check_call(
+                [*_adb(), "push", tar_file, "/data/local/tmp/"], **_get_output_args()
+            )
             adb_shell2(["tar", "-xf", f"/data/local/tmp/{pkg}.tar"], root=True)
 
             out = check_output(
-                ["adb", "shell", f"dumpsys package {pkg} | grep userId"]
+                [*_adb(), "shell", f"dumpsys package {pkg} | grep userId"],
+                stderr=_get_output(),
             ).strip()
 
             userId = re.findall(r"userId=(\d+)", out)[0]
@@ -787,7 +1128,8 @@ def adb_install2(
         if os.path.isdir(obb_dir):
             logger.info(f"Push obb: {obb_dir} => /sdcard/android/obb/")
             subprocess.check_call(
-                ["adb", "push", "-p", obb_dir, "/sdcard/android/obb/"]
+                [*_adb(), "push", "-p", obb_dir, "/sdcard/android/obb/"],
+                **_get_output_args(),
             )
 
     return result
@@ -809,7 +1151,7 @@ def sample_proc_stat():
     """
     )
 
-    call2(["adb", "pull", "/data/local/tmp/proc_stat.txt"])
+    call2([*_adb(), "pull", "/data/local/tmp/proc_stat.txt"])
 
 
 def get_pkg_name_apk(file):
@@ -841,7 +1183,7 @@ def get_apk_info(file):
 
 def unlock_device(pin):
     out = subprocess.check_output(
-        ["adb", "shell", 'dumpsys power | grep "mWakefulness="'],
+        [*_adb(), "shell", 'dumpsys power | grep "mWakefulness="'],
         universal_newlines=True,
     )
 
@@ -869,8 +1211,9 @@ def is_locked():
 def app_is_installed(pkg_name):
     try:
         subprocess.check_output(
-            ["adb", "shell", "pm", "path", pkg_name],
+            [*_adb(), "shell", "pm", "path", pkg_name],
             universal_newlines=True,
+            stderr=_get_output(),
         )
     except Exception:
         return False
@@ -884,17 +1227,13 @@ def logcat_bg(patt):
         raise Exception("patt must be a string")
 
     patt = re.compile(patt)
+    args = [*_adb(), "logcat"]
 
     def logcat_thread():
         while True:
             print("logcat begin.", end="\r\n")
 
-            for line in read_proc_lines(
-                [
-                    "adb",
-                    "logcat",
-                ]
-            ):
+            for line in read_proc_lines(args):
                 if re.search(patt, line):
                     print2(line, end="\r\n", color="gray")
 
@@ -909,7 +1248,7 @@ def logcat_bg(patt):
 
 def toggle_prop(name, values=("0", "1")):
     cur_val = subprocess.check_output(
-        ["adb", "shell", "getprop", name], universal_newlines=True
+        [*_adb(), "shell", "getprop", name], universal_newlines=True
     ).strip()
 
     # Find next value
@@ -920,7 +1259,7 @@ def toggle_prop(name, values=("0", "1")):
     new_val = values[(i + 1) % len(values)]
 
     logger.debug("setprop %s %s" % (name, new_val))
-    subprocess.check_call(["adb", "shell", "setprop", name, new_val])
+    subprocess.check_call([*_adb(), "shell", "setprop", name, new_val])
 
 
 def run_apk(
@@ -979,6 +1318,103 @@ def find_device_by_product_name_fastboot(product) -> Optional[str]:
     return None
 
 
+def get_device_serials() -> List[str]:
+    """
+    Return the serial numbers of the devices that are online.
+    """
+    out = subprocess.check_output(["adb", "devices"], universal_newlines=True)
+    serials = []
+    for line in out.splitlines()[1:]:
+        cols = line.split("\t")
+        if len(cols) == 2 and cols[1].strip() == "device":
+            serials.append(cols[0])
+    return serials
+
+
+class DeviceResult:
+    def __init__(
+        self,
+        serial: str,
+        result: Any = None,
+        exception: Optional[Exception] = None,
+    ):
+        self.serial = serial
+        self.result = result
+        self.exception = exception
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exception is None
+
+
+def run_on_devices(
+    func: Callable[[], Any],
+    serials: Optional[List[str]] = None,
+    max_workers: int = 32,
+    on_progress: Optional[Callable[[str, str], None]] = None,
+    log_dir: Optional[str] = None,
+) -> Dict[str, DeviceResult]:
+    """
+    Call `func()` for each device at the same time, e.g.
+    `run_on_devices(lambda: adb_install(apk))`. The adb commands run by `func`
+    are sent to the device that it is called for, see `use_device()`.
+
+    Args:
+        serials: Serial numbers of the devices, or all online devices if None.
+        max_workers: Maximum number of devices that are worked on at once.
+        on_progress: Called with the serial number and the new status, i.e.
+            "running", "done" or "failed: <error>", from the worker threads.
+        log_dir: If set, the log records and the output of the adb commands for
+            each device are written to "<log_dir>/<serial>.log" instead of the
+            console, e.g. so that they do not garble a menu.
+
+    Returns:
+        Dict[str, DeviceResult]: The result or exception of each device, in
+            the order of `serials`.
+    """
+    if serials is None:
+        serials = get_device_serials()
+
+    def run(serial: str) -> DeviceResult:
+        if on_progress:
+            on_progress(serial, "running")
+        try:
+            with use_device(serial):
+                result = DeviceResult(serial, result=func())
+            status = "done"
+        except Exception as ex:
+            logger.warning("%s: %s" % (serial, ex))
+            result = DeviceResult(serial, exception=ex)
+            status = "failed: %s" % ex
+        if on_progress:
+            on_progress(serial, status)
+        return result
+
+    def run_with_log(serial: str) -> DeviceResult:
+        assert log_dir is not None
+        with open(get_device_log_file(log_dir, serial), "w", encoding="utf-8") as f:
+            _device.output = f
+            try:
+                return run(serial)
+            finally:
+                _device.output = None
+
+    if not serials:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(serials))) as executor:
+        if log_dir is None:
+            return {r.serial: r for r in executor.map(run, serials)}
+
+        os.makedirs(log_dir, exist_ok=True)
+        with _redirect_device_output():
+            return {r.serial: r for r in executor.map(run_with_log, serials)}
+
+
+def get_device_log_file(log_dir: str, serial: str) -> str:
+    # Serials of network devices look like "192.168.0.2:5555".
+    return os.path.join(log_dir, re.sub(r"[^\w.-]", "_", serial) + ".log")
+
+
 def find_device_by_product_name(product: str) -> Optional[str]:
     serial = find_device_by_product_name_adb(product)
     if serial:
@@ -1,20 +1,11 @@
-import ctypes
-import ctypes.wintypes as wintypes
+import errno
+import logging
 import os
+import select
+import struct
 import sys
-
-# Windows constants
-FILE_LIST_DIRECTORY = 0x0001
-OPEN_EXISTING = 3
-FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
-FILE_SHARE_READ = 0x01
-FILE_SHARE_WRITE = 0x02
-FILE_SHARE_DELETE = 0x04
-
-FILE_NOTIFY_CHANGE_FILE_NAME = 0x01
-FILE_NOTIFY_CHANGE_DIR_NAME = 0x02
-FILE_NOTIFY_CHANGE_SIZE = 0x08
-FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
+import threading
+from typing import Callable, Dict, Iterator, Optional, Tuple
 
 ACTIONS = {
     1: "CREATED",
@@ -24,17 +15,40 @@ ACTIONS = {
     5: "RENAMED_TO",
 }
 
-kernel32 = ctypes.windll.kernel32
-CreateFileW = kernel32.CreateFileW
-CreateFileW.restype = wintypes.HANDLE
-ReadDirectoryChangesW = kernel32.ReadDirectoryChangesW
-CloseHandle = kernel32.CloseHandle
+# Some events may have been lost, the caller should rescan the whole directory.
+OVERFLOW = "OVERFLOW"
+
+DEFAULT_POLL_INTERVAL_SECS = 2.0
+
+# Return True to skip watching a sub directory, given its parent and its name.
+IgnoreDirCallback = Callable[[str, str], bool]
+
+
+def _watch_directory_win(path, recursive=True, stop_event=None):
+    import ctypes
+    import ctypes.wintypes as wintypes
+
+    # Windows constants
+    FILE_LIST_DIRECTORY = 0x0001
+    OPEN_EXISTING = 3
+    FILE_FLAG_BACKUP_SEMANTICS = 0x02000000
+    FILE_SHARE_READ = 0x01
+    FILE_SHARE_WRITE = 0x02
+    FILE_SHARE_DELETE = 0x04
 
-INVALID_HANDLE_VALUE = wintypes.HANDLE(-1).value
+    FILE_NOTIFY_CHANGE_FILE_NAME = 0x01
+    FILE_NOTIFY_CHANGE_DIR_NAME = 0x02
+    FILE_NOTIFY_CHANGE_SIZE = 0x08
+    FILE_NOTIFY_CHANGE_LAST_WRITE = 0x10
 
+    kernel32 = ctypes.windll.kernel32
+    CreateFileW = kernel32.CreateFileW
+    CreateFileW.restype = wintypes.HANDLE
+    ReadDirectoryChangesW = kernel32.ReadDirectoryChangesW
+    CloseHandle = kernel32.CloseHandle
+
+    INVALID_HANDLE_VALUE = wintypes.HANDLE(-1).value
 
-def watch_directory(path, recursive=True, stop_event=None):
-    """Yield (action, filepath) tuples for changes under `path`."""
     handle = CreateFileW(
         path,
         FILE_LIST_DIRECTORY,
@@ -71,6 +85,11 @@ def watch_directory(path, recursive=True, stop_event=None):
             if not ok:
                 break
 
+            # The buffer overflowed and the changes are discarded.
+            if bytes_returned.value == 0:
+                yield OVERFLOW, path
+                continue
+
             offset = 0
             while True:
                 fni = buf.raw[offset:]
@@ -90,6 +109,237 @@ def watch_directory(path, recursive=True, stop_event=None):
         CloseHandle(handle)
 
 
+# inotify constants, see <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+_INOTIFY_ACTIONS = (
+    (IN_CREATE, "CREATED"),
+    (IN_DELETE, "DELETED"),
+    (IN_MODIFY | IN_ATTRIB, "MODIFIED"),
+    (IN_MOVED_FROM, "RENAMED_FROM"),
+    (IN_MOVED_TO, "RENAMED_TO"),
+)
+_INOTIFY_MASK = (
+    IN_CREATE
+    | IN_DELETE
+    | IN_MODIFY
+    | IN_ATTRIB
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+
+class _InotifyWatchError(OSError):
+    pass
+
+
+def _watch_directory_inotify(
+    path,
+    recursive=True,
+    stop_event=None,
+    ignore_dir: Optional[IgnoreDirCallback] = None,
+    timeout=0.5,
+):
+    import ctypes
+    import ctypes.util
+
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    wd_to_dir: Dict[int, str] = {}
+
+    def add_watch(dir_path: str):
+        wd = libc.inotify_add_watch(fd, os.fsencode(dir_path), _INOTIFY_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # The directory may have been removed in the meantime.
+            if err in (errno.ENOENT, errno.ENOTDIR):
+                return
+            # E.g. ENOSPC once fs.inotify.max_user_watches is reached, which
+            # would leave the whole sub tree unwatched.
+            raise _InotifyWatchError(err, os.strerror(err), dir_path)
+        wd_to_dir[wd] = dir_path
+
+        if recursive:
+            try:
+                entries = list(os.scandir(dir_path))
+            except OSError:
+                return
+            for entry in entries:
+                if (
+                    entry.is_dir(follow_symlinks=False)
+                    and (ignore_dir is None or not ignore_dir(dir_path, entry.name))
+                ):
+                    add_watch(entry.path)
+
+    try:
+        add_watch(path)
+        if not wd_to_dir:
+            raise OSError(f"Cannot watch directory: {path}")
+
+        while stop_event is None or not stop_event.is_set():
+            readable, _, _ = select.select([fd], [], [], timeout)
+            if not readable:
+                continue
+
+            try:
+                buf = os.read(fd, 65536)
+            except BlockingIOError:
+                continue
+
+            offset = 0
+            while offset < len(buf):
+                wd, mask, _, name_len = _INOTIFY_EVENT.unpack_from(buf, offset)
+                offset += _INOTIFY_EVENT.size
+                name = os.fsdecode(buf[offset : offset + name_len].rstrip(b"\0"))
+                offset += name_len
+
+                if mask & IN_Q_OVERFLOW:
+                    yield OVERFLOW, path
+                    continue
+
+                if mask & IN_IGNORED:
+                    wd_to_dir.pop(wd, None)
+                    continue
+
+                dir_path = wd_to_dir.get(wd)
+                if dir_path is None or not name:
+                    continue
+                full_path = os.path.join(dir_path, name)
+
+                if (
+                    recursive
+                    and mask & IN_ISDIR
+                    and mask & (IN_CREATE | IN_MOVED_TO)
+                    and (ignore_dir is None or not ignore_dir(dir_path, name))
+                ):
+                    add_watch(full_path)
+
+                for flag, action in _INOTIFY_ACTIONS:
+                    if mask & flag:
+                        yield action, full_path
+                        break
+    finally:
+        os.close(fd)
+
+
+def _take_snapshot(
+    path, recursive=True, ignore_dir: Optional[IgnoreDirCallback] = None
+) -> Dict[str, Tuple[int, int]]:
+    snapshot: Dict[str, Tuple[int, int]] = {}
+    pending = [path]
+    while pending:
+        dir_path = pending.pop()
+        try:
+            entries = list(os.scandir(dir_path))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+            if (
+                recursive
+                and entry.is_dir(follow_symlinks=False)
+                and (ignore_dir is None or not ignore_dir(dir_path, entry.name))
+            ):
+                pending.append(entry.path)
+    return snapshot
+
+
+def _watch_directory_poll(
+    path,
+    recursive=True,
+    stop_event=None,
+    ignore_dir: Optional[IgnoreDirCallback] = None,
+    poll_interval=DEFAULT_POLL_INTERVAL_SECS,
+):
+    if stop_event is None:
+        stop_event = threading.Event()
+
+    snapshot = _take_snapshot(path, recursive=recursive, ignore_dir=ignore_dir)
+    while not stop_event.wait(poll_interval):
+        new_snapshot = _take_snapshot(path, recursive=recursive, ignore_dir=ignore_dir)
+
+        for file, stat in new_snapshot.items():
+            old_stat = snapshot.get(file)
+            if old_stat is None:
+                yield "CREATED", file
+            elif old_stat != stat:
+                yield "MODIFIED", file
+
+        for file in snapshot:
+            if file not in new_snapshot:
+                yield "DELETED", file
+
+        snapshot = new_snapshot
+
+
+def watch_directory(
+    path,
+    recursive=True,
+    stop_event=None,
+    ignore_dir: Optional[IgnoreDirCallback] = None,
+    poll=False,
+    poll_interval=DEFAULT_POLL_INTERVAL_SECS,
+) -> Iterator[Tuple[str, str]]:
+    """
+    Yield (action, filepath) tuples for changes under `path`.
+
+    Uses ReadDirectoryChangesW on Windows and inotify on Linux, otherwise falls
+    back to polling and diffing the stat snapshots of the directory, which is
+    also used if inotify runs out of watches. An `OVERFLOW` action means that
+    some changes have been lost.
+    """
+    if poll:
+        pass
+    elif sys.platform == "win32":
+        yield from _watch_directory_win(
+            path, recursive=recursive, stop_event=stop_event
+        )
+        return
+    elif sys.platform == "linux":
+        try:
+            yield from _watch_directory_inotify(
+                path, recursive=recursive, stop_event=stop_event, ignore_dir=ignore_dir
+            )
+            return
+        except _InotifyWatchError as ex:
+            logging.warning(f"Cannot watch with inotify, fall back to polling: {ex}")
+            # The changes made before the first poll are not reported.
+            yield OVERFLOW, path
+
+    yield from _watch_directory_poll(
+        path,
+        recursive=recursive,
+        stop_event=stop_event,
+        ignore_dir=ignore_dir,
+        poll_interval=poll_interval,
+    )
+
+
 if __name__ == "__main__":
     path = sys.argv[1] if len(sys.argv) > 1 else "."
     print(f"Monitoring: {path}", flush=True)
@@ -37,7 +37,7 @@ if __name__ == "__main__":
     t = threading.Thread(target=run_test, args=(stop_event,), daemon=True)
     t.start()
 
-    # watch_directory is blocking (synchronous ReadDirectoryChangesW),
+    # watch_directory is blocking (e.g. synchronous ReadDirectoryChangesW),
     # so we run it in a thread and stop when test is done.
     def watcher():
         for action, filepath in watch_directory(
@@ -1,6 +1,147 @@
-from typing import AsyncIterator
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 import aiohttp
+from yarl import URL
+
+logger = logging.getLogger(__name__)
+
+# Idle connections are kept open for this many seconds, which should cover the
+# time it takes to run the tools between two turns of a chat.
+_KEEPALIVE_TIMEOUT = 120
+
+# When a streamed response is not read to the end, e.g. the client stops at the
+# last event, the rest is read for up to this many seconds so that the connection
+# can be reused. Otherwise the connection is closed.
+_DRAIN_TIMEOUT = 5
+
+# Sessions cannot be shared between event loops, so there is one session per
+# event loop and endpoint (scheme, host and port).
+_sessions: Dict[
+    Tuple[asyncio.AbstractEventLoop, str, Optional[str], Optional[int]],
+    aiohttp.ClientSession,
+] = {}
+_sessions_lock = threading.Lock()
+
+
+class RequestStats:
+    """
+    Latency of a request sent with `post()`, which is filled in as the request
+    progresses.
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.connection_reused: Optional[bool] = None
+
+        # Time until the first chunk of the response body is received, which is
+        # when the first token arrives for streamed responses.
+        self.time_to_first_token: Optional[float] = None
+
+    def __str__(self) -> str:
+        s = (
+            "ttft=%.2fs" % self.time_to_first_token
+            if self.time_to_first_token is not None
+            else "ttft=?"
+        )
+        if self.connection_reused is not None:
+            s += " (%s)" % ("reused" if self.connection_reused else "new conn")
+        return s
+
+
+def _get_request_stats(trace_config_ctx: SimpleNamespace) -> Optional[RequestStats]:
+    stats = trace_config_ctx.trace_request_ctx
+    return stats if isinstance(stats, RequestStats) else None
+
+
+async def _on_connection_create_end(session, trace_config_ctx, params):
+    stats = _get_request_stats(trace_config_ctx)
+    if stats is not None:
+        stats.connection_reused = False
+
+
+async def _on_connection_reuseconn(session, trace_config_ctx, params):
+    stats = _get_request_stats(trace_config_ctx)
+    if stats is not None:
+        stats.connection_reused = True
+
+
+async def _on_response_chunk_received(session, trace_config_ctx, params):
+    stats = _get_request_stats(trace_config_ctx)
+    if stats is not None and stats.time_to_first_token is None:
+        stats.time_to_first_token = time.perf_counter() - stats.start_time
+        logger.info(f"{params.method} {params.url.origin()}: {stats}")
+
+
+def _create_trace_config() -> aiohttp.TraceConfig:
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(_on_connection_create_end)
+    trace_config.on_connection_reuseconn.append(_on_connection_reuseconn)
+    trace_config.on_response_chunk_received.append(_on_response_chunk_received)
+    return trace_config
+
+
+def get_session(url: str) -> aiohttp.ClientSession:
+    """
+    Return the session shared by all the requests to the endpoint of the URL
+    from the running event loop, which keeps the connections alive so that they
+    can be reused by the following requests.
+    """
+    loop = asyncio.get_running_loop()
+    u = URL(url)
+    key = (loop, u.scheme, u.host, u.port)
+
+    with _sessions_lock:
+        # Drop the sessions of the event loops that have been closed, e.g. by
+        # `asyncio.run()`.
+        for k in [k for k in _sessions if k[0].is_closed()]:
+            del _sessions[k]
+
+        session = _sessions.get(key)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(keepalive_timeout=_KEEPALIVE_TIMEOUT),
+                trace_configs=[_create_trace_config()],
+            )
+            _sessions[key] = session
+        return session
+
+
+@asynccontextmanager
+async def post(
+    url: str, stats: Optional[RequestStats] = None, **kwargs
+) -> AsyncIterator[aiohttp.ClientResponse]:
+    """
+    Send a POST request with the shared session of the endpoint. Use it as
+    `async with post(url, ...) as response:`.
+    """
+    async with get_session(url).post(
+        url, trace_request_ctx=stats, **kwargs
+    ) as response:
+        yield response
+
+        if not response.content.at_eof():
+            try:
+                await asyncio.wait_for(response.read(), _DRAIN_TIMEOUT)
+            except (asyncio.TimeoutError, aiohttp.ClientError):
+                pass
+
+
+async def close_sessions():
+    """
+    Close the shared sessions of the running event loop.
+    """
+    loop = asyncio.get_running_loop()
+    with _sessions_lock:
+        sessions = [_sessions.pop(k) for k in list(_sessions) if k[0] is loop]
+    for session in sessions:
+        await session.close()
 
 
 async def check_for_status(response):
@@ -13,13 +154,87 @@ async def iter_lines(
     content: aiohttp.StreamReader,
     chunk_size: int = 64 * 1024,
 ) -> AsyncIterator[bytes]:
-    buffer = b""
+    """
+    Yield the lines of the content without the line breaks. The buffer is only
+    searched from where the last search stopped and is only trimmed once per
+    chunk, so that a large response is processed in linear time.
+    """
+    buffer = bytearray()
     async for chunk in content.iter_chunked(chunk_size):
+        # The part before the new chunk does not contain any line break.
+        search_start = len(buffer)
         buffer += chunk
 
-        while b"\n" in buffer:
-            line, buffer = buffer.split(b"\n", 1)
-            yield line
+        line_start = 0
+        while True:
+            line_end = buffer.find(b"\n", search_start)
+            if line_end < 0:
+                break
+            yield bytes(buffer[line_start:line_end])
+            line_start = search_start = line_end + 1
+
+        if line_start > 0:
+            del buffer[:line_start]
 
     if buffer:
-        yield buffer
+        yield bytes(buffer)
+
+
+@dataclass
+class ServerSentEvent:
+    data: str
+    event: str = "message"
+    id: Optional[str] = None
+
+
+async def iter_sse_events(
+    content: aiohttp.StreamReader,
+) -> AsyncIterator[ServerSentEvent]:
+    """
+    Parse a stream of server-sent events, i.e. "event:", "data:" and "id:"
+    fields, each event ending with a blank line.
+
+    See https://html.spec.whatwg.org/multipage/server-sent-events.html
+    """
+    event_type: Optional[str] = None
+    data_lines: List[str] = []
+    last_event_id: Optional[str] = None
+
+    def create_event() -> ServerSentEvent:
+        return ServerSentEvent(
+            data="\n".join(data_lines),
+            event=event_type or "message",
+            id=last_event_id,
+        )
+
+    async for line in iter_lines(content):
+        if line.endswith(b"\r"):
+            line = line[:-1]
+
+        # Dispatch the event
+        if not line:
+            if data_lines:
+                yield create_event()
+            event_type = None
+            data_lines.clear()
+            continue
+
+        # Comment
+        if line.startswith(b":"):
+            continue
+
+        field, _, value = line.partition(b":")
+        if value.startswith(b" "):
+            value = value[1:]
+
+        if field == b"data":
+            data_lines.append(value.decode("utf-8"))
+        elif field == b"event":
+            event_type = value.decode("utf-8")
+        elif field == b"id":
+            last_event_id = value.decode("utf-8")
+
+    # Unlike browsers, do not drop the last event if the stream ends without a
+    # blank line.
+    if data_lines:
+        yield create_event()
@@ -0,0 +1,190 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Any, Dict, Optional, Tuple
+
+from _filelock import FileLock
+
+# Once the log grows beyond this size, it is merged into the JSON file.
+_COMPACT_LOG_SIZE = 64 * 1024
+
+
+class JsonStore:
+    """
+    Key-value store saved as a JSON object, which can be safely updated by
+    multiple processes.
+
+    Instead of rewriting the whole JSON file, each update is appended as one
+    line to a log file next to it, e.g. "data.json.log". The log is merged into
+    the JSON file, which is replaced atomically, once it grows large enough.
+    All file access is guarded by a file lock.
+
+    The JSON file stays authoritative: the first line of the log records the
+    JSON file it was written against, and the log is ignored once the JSON file
+    has been replaced by anything else, e.g. when it is edited by hand.
+    """
+
+    def __init__(self, file: str):
+        self.file = os.path.abspath(file)
+        self.log_file = self.file + ".log"
+        self.__lock_name = (
+            "jsonstore_" + hashlib.md5(self.file.encode("utf-8")).hexdigest()[:16]
+        )
+
+        # File locks do not exclude the threads of the same process.
+        self.__thread_lock = threading.Lock()
+
+        self.__data: Dict[str, Any] = {}
+        self.__file_stat: Optional[Tuple[int, int, int]] = None
+        self.__log_offset = 0
+        # Whether the log was written against the current JSON file.
+        self.__log_valid = False
+
+    @contextmanager
+    def __lock(self):
+        with self.__thread_lock, FileLock(self.__lock_name):
+            yield
+
+    def __get_file_stat(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.file)
+            return (st.st_ino, st.st_mtime_ns, st.st_size)
+        except FileNotFoundError:
+            return None
+
+    def __get_log_header(self) -> bytes:
+        return (json.dumps(list(self.__file_stat or ())) + "\n").encode("utf-8")
+
+    def __read_log(self):
+        try:
+            with open(self.log_file, "rb") as f:
+                f.seek(self.__log_offset)
+                for line in f:
+                    # Skip the last line if it was partially written.
+                    if not line.endswith(b"\n"):
+                        break
+
+                    if self.__log_offset == 0:
+                        self.__log_offset = len(line)
+                        self.__log_valid = line == self.__get_log_header()
+                        if not self.__log_valid:
+                            logging.debug(f"Ignore outdated log: {self.log_file}")
+                        continue
+
+                    self.__log_offset += len(line)
+                    if not self.__log_valid:
+                        continue
+                    try:
+                        self.__data.update(json.loads(line))
+                    except json.decoder.JSONDecodeError:
+                        logging.warning(f"Invalid line in {self.log_file}: {line!r}")
+        except FileNotFoundError:
+            pass
+
+    def __sync(self):
+        """
+        Bring the in-memory data up to date, only reading the new log lines
+        unless the JSON file has been replaced.
+        """
+        file_stat = self.__get_file_stat()
+        try:
+            log_size = os.path.getsize(self.log_file)
+        except FileNotFoundError:
+            log_size = 0
+
+        if file_stat != self.__file_stat or log_size < self.__log_offset:
+            self.__file_stat = file_stat
+            self.__log_offset = 0
+            self.__log_valid = False
+            try:
+                with open(self.file, "r", encoding="utf-8") as f:
+                    self.__data = json.load(f)
+            except (FileNotFoundError, json.decoder.JSONDecodeError):
+                self.__data = {}
+        elif not self.__log_valid:
+            # Another process may have started a new log in the meantime.
+            self.__log_offset = 0
+
+        if log_size > self.__log_offset:
+            self.__read_log()
+
+    def __save(self):
+        dir_path = os.path.dirname(self.file)
+        os.makedirs(dir_path, exist_ok=True)
+        tmp_file = "%s.%d.tmp" % (self.file, os.getpid())
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.__data, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(tmp_file, self.file)
+
+        self.__file_stat = self.__get_file_stat()
+        self.__start_log()
+
+    def __start_log(self):
+        header = self.__get_log_header()
+        with open(self.log_file, "wb") as f:
+            f.write(header)
+        self.__log_offset = len(header)
+        self.__log_valid = True
+
+    def compact(self):
+        """
+        Merge the log into the JSON file, e.g. before the JSON file is opened
+        by something other than this class.
+        """
+        with self.__lock():
+            self.__sync()
+            if self.__log_valid and self.__log_offset > len(self.__get_log_header()):
+                logging.debug(f"Compact {self.log_file}")
+                self.__save()
+
+    def save(self, data: Dict[str, Any]):
+        """
+        Replace all the key-value pairs.
+        """
+        with self.__lock():
+            self.__data = dict(data)
+            self.__save()
+
+    def load(self) -> Dict[str, Any]:
+        """
+        Return a copy of all the key-value pairs.
+        """
+        with self.__lock():
+            self.__sync()
+            return dict(self.__data)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self.__lock():
+            self.__sync()
+            return self.__data.get(key, default)
+
+    def update(self, data: Dict[str, Any]):
+        if not data:
+            return
+
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        with self.__lock():
+            self.__sync()
+            os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+            if not self.__log_valid:
+                self.__start_log()
+            with open(self.log_file, "ab") as f:
+                # Drop the partially written line left by a crashed process.
+                if f.tell() > self.__log_offset:
+                    f.truncate(self.__log_offset)
+                f.write(line)
+            self.__data.update(data)
+            self.__log_offset += len(line)
+
+            if self.__log_offset > _COMPACT_LOG_SIZE:
+                logging.debug(f"Compact {self.log_file}")
+                self.__save()
+
+
+@lru_cache(maxsize=None)
+def get_json_store(file: str) -> JsonStore:
+    return JsonStore(file)
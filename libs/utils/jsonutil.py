@@ -1,7 +1,9 @@
 import json
 import os
 import shutil
-from typing import Optional, Tuple, TypeVar
+from typing import Any, Dict, Optional, Tuple, TypeVar
+
+from utils.jsonstore import get_json_store
 
 T = TypeVar("T")
 
@@ -11,7 +13,18 @@ MTIME_TOLERANCE = 1.0
 def load_json(
     file: str,
     default: Optional[T] = None,
+    store: bool = False,
 ) -> T:
+    """
+    If `store` is True, the file is read through `utils.jsonstore` so that the
+    changes made by `update_json(..., store=True)` are included.
+    """
+    if store:
+        store_data: Any = get_json_store(file).load()
+        if isinstance(default, dict):
+            store_data = {**default, **store_data}
+        return store_data
+
     try:
         with open(file, "r", encoding="utf-8") as f:
             data = json.load(f)
@@ -25,7 +38,11 @@ def load_json(
             raise Exception("Default value is not specified.")
 
 
-def save_json(file: str, data):
+def save_json(file: str, data, store: bool = False):
+    if store:
+        get_json_store(file).save(data)
+        return
+
     file = os.path.abspath(file)
     dir_path = os.path.dirname(file)
     if dir_path:
@@ -34,6 +51,18 @@ def save_json(file: str, data):
         json.dump(data, f, indent=2, ensure_ascii=False, sort_keys=True)
 
 
+def update_json(file: str, data: Dict[str, Any], store: bool = False):
+    """
+    Update some of the keys of a JSON object. If `store` is True, only the
+    changed keys are appended to the log of `utils.jsonstore` instead of
+    rewriting the whole file.
+    """
+    if store:
+        get_json_store(file).update(data)
+    else:
+        save_json(file, {**load_json(file, default={}), **data})
+
+
 def try_load_json(
     file: str,
     last_mtime: float,
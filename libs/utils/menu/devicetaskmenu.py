@@ -0,0 +1,110 @@
+import os
+from itertools import cycle
+from threading import Thread
+from typing import Any, Callable, Dict, List, Optional
+
+from utils.android import (
+    DeviceResult,
+    get_device_log_file,
+    get_device_serials,
+    run_on_devices,
+)
+from utils.script.path import get_temp_dir
+
+from .menu import Menu
+
+
+class _DeviceRow:
+    def __init__(self, serial: str, log_file: str):
+        self.serial = serial
+        self.status = "pending"
+        self.log_file = log_file
+
+    def __str__(self) -> str:
+        if self.status.startswith("failed"):
+            return "%-24s %s (see %s)" % (self.serial, self.status, self.log_file)
+        return "%-24s %s" % (self.serial, self.status)
+
+
+class DeviceTaskMenu(Menu[_DeviceRow]):
+    """
+    Run the same task on multiple devices at once with `run_on_devices()`, and
+    show the status of each device as it changes. The output of each device is
+    written to a log file in `log_dir`, so that it does not garble the menu.
+    """
+
+    def __init__(
+        self,
+        target: Callable[[], Any],
+        serials: Optional[List[str]] = None,
+        max_workers: int = 32,
+        prompt: str = "",
+        log_dir: Optional[str] = None,
+        **kwargs,
+    ):
+        if serials is None:
+            serials = get_device_serials()
+        if log_dir is None:
+            log_dir = os.path.join(get_temp_dir(), "device_task")
+        self.__rows = {
+            serial: _DeviceRow(serial, get_device_log_file(log_dir, serial))
+            for serial in serials
+        }
+        self.__prompt = prompt
+        self.__results: Dict[str, DeviceResult] = {}
+        self.__finished = False
+
+        super().__init__(
+            items=list(self.__rows.values()),
+            prompt=prompt,
+            search_mode=False,
+            **kwargs,
+        )
+
+        def on_progress(serial: str, status: str):
+            self.post_event(lambda: self.__set_status(serial, status))
+
+        def wrapper():
+            self.__results = run_on_devices(
+                target,
+                serials=serials,
+                max_workers=max_workers,
+                on_progress=on_progress,
+                log_dir=log_dir,
+            )
+
+        self.__thread = Thread(target=wrapper)
+        self.__spinner = cycle(["|", "/", "-", "\\"])
+        self.__thread.start()
+
+    def __set_status(self, serial: str, status: str):
+        self.__rows[serial].status = status
+        self.update_screen()
+
+    def get_item_color(self, item: _DeviceRow) -> str:
+        if item.status == "done":
+            return "green"
+        elif item.status.startswith("failed"):
+            return "red"
+        elif item.status == "running":
+            return "yellow"
+        else:
+            return "white"
+
+    def on_close(self):
+        # The running adb commands cannot be cancelled safely.
+        self.__thread.join()
+
+    def on_idle(self):
+        if self.__thread.is_alive():
+            self.set_prompt(self.__prompt + " " + next(self.__spinner))
+        elif not self.__finished:
+            self.__finished = True
+            failed = sum(not r.succeeded for r in self.__results.values())
+            self.set_prompt(
+                "%s done: %d succeeded, %d failed"
+                % (self.__prompt, len(self.__results) - failed, failed)
+            )
+
+    def get_results(self) -> Dict[str, DeviceResult]:
+        return self.__results
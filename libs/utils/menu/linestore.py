@@ -0,0 +1,467 @@
+import mmap
+import os
+import re
+import tempfile
+import threading
+from array import array
+from bisect import bisect_right
+from typing import (
+    IO,
+    Callable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
+
+# Number of lines that are searched at a time between checking for
+# cancellation.
+SEARCH_CHUNK_LINES = 50000
+
+# Number of bytes that are searched at a time in a file.
+SEARCH_CHUNK_SIZE = 4 * 1024 * 1024
+
+# A file is indexed by the number of lines before each block of this size.
+INDEX_BLOCK_SIZE = 16 * 1024
+
+
+def _search_text(
+    regex: re.Pattern, text: str, first_line: int, matches: List[int]
+) -> None:
+    """
+    Append the indices of the lines in `text` (separated by "\\n") that match
+    the regex, given that the first line has index `first_line`.
+
+    The whole text is searched at once, which is much faster than searching
+    line by line since most lines usually do not match.
+    """
+    pos = 0
+    line = first_line
+    n = len(text)
+    while pos <= n:
+        m = regex.search(text, pos)
+        if m is None:
+            break
+
+        start = m.start()
+        line += text.count("\n", pos, start)
+        line_start = text.rfind("\n", 0, start) + 1
+        line_end = text.find("\n", start)
+        if line_end < 0:
+            line_end = n
+
+        # A match that spans multiple lines does not count, but the same line
+        # may still match on its own.
+        if m.end() <= line_end or regex.search(text, line_start, line_end):
+            matches.append(line)
+
+        pos = line_end + 1
+        line += 1
+
+
+# Called with a function that returns the indices matched so far and the
+# progress. The indices are only collected if the function is called, as there
+# may be millions of them.
+SearchProgressCallback = Callable[[Callable[[], List[int]], float], None]
+
+
+class LineSource(Sequence[str]):
+    """
+    Lines that are not all kept in memory as strings. Instead of matching them
+    one by one, menus search them with `search()`.
+    """
+
+    @overload
+    def __getitem__(self, index: int) -> str: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[str]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(index, slice):
+            return [self.get_line(i) for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("line index out of range")
+        return self.get_line(index)
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self.get_line(i)
+
+    def get_line(self, index: int) -> str:
+        raise NotImplementedError()
+
+    def copy(self) -> "LineSource":
+        """
+        Return a snapshot of the lines that does not change when new lines are
+        added, so that it can be searched in a background thread.
+        """
+        raise NotImplementedError()
+
+    def search(
+        self,
+        regex: re.Pattern,
+        cancel_event: Optional[threading.Event] = None,
+        on_progress: Optional[SearchProgressCallback] = None,
+    ) -> List[int]:
+        """
+        Return the indices of the lines that match the regex, or an empty list
+        if cancelled.
+        """
+        raise NotImplementedError()
+
+
+class LineStore(LineSource):
+    """
+    Append-only list of lines that keeps at most `max_lines` of the most recent
+    lines in memory.
+
+    Older lines are spilled to a temporary file, and only their offsets are
+    kept in memory. They are read back lazily through a memory map when they
+    are accessed, e.g. when scrolling back. If `max_lines` is None, all lines
+    are kept in memory.
+    """
+
+    def __init__(self, max_lines: Optional[int] = None):
+        self.max_lines = max_lines
+
+        self.__lock = threading.RLock()
+        self.__resident: List[str] = []
+
+        # Offsets of the spilled lines in the spill file, followed by the end
+        # offset of the last line.
+        self.__offsets = array("Q", [0])
+        self.__spill_file: Optional[IO[bytes]] = None
+        self.__mmap: Optional[mmap.mmap] = None
+
+    def __len__(self) -> int:
+        return len(self.__offsets) - 1 + len(self.__resident)
+
+    @property
+    def spilled_count(self) -> int:
+        return len(self.__offsets) - 1
+
+    def get_line(self, index: int) -> str:
+        with self.__lock:
+            spilled_count = self.spilled_count
+            if index >= spilled_count:
+                return self.__resident[index - spilled_count]
+            else:
+                return self.__read_spilled_lines(index, index + 1)[0]
+
+    def append(self, line: str):
+        with self.__lock:
+            self.__resident.append(line)
+
+            # Spill lines in blocks to reduce the number of writes.
+            if self.max_lines is not None and len(self.__resident) >= (
+                self.max_lines + max(1, self.max_lines // 8)
+            ):
+                self.__spill(len(self.__resident) - self.max_lines)
+
+    def extend(self, lines: Sequence[str]):
+        for line in lines:
+            self.append(line)
+
+    def clear(self):
+        with self.__lock:
+            self.__resident = []
+            self.__offsets = array("Q", [0])
+
+            # Start a new spill file instead of truncating the current one,
+            # which may still be read by a search that is being cancelled.
+            self.__spill_file = None
+            self.__mmap = None
+
+    def sort(self, **kwargs):
+        with self.__lock:
+            lines = list(self)
+            lines.sort(**kwargs)
+            self.clear()
+            self.extend(lines)
+
+    def copy(self) -> "LineStore":
+        """
+        Return a snapshot of the lines, which shares the spill file with this
+        store and does not change when new lines are appended.
+        """
+        with self.__lock:
+            snapshot = LineStore(max_lines=None)
+            snapshot.__resident = list(self.__resident)
+            snapshot.__offsets = self.__offsets[:]
+            snapshot.__spill_file = self.__spill_file
+            return snapshot
+
+    def __spill(self, n: int):
+        if self.__spill_file is None:
+            self.__spill_file = tempfile.TemporaryFile()
+
+        data = bytearray()
+        offset = self.__offsets[-1]
+        for line in self.__resident[:n]:
+            data += line.encode("utf-8", errors="surrogateescape")
+            data += b"\n"
+            self.__offsets.append(offset + len(data))
+        self.__spill_file.seek(offset)
+        self.__spill_file.write(data)
+        self.__spill_file.flush()
+        del self.__resident[:n]
+
+    def __get_mmap(self, end: int) -> mmap.mmap:
+        # The file grows as lines are spilled, so map it again if needed.
+        if self.__mmap is None or len(self.__mmap) < end:
+            assert self.__spill_file is not None
+            self.__mmap = mmap.mmap(
+                self.__spill_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self.__mmap
+
+    def __read_spilled_lines(self, begin: int, end: int) -> List[str]:
+        return self.__read_spilled_text(begin, end).split("\n")
+
+    def __read_spilled_text(self, begin: int, end: int) -> str:
+        """
+        Return the text of the spilled lines in [begin, end) separated by "\\n".
+        """
+        with self.__lock:
+            start_offset = self.__offsets[begin]
+            end_offset = self.__offsets[end]
+            data = self.__get_mmap(end_offset)[start_offset : end_offset - 1]
+        return data.decode("utf-8", errors="surrogateescape")
+
+    def search(
+        self,
+        regex: re.Pattern,
+        cancel_event: Optional[threading.Event] = None,
+        on_progress: Optional[SearchProgressCallback] = None,
+    ) -> List[int]:
+        # Spilled lines are searched in chunks directly from the spill file,
+        # so they are never all loaded into memory at once.
+        matches: List[int] = []
+        total = len(self)
+        spilled_count = self.spilled_count
+        chunks: List[Tuple[int, int]] = [
+            (i, min(i + SEARCH_CHUNK_LINES, total))
+            for i in range(0, total, SEARCH_CHUNK_LINES)
+        ]
+        for begin, end in chunks:
+            if cancel_event is not None and cancel_event.is_set():
+                return []
+
+            texts = []
+            if begin < spilled_count:
+                texts.append(
+                    self.__read_spilled_text(begin, min(end, spilled_count))
+                )
+            if end > spilled_count:
+                texts.append(
+                    "\n".join(
+                        self.__resident[
+                            max(begin, spilled_count)
+                            - spilled_count : end
+                            - spilled_count
+                        ]
+                    )
+                )
+            _search_text(regex, "\n".join(texts), begin, matches)
+
+            if on_progress is not None:
+                on_progress(lambda: list(matches), end / total)
+
+        return matches
+
+
+class _MappedFile:
+    def __init__(self, file: str, prefix: str):
+        self.prefix = prefix
+        self.size = os.path.getsize(file)
+        self.mmap: Optional[mmap.mmap] = None
+        if self.size > 0:
+            with open(file, "rb") as f:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Number of complete lines before each indexed block.
+        self.block_line_counts = array("Q")
+        self.line_count = 0
+        self.indexed = False
+
+    def index(self, should_stop: Callable[[], bool]):
+        mm = self.mmap
+        line_count = 0
+        for offset in range(0, self.size, INDEX_BLOCK_SIZE):
+            if should_stop():
+                return
+            assert mm is not None
+            self.block_line_counts.append(line_count)
+            line_count += mm[offset : offset + INDEX_BLOCK_SIZE].count(b"\n")
+            self.line_count = line_count
+
+        # The last line may not end with a newline.
+        if mm is not None and mm[self.size - 1 : self.size] != b"\n":
+            self.line_count += 1
+        self.indexed = True
+
+    def get_line_offset(self, index: int) -> int:
+        assert self.mmap is not None
+        block = bisect_right(self.block_line_counts, index) - 1
+        # Find the start of the line that the block begins with, then skip the
+        # lines before the one that is wanted.
+        offset = self.mmap.rfind(b"\n", 0, block * INDEX_BLOCK_SIZE) + 1
+        for _ in range(index - self.block_line_counts[block]):
+            offset = self.mmap.find(b"\n", offset) + 1
+        return offset
+
+    def get_line(self, index: int) -> str:
+        assert self.mmap is not None
+        offset = self.get_line_offset(index)
+        end = self.mmap.find(b"\n", offset)
+        if end < 0:
+            end = self.size
+        return self.prefix + self.mmap[offset:end].decode(
+            "utf-8", errors="replace"
+        ).rstrip("\r")
+
+    def search(
+        self,
+        regex: re.Pattern,
+        line_count: int,
+        first_line: int,
+        matches: List[int],
+        should_stop: Callable[[], bool],
+    ):
+        if line_count == 0:
+            return
+        assert self.mmap is not None
+
+        line = 0
+        offset = 0
+        while line < line_count and offset < self.size:
+            if should_stop():
+                return
+
+            # Only search whole lines.
+            end = min(offset + SEARCH_CHUNK_SIZE, self.size)
+            end = self.mmap.find(b"\n", end - 1)
+            end = self.size if end < 0 else end + 1
+
+            text = self.mmap[offset:end].decode("utf-8", errors="replace")
+            text = text.replace("\r\n", "\n")
+            if text.endswith("\n"):
+                text = text[:-1]
+
+            # Lines beyond `line_count` had not been indexed yet.
+            n = text.count("\n") + 1
+            if line + n > line_count:
+                n = line_count - line
+                text = text[: _find_nth(text, "\n", n)]
+
+            if self.prefix:
+                text = self.prefix + text.replace("\n", "\n" + self.prefix)
+            _search_text(regex, text, first_line + line, matches)
+
+            line += n
+            offset = end
+
+
+def _find_nth(text: str, sub: str, n: int) -> int:
+    pos = -1
+    for _ in range(n):
+        pos = text.find(sub, pos + 1)
+        if pos < 0:
+            return len(text)
+    return pos
+
+
+class FileLines(LineSource):
+    """
+    Lines of one or more files, which are read through memory maps instead of
+    being loaded into memory.
+
+    The files are indexed in a background thread, which only records the number
+    of lines before each fixed-size block of a file, and the lines become
+    available as they are indexed. A line is located by scanning its block
+    for newlines.
+    """
+
+    def __init__(self, files: List[str], prefixes: Optional[List[str]] = None):
+        self.__files = [
+            _MappedFile(file, prefixes[i] if prefixes else "")
+            for i, file in enumerate(files)
+        ]
+        self.__closed = False
+        self.__snapshot_len: Optional[int] = None
+
+        self.__thread = threading.Thread(target=self.__index, daemon=True)
+        self.__thread.start()
+
+    def __index(self):
+        for file in self.__files:
+            file.index(should_stop=lambda: self.__closed)
+
+    def is_indexed(self) -> bool:
+        return all(file.indexed for file in self.__files)
+
+    def close(self):
+        self.__closed = True
+
+    def __len__(self) -> int:
+        if self.__snapshot_len is not None:
+            return self.__snapshot_len
+
+        total = 0
+        for file in self.__files:
+            total += file.line_count
+            if not file.indexed:
+                break
+        return total
+
+    def __locate(self, index: int) -> Tuple[_MappedFile, int]:
+        for file in self.__files:
+            if index < file.line_count:
+                return file, index
+            index -= file.line_count
+        raise IndexError("line index out of range")
+
+    def get_line(self, index: int) -> str:
+        file, index = self.__locate(index)
+        return file.get_line(index)
+
+    def copy(self) -> "FileLines":
+        snapshot = FileLines.__new__(FileLines)
+        snapshot.__files = self.__files
+        snapshot.__closed = False
+        snapshot.__snapshot_len = len(self)
+        return snapshot
+
+    def search(
+        self,
+        regex: re.Pattern,
+        cancel_event: Optional[threading.Event] = None,
+        on_progress: Optional[SearchProgressCallback] = None,
+    ) -> List[int]:
+        matches: List[int] = []
+        total = len(self)
+        first_line = 0
+
+        def should_stop() -> bool:
+            return cancel_event is not None and cancel_event.is_set()
+
+        for file in self.__files:
+            line_count = min(file.line_count, total - first_line)
+            file.search(regex, line_count, first_line, matches, should_stop)
+            if should_stop():
+                return []
+
+            first_line += line_count
+            if on_progress is not None and total > 0:
+                on_progress(lambda: list(matches), first_line / total)
+            if first_line >= total:
+                break
+
+        return matches
@@ -2,13 +2,14 @@ import json
 import os
 import time
 from collections import OrderedDict
-from typing import List, Optional
+from typing import List, Optional, Union
 
 from utils.jsonutil import save_json
 from utils.menu.dicteditmenu import DictEditMenu
 
 from .menu import Menu
 from .filemenu import FileMenu
+from .linestore import FileLines, LineStore
 
 
 def _get_default_preset():
@@ -26,6 +27,7 @@ class LogMenu(Menu[str]):
         preset_dir: Optional[str] = None,
         preset_file: Optional[str] = None,
         wrap_text=False,
+        max_lines: Optional[int] = 100000,
     ):
         self.__files = files
         self.__file_name = (
@@ -33,7 +35,19 @@ class LogMenu(Menu[str]):
             if len(self.__files) == 1
             else "[multiple]"
         )
-        self.__lines: List[str] = []
+        self.__max_lines = max_lines
+        self.__lines: Union[LineStore, FileLines]
+        if len(self.__files) == 1:
+            # Only keep the most recent lines in memory, so that tailing a log
+            # for a long time does not run out of memory.
+            self.__lines = LineStore(max_lines=max_lines)
+        else:
+            # Read the files through memory maps, so that huge files can be
+            # opened instantly.
+            self.__lines = FileLines(
+                self.__files,
+                prefixes=[os.path.basename(file) + ": " for file in self.__files],
+            )
         self.preset_dir = (
             preset_dir
             if preset_dir
@@ -53,7 +67,7 @@ class LogMenu(Menu[str]):
         self.__log_highlight = self.__default_log_highlight.copy()
 
         super().__init__(
-            items=self.__lines,
+            items=self.__lines,  # type: ignore
             highlight=self.__log_highlight,
             close_on_selection=False,
             cancellable=True,
@@ -62,6 +76,7 @@ class LogMenu(Menu[str]):
             wrap_text=wrap_text,
             follow=True,
             prompt="/",
+            async_search=True,
         )
 
         self.add_command(self.__clear_logs, hotkey="ctrl+k")
@@ -78,7 +93,12 @@ class LogMenu(Menu[str]):
             self.__load_preset_file(preset_file)
 
     def __clear_logs(self):
-        self.__lines.clear()
+        if isinstance(self.__lines, FileLines):
+            self.__lines.close()
+            self.__lines = LineStore(max_lines=self.__max_lines)
+            self.items = self.__lines  # type: ignore
+        else:
+            self.__lines.clear()
         self.refresh()
 
     def __edit_preset(self):
@@ -157,7 +177,14 @@ class LogMenu(Menu[str]):
         self.set_message(f"saved: {os.path.basename(self.__preset_file)}")
 
     def __sort(self):
-        self.__lines.sort()
+        if isinstance(self.__lines, FileLines):
+            lines = sorted(self.__lines)
+            self.__lines.close()
+            self.__lines = LineStore(max_lines=self.__max_lines)
+            self.__lines.extend(lines)
+            self.items = self.__lines  # type: ignore
+        else:
+            self.__lines.sort()
         self.refresh()
 
     def on_enter_pressed(self):
@@ -192,14 +219,18 @@ class LogMenu(Menu[str]):
                         if now - last_update > 0.1:
                             last_update = now
                             self.process_events()
-        else:
-            for file in self.__files:
-                file_name = os.path.basename(file)
-                with open(file, "r", encoding="utf-8", errors="replace") as f:
-                    lines = f.read().splitlines()
-                    for line in lines:
-                        self.append_item(file_name + ": " + line)
-                    now = time.time()
-                    if now - last_update > 0.1:
-                        last_update = now
-                        self.process_events()
+        elif isinstance(self.__lines, FileLines):
+            # Show the lines as they are being indexed.
+            lines = self.__lines
+            while (
+                not self.is_closed()
+                and self.__lines is lines
+                and not lines.is_indexed()
+            ):
+                self.process_events(timeout_sec=0.1)
+                self.update_screen()
+
+            # The lines have already been closed if they were cleared or sorted.
+            if self.__lines is lines:
+                lines.close()
+                self.update_screen()
@@ -0,0 +1,210 @@
+import operator
+import re
+from typing import Any, Iterable, List, Optional
+
+# Scores of the fzf-style ranking. Every matched character scores, characters
+# following the previous match score a bonus, as do matches at the start of a
+# word, and the gaps between the matched terms are penalized.
+_SCORE_MATCH = 16
+_BONUS_CONSECUTIVE = 4
+_BONUS_WORD_START = 8
+_PENALTY_GAP_START = 3
+_PENALTY_GAP_EXTENSION = 1
+
+# Only the first few occurrences of a term are scored.
+_MAX_OCCURRENCES = 16
+
+
+def _is_index_pattern(patt: str) -> bool:
+    return patt[:1] == ":" and patt[1:].isdigit()
+
+
+def _is_word_start(text: str, pos: int) -> bool:
+    return pos == 0 or not text[pos - 1].isalnum()
+
+
+def _score_term(text: str, term: str, pos: int, prev_end: int) -> int:
+    score = len(term) * _SCORE_MATCH + (len(term) - 1) * _BONUS_CONSECUTIVE
+    if _is_word_start(text, pos):
+        score += _BONUS_WORD_START
+
+    # The first term is not penalized for where it starts.
+    if prev_end >= 0:
+        if pos == prev_end:
+            score += _BONUS_CONSECUTIVE
+        else:
+            gap = abs(pos - prev_end)
+            score -= _PENALTY_GAP_START + (gap - 1) * _PENALTY_GAP_EXTENSION
+    return score
+
+
+def _rank_fuzzy(text: str, terms: List[str]) -> int:
+    """
+    Every term must be a substring of `text`. Return the score of the best
+    occurrence of each term, which is higher for matches at word starts and
+    for terms that follow each other closely, or 0 if any term does not match.
+    """
+    score = 0
+    prev_end = -1
+    for term in terms:
+        pos = text.find(term)
+        if pos < 0:
+            return 0
+
+        best_score = None
+        best_pos = pos
+        for _ in range(_MAX_OCCURRENCES):
+            term_score = _score_term(text, term, pos, prev_end)
+            if best_score is None or term_score > best_score:
+                best_score = term_score
+                best_pos = pos
+            pos = text.find(term, pos + 1)
+            if pos < 0:
+                break
+
+        assert best_score is not None
+        score += best_score
+        prev_end = best_pos + len(term)
+
+    # Matched items always rank above 0.
+    return max(score, 1)
+
+
+class ItemMatcher:
+    """
+    Matches menu items against the search pattern.
+
+    The text of each item is computed once and cached until the items change.
+    When a fuzzy pattern extends the previous one, only the previously matched
+    items (and the items appended since then) need to be checked again.
+    """
+
+    def __init__(self, fuzzy=True, cache_texts=True):
+        self.fuzzy = fuzzy
+
+        # Caching the texts keeps every item alive, which is not wanted for
+        # items that are not all kept in memory, e.g. a `LineStore`.
+        self.cache_texts = cache_texts
+
+        # Items and their texts (lower-cased for fuzzy search) when last matched.
+        self.__items: List[Any] = []
+        self.__texts: List[str] = []
+
+        self.__last_patt: Optional[str] = None
+        self.__last_matched_indices: List[int] = []
+        self.__last_item_count = 0
+
+        self.__patt: Optional[str] = None
+        self.__terms: List[str] = []
+        self.__regex: Optional[re.Pattern] = None
+
+    def invalidate(self):
+        self.__items.clear()
+        self.__texts.clear()
+        self.__last_patt = None
+
+    def __get_text(self, item: Any) -> str:
+        return str(item).lower() if self.fuzzy else str(item)
+
+    def update_items(self, items: List[Any]) -> bool:
+        """
+        Sync the text cache with the items. Return True if no item has been
+        changed except new ones appended.
+        """
+        if not self.cache_texts:
+            return False
+
+        # Items are compared by identity, since equal items may have been
+        # replaced. Call `invalidate()` after changing the items in place.
+        n = len(self.__items)
+        unchanged = len(items) >= n and all(map(operator.is_, items, self.__items))
+        if not unchanged:
+            self.__items = list(items)
+            self.__texts = [self.__get_text(item) for item in items]
+            self.__last_patt = None
+        elif len(items) > n:
+            appended = items[n:]
+            self.__items.extend(appended)
+            self.__texts.extend(self.__get_text(item) for item in appended)
+        return unchanged
+
+    def get_candidates(self, patt: str, items: List[Any]) -> Iterable[int]:
+        """
+        Return the indices of the items that may match the pattern.
+        """
+        if (
+            self.update_items(items)
+            and self.fuzzy
+            and self.__last_patt
+            and patt.lower().startswith(self.__last_patt.lower())
+            and not _is_index_pattern(self.__last_patt)
+            and not _is_index_pattern(patt)
+        ):
+            return self.__last_matched_indices + list(
+                range(self.__last_item_count, len(items))
+            )
+        else:
+            return range(len(items))
+
+    def set_matched_indices(self, patt: str, indices: Iterable[int], item_count: int):
+        """
+        Remember the indices of the first `item_count` items that matched the
+        pattern. The items after them are candidates for the next pattern.
+        """
+        self.__last_patt = patt
+        self.__last_matched_indices = sorted(indices)
+        self.__last_item_count = item_count
+
+    def __compile(self, patt: str):
+        if patt == self.__patt:
+            return
+
+        self.__patt = patt
+        if self.fuzzy:
+            self.__terms = [term for term in patt.lower().split(" ") if term]
+        else:
+            try:
+                self.__regex = re.compile(patt, re.IGNORECASE) if patt else None
+            except re.error:
+                self.__regex = None
+
+    def get_line_regex(self, patt: str) -> Optional[re.Pattern]:
+        """
+        Return the regex that a whole block of lines can be searched with, so
+        that each line matches if and only if `match()` would return a rank
+        greater than 0, or None if the pattern is not a valid regex.
+        """
+        if self.fuzzy or not patt or _is_index_pattern(patt):
+            return None
+        try:
+            return re.compile(patt, re.IGNORECASE | re.MULTILINE)
+        except re.error:
+            return None
+
+    def match(self, patt: str, item: Any, index: int) -> int:
+        """
+        Return the rank of the item: greater than 0 if the item matches the
+        pattern, 0 otherwise.
+        """
+        if _is_index_pattern(patt):
+            return 1 if int(patt[1:]) == index + 1 else 0
+
+        if not patt:
+            return 1
+
+        if index < len(self.__items) and self.__items[index] is item:
+            text = self.__texts[index]
+        else:
+            text = self.__get_text(item)
+            # Cache the text if the item is being appended.
+            if self.cache_texts and index == len(self.__items):
+                self.__items.append(item)
+                self.__texts.append(text)
+
+        self.__compile(patt)
+        if self.fuzzy:
+            return _rank_fuzzy(text, self.__terms)
+        elif self.__regex is not None:
+            return 1 if self.__regex.search(text) else 0
+        else:
+            return 0
@@ -7,10 +7,10 @@ import re
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 from queue import Queue
 from typing import (
-    Any,
     Callable,
     Dict,
     Generic,
@@ -33,11 +33,15 @@ from utils.jsonutil import load_json, save_json
 from utils.slugify import slugify
 from utils.term import enable_windows_vt
 
+from .linestore import LineSource, SearchProgressCallback
+from .matcher import ItemMatcher
+
 EXPERIMENTAL_EANBLE_WINDOWS_VT = True
 
 GUTTER_SIZE = 1
 PASTE_THRESHOLD_SEC = 0.05
 PROCESS_EVENT_INTERVAL_SEC = 0.1
+SEARCH_CHUNK_SIZE = 5000
 SHIFT_DOWN = 0x150
 SHIFT_UP = 0x151
 KEY_A2 = 450
@@ -190,33 +194,6 @@ class _Command:
             return self.name
 
 
-def _match_fuzzy(item: Any, patt: str) -> bool:
-    patt = patt.lower()
-    if not patt:
-        return True
-    else:
-        return all([(x in str(item).lower()) for x in patt.split(" ")])
-
-
-def _match_regex(item: Any, patt: str) -> bool:
-    if not patt:
-        return True
-    else:
-        try:
-            return re.search(patt, str(item), re.IGNORECASE) is not None
-        except re.error:
-            return False
-
-
-def _match(item: Any, patt: str, fuzzy_match: bool, index: int) -> bool:
-    if patt[:1] == ":" and patt[1:].isdigit():
-        return int(patt) == index + 1
-    elif fuzzy_match:
-        return _match_fuzzy(item, patt)
-    else:
-        return _match_regex(item, patt)
-
-
 def _to_curses_color(color: Union[str, int]) -> int:
     if isinstance(color, int):
         if color >= curses.COLORS:
@@ -431,6 +408,7 @@ class Menu(Generic[T]):
         prompt_color="white",
         follow=False,
         auto_complete=False,
+        async_search=False,
     ):
         self.close_on_selection: bool = close_on_selection
         self.is_cancelled: bool = False
@@ -461,6 +439,10 @@ class Menu(Generic[T]):
         self.__last_selected_item: Optional[T] = None
         self.__line_number = line_number
         self.__matched_item_indices: List[int] = []
+
+        # True if all items match the search pattern, in which case the matched
+        # indices are not stored, since there can be millions of items.
+        self.__match_all = False
         self.__message: Optional[str] = None
         self.__num_rendered_items: int = 0
         self.__on_item_selected = on_item_selected
@@ -471,7 +453,16 @@ class Menu(Generic[T]):
         # Search
         self.__search_mode = search_mode
         self.__search_on_enter: bool = search_on_enter
-        self.__fuzzy_search = fuzzy_search
+        self.__matcher = ItemMatcher(
+            fuzzy=fuzzy_search, cache_texts=not isinstance(self.items, LineSource)
+        )
+        self.__matcher_lock = threading.RLock()
+
+        # Match items on a worker thread to keep the UI responsive. Auto
+        # complete requires the best match right away so it's not supported.
+        self.__async_search = async_search and not auto_complete
+        self.__search_cancel_event: Optional[threading.Event] = None
+        self.__search_progress: Optional[float] = None
 
         # Scroll
         self.__scroll_y: int = 0
@@ -679,11 +670,11 @@ class Menu(Generic[T]):
             int: rank: greater than 0 if the item matches the pattern, 0 otherwise. Results will be ordered by rank from high to low.
         """
 
-        s = str(item)
-        return 1 if _match(s, patt, fuzzy_match=self.__fuzzy_search, index=index) else 0
+        with self.__matcher_lock:
+            return self.__matcher.match(patt, item, index)
 
     def get_item_indices(self):
-        if self.__search_mode:
+        if self.__search_mode and not self.__match_all:
             return self.__matched_item_indices
         else:
             return range(len(self.items))
@@ -694,13 +685,14 @@ class Menu(Generic[T]):
         added_index = self.__last_item_count - 1
 
         # Scroll to bottom if last line is selected
-        if self.__search_mode:
+        if self.__search_mode and not self.__match_all:
             if self.match_item(self.__input.text, item, added_index):
                 self.__matched_item_indices.append(added_index)
 
         self.update_screen()
 
     def clear_items(self):
+        self.__cancel_search()
         self.items.clear()
         self.__last_item_count = 0
         self.__matched_item_indices.clear()
@@ -736,9 +728,9 @@ class Menu(Generic[T]):
                 self.set_input("")
                 self.reset_selection()
             elif self.__selected_row_end >= 0 and self.__selected_row_end < len(
-                self.__matched_item_indices
+                self.get_item_indices()
             ):  # select the same item when filter is removed
-                row_number = self.__matched_item_indices[self.__selected_row_end]
+                row_number = self.get_item_indices()[self.__selected_row_end]
                 self.set_input("")
                 self.set_selected_row(row_number)
             else:
@@ -939,6 +931,9 @@ class Menu(Generic[T]):
         self.__last_input = self.__input.text
 
     def refresh(self):
+        """
+        Match all the items again, e.g. after they have been changed in place.
+        """
         self.__update_matched_items(force_update=True)
 
     def __set_selection_by_offset(self, offset: int, multi_select: bool):
@@ -966,6 +961,10 @@ class Menu(Generic[T]):
         if self.__closed:
             return True
 
+        # Do not wait for the keyboard input if any event has been processed.
+        if self.__process_posted_events():
+            timeout_sec = 0.0
+
         if timeout_sec > 0.0:
             Menu._stdscr.timeout(int(timeout_sec * 1000.0))
         else:
@@ -1178,6 +1177,14 @@ class Menu(Generic[T]):
     def post_event(self, func: Callable[[], None]) -> None:
         self.__event_queue.put(func)
 
+    def __process_posted_events(self) -> bool:
+        has_event = False
+        while not self.__event_queue.empty():
+            has_event = True
+            event = self.__event_queue.get()
+            event()
+        return has_event
+
     def __update_matched_items(self, save_search_history=True, force_update=False):
         if self.__search_mode:
             if (
@@ -1195,19 +1202,25 @@ class Menu(Generic[T]):
                 )
                 or (len(self.items) < self.__last_item_count)
             ):
-                matches: List[Tuple[int, int]] = []  # list of tuple of index and rank
                 patt = (
                     self.__input.text[: self.__input.caret_pos]
                     if self.__auto_complete
                     else self.__input.text
                 )
-                for i, item in enumerate(self.items):
-                    rank = self.match_item(patt, item, i)
-                    if rank > 0:  # match
-                        matches.append((i, rank))
-                # Sort matches by rank in descending order, preserving order for equal ranks
-                matches = sorted(matches, key=lambda x: x[1], reverse=True)
-                self.__matched_item_indices[:] = [index for index, _ in matches]
+                self.__cancel_search()
+                if force_update:
+                    with self.__matcher_lock:
+                        self.__matcher.invalidate()
+                self.__match_all = not patt and type(self).match_item is Menu.match_item
+                if self.__match_all:
+                    self.__matched_item_indices.clear()
+                elif self.__async_search:
+                    self.__matched_item_indices.clear()
+                    self.__start_search(patt)
+                else:
+                    self.__matched_item_indices[:] = self.__match_items(
+                        patt, self.__copy_items()
+                    )
 
                 if self.__last_input != self.__input.text:
                     self.__selected_row_begin = 0
@@ -1230,7 +1243,7 @@ class Menu(Generic[T]):
                         # Avoid recursive update
                         self.__last_input = self.__input.text
                 else:
-                    total = len(self.__matched_item_indices)
+                    total = len(self.get_item_indices())
                     self.__selected_row_begin = clamp(
                         self.__selected_row_begin, 0, total - 1
                     )
@@ -1250,6 +1263,129 @@ class Menu(Generic[T]):
 
                 self.on_matched_items_updated()
 
+    def __copy_items(self) -> List[T]:
+        if isinstance(self.items, LineSource):
+            # Does not load the lines that are not in memory.
+            return self.items.copy()  # type: ignore
+        else:
+            return list(self.items)
+
+    def __match_items(
+        self,
+        patt: str,
+        items: List[T],
+        cancel_event: Optional[threading.Event] = None,
+        on_progress: Optional[SearchProgressCallback] = None,
+    ) -> List[int]:
+        """
+        Return the indices of the matched items ordered by rank, or an empty
+        list if cancelled.
+        """
+        if isinstance(items, LineSource) and type(self).match_item is Menu.match_item:
+            # Search the lines in blocks instead of one by one.
+            with self.__matcher_lock:
+                regex = self.__matcher.get_line_regex(patt)
+            if regex is not None:
+                return items.search(
+                    regex, cancel_event=cancel_event, on_progress=on_progress
+                )
+
+        matches: List[Tuple[int, int]] = []  # list of tuple of index and rank
+
+        with self.__matcher_lock:
+            # Only narrow down the previous matches if `match_item()` is not
+            # overridden, as custom matching may not be monotonic.
+            if type(self).match_item is Menu.match_item:
+                candidates = list(self.__matcher.get_candidates(patt, items))
+            else:
+                self.__matcher.update_items(items)
+                candidates = list(range(len(items)))
+
+        for begin in range(0, len(candidates), SEARCH_CHUNK_SIZE):
+            if cancel_event is not None and cancel_event.is_set():
+                return []
+
+            with self.__matcher_lock:
+                for i in candidates[begin : begin + SEARCH_CHUNK_SIZE]:
+                    rank = self.match_item(patt, items[i], i)
+                    if rank > 0:  # match
+                        matches.append((i, rank))
+
+            if on_progress is not None:
+                on_progress(
+                    lambda: [
+                        index for index, _ in sorted(matches, key=lambda x: -x[1])
+                    ],
+                    min(1.0, (begin + SEARCH_CHUNK_SIZE) / len(candidates)),
+                )
+
+        with self.__matcher_lock:
+            # Items appended during an async search are not in `items` and
+            # remain candidates for the next narrowed search.
+            self.__matcher.set_matched_indices(
+                patt, (i for i, _ in matches), item_count=len(items)
+            )
+
+        # Sort matches by rank in descending order, preserving order for equal ranks
+        matches = sorted(matches, key=lambda x: x[1], reverse=True)
+        return [index for index, _ in matches]
+
+    def __cancel_search(self):
+        if self.__search_cancel_event is not None:
+            self.__search_cancel_event.set()
+            self.__search_cancel_event = None
+            self.__search_progress = None
+
+    def __start_search(self, patt: str):
+        cancel_event = threading.Event()
+        self.__search_cancel_event = cancel_event
+        self.__search_progress = 0.0
+        items = self.__copy_items()
+        last_update_time = 0.0
+
+        def on_search_result(indices: List[int], progress: float):
+            if cancel_event.is_set():
+                return
+
+            if progress >= 1.0:
+                # Match the items appended during the search.
+                for i in range(len(items), len(self.items)):
+                    if self.match_item(patt, self.items[i], i) > 0:
+                        indices.append(i)
+                self.__search_cancel_event = None
+                self.__search_progress = None
+            else:
+                self.__search_progress = progress
+
+            self.__matched_item_indices[:] = indices
+            total = len(indices)
+            self.__selected_row_begin = clamp(self.__selected_row_begin, 0, total - 1)
+            self.__selected_row_end = clamp(self.__selected_row_end, 0, total - 1)
+            self._check_if_item_selection_changed()
+            self.update_screen()
+
+            if progress >= 1.0:
+                self.on_matched_items_updated()
+
+        def on_progress(get_indices: Callable[[], List[int]], progress: float):
+            nonlocal last_update_time
+
+            # Stream partial results to the UI thread, but not too often.
+            now = time.time()
+            if progress < 1.0 and now - last_update_time > PROCESS_EVENT_INTERVAL_SEC:
+                last_update_time = now
+                indices = get_indices()
+                self.post_event(lambda: on_search_result(indices, progress))
+
+        def search():
+            indices = self.__match_items(
+                patt, items, cancel_event=cancel_event, on_progress=on_progress
+            )
+            if not cancel_event.is_set():
+                self.post_event(lambda: on_search_result(indices, 1.0))
+
+        threading.Thread(target=search, daemon=True).start()
+
     def on_escape_pressed(self):
         if "escape" in self.__hotkeys:
             logging.debug("Hotkey pressed: escape")
@@ -1329,14 +1465,7 @@ class Menu(Generic[T]):
         self.on_main_loop()
         done = False
         while not done:
-            has_event = False
-            while not self.__event_queue.empty():
-                has_event = True
-                event = self.__event_queue.get()
-                event()
-            done = self.process_events(
-                timeout_sec=0.0 if has_event else PROCESS_EVENT_INTERVAL_SEC
-            )
+            done = self.process_events(timeout_sec=PROCESS_EVENT_INTERVAL_SEC)
             self.on_main_loop()
         self.on_close()
 
@@ -1714,6 +1843,8 @@ class Menu(Generic[T]):
                 indicators.append("F")
             indicators.append(f"{current_position}/{total_items}")
             status += " ".join(indicators)
+        if self.__search_progress is not None:
+            status += f" searching {self.__search_progress:.0%}"
         return status
 
     def get_selected_item(self, ignore_cancellation=False) -> Optional[T]:
@@ -1898,6 +2029,8 @@ class Menu(Generic[T]):
             self.update_screen()
 
     def get_row_count(self):
+        if self.__match_all:
+            return len(self.items)
         return len(self.__matched_item_indices)
 
     def get_line_number_text(self, item_index: int) -> str:
@@ -0,0 +1,119 @@
+import re
+from typing import Dict, Generic, Iterator, List, Optional, Tuple, TypeVar
+
+try:
+    import re._constants as sre_constants
+    import re._parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_constants  # type: ignore
+    import sre_parse  # type: ignore
+
+T = TypeVar("T")
+
+
+def _get_required_literals(items) -> List[str]:
+    """
+    Return the literal strings that any match of the parsed pattern must
+    contain. Only the parts of the pattern that are always matched are
+    considered, e.g. branches and optional groups are skipped.
+    """
+    literals: List[str] = []
+    current = ""
+
+    def flush():
+        nonlocal current
+        if current:
+            literals.append(current)
+        current = ""
+
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            current += chr(av)
+        elif op == sre_constants.SUBPATTERN:
+            _, add_flags, _, p = av
+            flush()
+            if not add_flags & sre_constants.SRE_FLAG_IGNORECASE:
+                literals.extend(_get_required_literals(p))
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT):
+            min_count, _, p = av
+            flush()
+            if min_count >= 1:
+                literals.extend(_get_required_literals(p))
+        elif op == sre_constants.AT:
+            # Anchors do not consume any character.
+            pass
+        else:
+            flush()
+    flush()
+    return literals
+
+
+def get_required_literal(regex: re.Pattern) -> Optional[str]:
+    """
+    Return the longest literal string that must be contained in the text for
+    the regex to match, or None if there is no such literal.
+    """
+    # Case-insensitive matching has too many corner cases, e.g. "ſ" matches "s".
+    if regex.flags & re.IGNORECASE:
+        return None
+
+    try:
+        parsed = sre_parse.parse(regex.pattern, regex.flags)
+    except Exception:
+        return None
+
+    literals = _get_required_literals(parsed)
+    if not literals:
+        return None
+    return max(literals, key=len)
+
+
+class PatternSet(Generic[T]):
+    """
+    A set of regex patterns, each associated with one or more values, that are
+    matched against the same text in one pass.
+
+    Identical patterns are only matched once, and patterns are skipped unless
+    the text contains their required literal string.
+    """
+
+    def __init__(self) -> None:
+        # (pattern, flags) -> (regex, required literal, values)
+        self.__patterns: Dict[
+            Tuple[str, int], Tuple[re.Pattern, Optional[str], List[T]]
+        ] = {}
+
+    def add(self, pattern: str, value: T, flags=0):
+        key = (pattern, flags)
+        if key in self.__patterns:
+            self.__patterns[key][2].append(value)
+            return
+
+        regex = re.compile(pattern, flags)
+        self.__patterns[key] = (regex, get_required_literal(regex), [value])
+
+    def __len__(self) -> int:
+        return sum(len(values) for _, _, values in self.__patterns.values())
+
+    def __iter_candidates(self, s: str) -> Iterator[Tuple[re.Pattern, List[T]]]:
+        for regex, literal, values in self.__patterns.values():
+            if literal is None or literal in s:
+                yield regex, values
+
+    def finditer(self, s: str) -> Iterator[Tuple[T, re.Match]]:
+        """
+        Yield all (value, match) pairs of all matching patterns.
+        """
+        for regex, values in self.__iter_candidates(s):
+            matches = list(regex.finditer(s))
+            for value in values:
+                for match in matches:
+                    yield value, match
+
+    def search(self, s: str) -> Iterator[T]:
+        """
+        Yield the values of the patterns that match the text.
+        """
+        for regex, values in self.__iter_candidates(s):
+            if regex.search(s):
+                yield from values
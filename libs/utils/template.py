@@ -1,28 +1,100 @@
 import logging
 import re
 import subprocess
+from functools import lru_cache
+from types import CodeType
 from typing import Any, Callable, Dict, List, Optional, Tuple
 
 
+VARIABLE_NAME_REGEX = "[_a-zA-Z]\\w*"
+
+_DELIMITER = re.compile(r"{{(.*?)}}", re.DOTALL)
+_ASSIGNMENT = re.compile(rf"({VARIABLE_NAME_REGEX})\s*=\s*(.+)", re.DOTALL)
+_FOR_LOOP = re.compile(f"for ({VARIABLE_NAME_REGEX}) in (.+)", re.DOTALL)
+
+# Node types of a compiled template.
+_TEXT = 0  # (_TEXT, text)
+_EXPR = 1  # (_EXPR, code)
+_ASSIGN = 2  # (_ASSIGN, variable_name, code)
+_IF = 3  # (_IF, code, body, else_body)
+_FOR = 4  # (_FOR, variable_name, code, body)
+
+_Node = Tuple[Any, ...]
+
+
+def _compile_code(source: str) -> CodeType:
+    # Same as `eval()` on a string, ignore the leading spaces and tabs.
+    return compile(source.lstrip(" \t"), "<template>", "eval")
+
+
+def _compile_nodes(
+    tokens: List[Tuple[bool, str]], pos: int, stop_tokens: Tuple[str, ...]
+) -> Tuple[List[_Node], int, Optional[str]]:
+    """
+    Compile the tokens starting at `pos` until one of the `stop_tokens`.
+
+    Returns the compiled nodes, the position after the stop token and the stop
+    token (None if the end of the template is reached).
+    """
+    nodes: List[_Node] = []
+    while pos < len(tokens):
+        is_code, token = tokens[pos]
+        pos += 1
+        if not is_code:
+            nodes.append((_TEXT, token))
+        elif token in stop_tokens:
+            return nodes, pos, token
+        elif token == "else" or token == "end":
+            raise Exception(f'Unexpected "{{{{{token}}}}}"')
+        elif token.startswith("#"):
+            pass
+        elif match := _ASSIGNMENT.match(token):
+            nodes.append((_ASSIGN, match.group(1), _compile_code(match.group(2))))
+        elif token.startswith("if "):
+            body, pos, stop_token = _compile_nodes(tokens, pos, ("else", "end"))
+            else_body: List[_Node] = []
+            if stop_token == "else":
+                else_body, pos, stop_token = _compile_nodes(tokens, pos, ("end",))
+            if stop_token != "end":
+                raise Exception('Expect "{{end}}"')
+            nodes.append((_IF, _compile_code(token[3:]), body, else_body))
+        elif match := _FOR_LOOP.match(token):
+            body, pos, stop_token = _compile_nodes(tokens, pos, ("end",))
+            if stop_token != "end":
+                raise Exception('Expect "{{end}}"')
+            nodes.append((_FOR, match.group(1), _compile_code(match.group(2)), body))
+        else:
+            nodes.append((_EXPR, _compile_code(token)))
+    return nodes, pos, None
+
+
+@lru_cache(maxsize=256)
+def _compile_template(text: str) -> List[_Node]:
+    tokens: List[Tuple[bool, str]] = []
+    for index, token in enumerate(_DELIMITER.split(text)):
+        if index % 2 == 0:
+            # plain string
+            if token:
+                tokens.append((False, token))
+        else:
+            # code block
+            tokens.append((True, token))
+
+    nodes, _, _ = _compile_nodes(tokens, 0, ())
+    return nodes
+
+
 class Template:
     """Compile an text into a template function"""
 
     def __init__(self, text: str, file_locator: Optional[Callable[[str], str]] = None):
-        self.delimiter = re.compile(r"{{(.*?)}}", re.DOTALL)
-        self.tokens = self.compile(text)
+        self.nodes = self.compile(text)
         self.file_locator = file_locator
 
-    def compile(self, text) -> List[Tuple[bool, str]]:
-        tokens: List[Tuple[bool, str]] = []
-        for index, token in enumerate(self.delimiter.split(text)):
-            if index % 2 == 0:
-                # plain string
-                if token:
-                    tokens.append((False, token))
-            else:
-                # code block
-                tokens.append((True, token))
-        return tokens
+    def compile(self, text) -> List[_Node]:
+        # Templates are compiled only once, e.g. the script config patterns
+        # that are rendered every time the scripts are reloaded.
+        return _compile_template(text)
 
     def render(
         self,
@@ -33,8 +105,6 @@ class Template:
     ):
         """Render the template according to the given context"""
 
-        VARIABLE_NAME_REGEX = "[_a-zA-Z]\\w*"
-
         global_context = {}
         if context:
             global_context.update(context)
@@ -79,12 +149,9 @@ class Template:
 
         global_context["shell"] = shell
 
-        # Evaluated result.
-        result: List[str] = []
-
-        def eval_code(source: str) -> Optional[Any]:
+        def eval_code(code: CodeType) -> Optional[Any]:
             try:
-                ret = eval(source, global_context)
+                ret = eval(code, global_context)
                 if ret is not None:
                     return ret
             except NameError as ex:
@@ -100,65 +167,35 @@ class Template:
                     raise
             return None
 
-        def eval_tokens(tokens: List[Tuple[bool, str]], should_eval=True) -> List[str]:
-            result: List[str] = []
-            while len(tokens) > 0:
-                is_code, token = tokens.pop(0)
-                if not is_code:
-                    result.append(token)
-                else:
-                    if token.startswith("#"):
-                        pass
-                    elif match := re.match(
-                        rf"({VARIABLE_NAME_REGEX})\s*=\s*(.+)", token
-                    ):
-                        variable_name = match.group(1)
-                        expr = match.group(2)
-                        val = eval(expr, global_context)
+        # Evaluated result.
+        result: List[str] = []
+
+        def eval_nodes(nodes: List[_Node]):
+            for node in nodes:
+                node_type = node[0]
+                if node_type == _TEXT:
+                    result.append(node[1])
+                elif node_type == _EXPR:
+                    ret = eval_code(node[1])
+                    if ret is not None:
+                        result.append(str(ret))
+                elif node_type == _ASSIGN:
+                    global_context[node[1]] = eval(node[2], global_context)
+                elif node_type == _IF:
+                    try:
+                        cond = eval(node[1], global_context)
+                    except NameError as ex:
+                        logging.warning(f"{ex}")
+                        cond = False
+                    eval_nodes(node[2] if cond else node[3])
+                elif node_type == _FOR:
+                    variable_name, body = node[1], node[3]
+                    for val in eval(node[2], global_context):
                         global_context[variable_name] = val
-                    elif token.startswith("if "):
-                        condition = token[3:]
-                        try:
-                            cond = eval(condition, global_context)
-                        except NameError as ex:
-                            logging.warning(f"{ex}")
-                            cond = False
-                        result.extend(eval_tokens(tokens=tokens, should_eval=cond))
-                        is_code, token = tokens.pop(0)
-                        if (is_code, token) == (True, "else"):
-                            result.extend(
-                                eval_tokens(tokens=tokens, should_eval=not cond)
-                            )
-                            is_code, token = tokens.pop(0)
-                        if (is_code, token) != (True, "end"):
-                            raise Exception('Expect "{{end}}"')
-                    elif token == "else":
-                        tokens.insert(0, (True, "else"))
-                        return result if should_eval else []
-                    elif match := re.match(
-                        f"for ({VARIABLE_NAME_REGEX}) in (.+)", token
-                    ):
-                        variable_name = match.group(1)
-                        iterable = match.group(2)
-                        tokens_copy = tokens.copy()
-                        for val in eval(iterable, global_context):
-                            global_context[variable_name] = val
-                            tokens[:] = tokens_copy
-                            result.extend(eval_tokens(tokens=tokens))
-                        is_code, token = tokens.pop(0)
-                        assert (is_code, token) == (True, "end")
-                    elif token == "end":
-                        tokens.insert(0, (True, "end"))
-                        return result if should_eval else []
-                    else:
-                        ret = eval_code(source=token)
-                        if ret is not None:
-                            result.append(ret)
-
-            return result if should_eval else []
-
-        result = eval_tokens(tokens=self.tokens)
-        return "".join([str(x) for x in result])
+                        eval_nodes(body)
+
+        eval_nodes(self.nodes)
+        return "".join(result)
 
     # make instance callable
     __call__ = render
@@ -5,19 +5,34 @@ from typing import Optional
 _RE_NEWLINES = re.compile(r"[\r\n]+")
 
 
+def _collapse_whitespace(text: str) -> str:
+    text = _RE_NEWLINES.sub(" ↵ ", text.strip())
+    return " ".join(text.split())
+
+
 def truncate_text(
     text: str,
     max_chars: int = 240,
     max_lines: Optional[int] = None,
     include_line_count: bool = True,
 ) -> str:
+    if max_lines is None:
+        # Only the beginning of a long text is shown, so only collapse as much of
+        # it as needed. The result for a prefix is a prefix of the full result.
+        size = max_chars * 4
+        while size < len(text):
+            s = _collapse_whitespace(text[:size])
+            if len(s) > max_chars:
+                prefix = f"({len(text.splitlines())}) " if include_line_count else ""
+                return f"{prefix}{s[:max_chars]}.."
+            size *= 2
+
     lines = text.splitlines()
     n_lines = len(lines)
     if max_lines is not None and n_lines > max_lines:
         text = "\n".join(lines[:max_lines])
 
-    text = _RE_NEWLINES.sub(" ↵ ", text.strip())
-    text = " ".join(text.split())
+    text = _collapse_whitespace(text)
 
     if len(text) > max_chars or (max_lines and n_lines > max_lines):
         prefix = f"({n_lines}) " if include_line_count else ""
@@ -12,7 +12,7 @@ import sys
 import threading
 import time
 import traceback
-from typing import Any, Dict, List, Optional
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Set, Tuple
 
 
 MYSCRIPT_ROOT = os.path.dirname(os.path.abspath(__file__))
@@ -38,7 +38,6 @@ from _script import (
     update_variables,
 )
 from _scriptmanager import execute_script, ScriptManager
-from _scriptserver import ScriptServer
 from _shutil import (
     append_to_path_global,
     quote_arg,
@@ -67,11 +66,22 @@ from utils.term import hide_terminal_from_taskbar, set_terminal_title
 from utils.timeutil import time_diff_str
 from utils.tmux import has_tmux_session, is_in_tmux
 
+if TYPE_CHECKING:
+    from _scriptserver import ScriptServer
+
 
 _REFRESH_INTERVAL_SECS = 60
 
+# Script alias matches are ranked above any other matches.
+_ALIAS_MATCH_RANK = 1000
+
+# When script directories are being watched, only changed scripts are refreshed,
+# and a full refresh is rarely needed.
+_WATCH_REFRESH_INTERVAL_SECS = 600
+
 
-script_server: Optional[ScriptServer] = None
+script_server: Optional["ScriptServer"] = None
+script_manager: Optional[ScriptManager] = None
 
 
 def format_key_value_pairs(kvp):
@@ -144,8 +154,12 @@ def restart_program():
     if script_server is not None:
         script_server.stop_server()
 
+    if script_manager is not None:
+        script_manager.stop_watching_scripts()
+
     for t in threading.enumerate():
-        if t is not threading.main_thread():
+        # Daemon threads, e.g. the directory watchers, may block on I/O forever.
+        if t is not threading.main_thread() and not t.daemon:
             logging.debug(f"Waiting {t} to exit...")
             t.join()
 
@@ -297,11 +311,25 @@ class _MyScriptMenu(Menu[Script]):
     def on_main_loop(self):
         # Reload scripts
         now = time.time()
-        if (
-            now - self.last_key_pressed_timestamp > _REFRESH_INTERVAL_SECS
-            and now - self.last_refresh_time > _REFRESH_INTERVAL_SECS
+        refresh_interval = (
+            _WATCH_REFRESH_INTERVAL_SECS
+            if self.script_manager.is_watching_scripts()
+            else _REFRESH_INTERVAL_SECS
+        )
+        if self.is_refreshing:
+            # Keep the changed files until the next reload can start.
+            pass
+        elif (
+            now - self.last_key_pressed_timestamp > refresh_interval
+            and now - self.last_refresh_time > refresh_interval
         ):
+            # The full reload covers all the changed files.
+            self.script_manager.pop_changed_files()
             self._reload_scripts()
+        else:
+            changed_files = self.script_manager.pop_changed_files()
+            if changed_files:
+                self._reload_scripts(changed_files=changed_files)
 
         for script in self.script_manager.get_scheduled_scripts_to_run():
             try:
@@ -313,12 +341,13 @@ class _MyScriptMenu(Menu[Script]):
 
     def match_item(self, keyword: str, script: Script, index: int) -> int:
         if len(keyword) > 0 and script.alias == keyword:
-            return 2
+            return _ALIAS_MATCH_RANK
         else:
-            if script.match_pattern(keyword):
+            rank = super().match_item(patt=keyword, item=script, index=index)
+            if rank == 0 and script.match_pattern(keyword):
                 return 1
             else:
-                return super().match_item(patt=keyword, item=script, index=index)
+                return rank
 
     def get_item_metadata(self, script: Script) -> str:
         return f"<file><path>{script.script_path}</path></file>"
@@ -390,7 +419,7 @@ class _MyScriptMenu(Menu[Script]):
                 name="run: " + script.name,
             )
 
-    def _reload_scripts(self):
+    def _reload_scripts(self, changed_files: Optional[Set[Tuple[str, str]]] = None):
         if self.is_refreshing:
             return
 
@@ -403,14 +432,18 @@ class _MyScriptMenu(Menu[Script]):
             self.set_message(f"reloading script: {i + 1}")
 
         self.script_manager.refresh_all_scripts(
-            on_progress=on_progress, on_register_hotkeys=self._on_register_hotkeys
+            on_progress=on_progress,
+            on_register_hotkeys=self._on_register_hotkeys,
+            changed_files=changed_files,
         )
         self.set_message("scripts reloaded")
         self.update_last_refresh_time()
         self.is_refreshing = False
 
+        # Script names may change when scripts are reloaded.
+        self.refresh()
+
         if self.__run_script_and_quit:
-            self.refresh()
             if self.get_row_count() == 1:
                 self._run_selected_script()
 
@@ -631,6 +664,7 @@ class _MyScriptMenu(Menu[Script]):
 
 def _main():
     global script_server
+    global script_manager
 
     log_file = os.path.join(get_data_dir(), "myscripts.log")
     setup_logger(log_to_stderr=False, log_file=log_file)
@@ -766,6 +800,8 @@ def _main():
     script_manager = ScriptManager(start_daemon=start_daemon, startup=args.startup)
 
     if start_daemon:
+        from _scriptserver import ScriptServer
+
         script_server = ScriptServer(script_manager=script_manager)
         script_server.start_server()
 
@@ -773,6 +809,9 @@ def _main():
         bool(args.input) or args.quit or bool(args.args) or bool(args.out_to_file)
     )
 
+    if not run_script_and_quit:
+        script_manager.start_watching_scripts()
+
     try:
         _MyScriptMenu(
             cmdline_args=args.args,
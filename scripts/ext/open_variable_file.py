@@ -1,6 +1,9 @@
 from utils.editor import open_code_editor
+from utils.jsonstore import get_json_store
 from utils.script.path import get_variable_file
 
 if __name__ == "__main__":
     f = get_variable_file()
+    # Merge the pending updates so that the file being edited is up to date.
+    get_json_store(f).compact()
     open_code_editor(f)
@@ -3,8 +3,11 @@ import glob
 import os
 import shlex
 import sys
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, TypedDict, cast
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypedDict, cast
 
 import ai.chat_menu
 import ai.utils.tools.bash
@@ -41,6 +44,13 @@ from utils.strutil import to_ordinal
 MODULE_NAME = Path(__file__).stem
 DATA_DIR = os.path.join(".config", MODULE_NAME)
 
+# Tools that only read local files and never touch the UI, so that they can run
+# at the same time. "web_fetch" and "web_search" are excluded because they open
+# menus to show progress and to retry failed requests.
+PARALLEL_SAFE_TOOLS = ["read", "grep", "glob", "list"]
+
+_MAX_PARALLEL_TOOLS = 8
+
 
 def _get_prompt(
     tools: Optional[List[ToolDefinition]] = None,
@@ -118,6 +128,16 @@ def load_subagents() -> List[_Subagent]:
     return subagents
 
 
+@dataclass
+class _ToolCall:
+    tool_use: ToolUse
+    ret: Any = None
+    error: Optional[Exception] = None
+    interrupted: bool = False
+    declined: bool = False
+    duration: Optional[float] = None
+
+
 class AgentMenu(ChatMenu):
     def __init__(
         self,
@@ -233,6 +253,132 @@ class AgentMenu(ChatMenu):
             memory=self.get_settings().get("memory", False),
         )
 
+    def __is_parallel_safe(self, tool_use: ToolUse) -> bool:
+        tool_name = tool_use["tool_name"]
+        if not self.__yes_always or tool_name not in PARALLEL_SAFE_TOOLS:
+            return False
+
+        if not any(t.__name__ == tool_name for t in self.get_tools_callable()):
+            return False
+
+        # Reading a skill may add MCP servers and allowed commands.
+        if tool_name == "read" and self.get_settings()["skill"]:
+            file = tool_use["args"].get("file")
+            if any(s.file_path == file for s in get_skills()):
+                return False
+
+        return True
+
+    def __call_tool(self, call: _ToolCall):
+        tool_use = call.tool_use
+        start = time.perf_counter()
+        try:
+            tool_name = tool_use["tool_name"]
+            tool = next(
+                (t for t in self.get_tools_callable() if t.__name__ == tool_name),
+                None,
+            )
+            if tool:  # Call function tool
+                if tool_name in ["bash", "powershell"]:
+                    ConfirmCommandMenu.confirm_command(
+                        command=tool_use["args"]["command"],
+                        allowed_commands=ALLOWED_COMMANDS,
+                        save_path=str(ALLOWED_COMMANDS_FILE),
+                    )
+
+                call.ret = tool(**tool_use["args"])
+
+            else:  # Call MCP tool
+                client = next(
+                    (
+                        c
+                        for c in self.__mcp_clients
+                        if any(t.name == tool_use["tool_name"] for t in c.list_tools())
+                    ),
+                    None,
+                )
+                if client:
+                    call.ret = client.call_tool(tool_use)
+                else:
+                    subagent = next(
+                        a for a in self.__subagents if a["name"] == tool_name
+                    )
+                    menu = AgentMenu(
+                        system_prompt=subagent["system_prompt"],
+                        prompt=f"subagent={tool_name}",
+                        message=tool_use["args"]["prompt"],
+                        tools_callable=self.get_tools_callable(),
+                        yes_always=self.__yes_always,
+                        cancellable=True,
+                    )
+                    menu.exec()
+                    call.ret = menu.get_messages()[-1]["text"]
+
+        except Exception as ex:
+            call.error = ex
+        except KeyboardInterrupt:
+            call.interrupted = True
+        finally:
+            call.duration = time.perf_counter() - start
+
+    def __run_tools(self, tool_uses: List[ToolUse]) -> List[_ToolCall]:
+        """
+        Run the tool uses in order and return the calls that have been made.
+
+        Consecutive tool uses that only read are run at once in a thread pool.
+        The others, which may ask for confirmation or change files, are run one
+        at a time once all the tool uses before them are done.
+        """
+        calls: List[_ToolCall] = []
+        batch: List[Tuple[_ToolCall, Future]] = []
+
+        def wait_for_batch() -> bool:
+            try:
+                for _, future in batch:
+                    future.result()
+            except KeyboardInterrupt:
+                for call, future in batch:
+                    if not future.done():
+                        future.cancel()
+                        call.interrupted = True
+                return False
+            finally:
+                batch.clear()
+            return True
+
+        executor = ThreadPoolExecutor(max_workers=_MAX_PARALLEL_TOOLS)
+        try:
+            for tool_use in tool_uses:
+                call = _ToolCall(tool_use)
+                calls.append(call)
+
+                if self.__is_parallel_safe(tool_use):
+                    batch.append((call, executor.submit(self.__call_tool, call)))
+                    continue
+
+                if not wait_for_batch():
+                    calls.pop()
+                    break
+
+                if not self.__yes_always:
+                    menu = ConfirmMenu(f"Run tool ({tool_use['tool_name']})?")
+                    menu.exec()
+                    if not menu.is_confirmed():
+                        call.declined = True
+                        break
+
+                self.__call_tool(call)
+                if call.interrupted:
+                    break
+
+            wait_for_batch()
+
+        finally:
+            # The tools that have been interrupted cannot be stopped.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return calls
+
     def __handle_response(self):
         messages = self.get_messages()
         if len(messages) <= 0:
@@ -252,136 +398,80 @@ class AgentMenu(ChatMenu):
         )
 
         tool_results: List[ToolResult] = []
-        for i, tool_use in enumerate(tool_uses):
-            # Run tool
-            if not self.__yes_always:
-                menu = ConfirmMenu(f"Run tool ({tool_use['tool_name']})?")
-                menu.exec()
-                if menu.is_confirmed():
-                    should_run = True
+        for i, call in enumerate(self.__run_tools(tool_uses)):
+            tool_use = call.tool_use
+            if call.declined:
+                if self.get_settings()["function_call"]:
+                    tool_results.append(
+                        ToolResult(
+                            tool_use_id=tool_use["tool_use_id"],
+                            content="Tool was interrupted by user",
+                        )
+                    )
                 else:
-                    should_run = False
-                    if self.get_settings()["function_call"]:
-                        tool_results.append(
-                            ToolResult(
-                                tool_use_id=tool_use["tool_use_id"],
-                                content="Tool was interrupted by user",
-                            )
+                    reply += f"The {to_ordinal(i + 1)} tool ({tool_use['tool_name']}) was interrupted by user.\n"
+
+            elif call.interrupted:
+                interrupted = True
+                if self.get_settings()["function_call"]:
+                    tool_results.append(
+                        ToolResult(
+                            tool_use_id=tool_use["tool_use_id"],
+                            content="Tool was interrupted by user",
                         )
-                    else:
-                        reply += f"The {to_ordinal(i + 1)} tool ({tool_use['tool_name']}) was interrupted by user.\n"
-                    break
-            else:
-                should_run = True
-
-            if should_run:
-                try:
-                    tool_name = tool_use["tool_name"]
-                    tool = next(
-                        (
-                            t
-                            for t in self.get_tools_callable()
-                            if t.__name__ == tool_name
-                        ),
-                        None,
                     )
-                    if tool:  # Call function tool
-                        if tool_name in ["bash", "powershell"]:
-                            ConfirmCommandMenu.confirm_command(
-                                command=tool_use["args"]["command"],
-                                allowed_commands=ALLOWED_COMMANDS,
-                                save_path=str(ALLOWED_COMMANDS_FILE),
-                            )
-
-                        ret = tool(**tool_use["args"])
-
-                    else:  # Call MCP tool
-                        client = next(
-                            (
-                                c
-                                for c in self.__mcp_clients
-                                if any(
-                                    t.name == tool_use["tool_name"]
-                                    for t in c.list_tools()
-                                )
-                            ),
-                            None,
+                else:
+                    reply += f"The {to_ordinal(i + 1)} tool using {tool_use['tool_name']} was interrupted by user.\n"
+
+            elif call.error is not None:
+                has_error = True
+                if self.get_settings()["function_call"]:
+                    tool_results.append(
+                        ToolResult(
+                            tool_use_id=tool_use["tool_use_id"],
+                            content=str(call.error),
                         )
-                        if client:
-                            ret = client.call_tool(tool_use)
-                        else:
-                            subagent = next(
-                                a for a in self.__subagents if a["name"] == tool_name
-                            )
-                            menu = AgentMenu(
-                                system_prompt=subagent["system_prompt"],
-                                prompt=f"subagent={tool_name}",
-                                message=tool_use["args"]["prompt"],
-                                tools_callable=self.get_tools_callable(),
-                                yes_always=self.__yes_always,
-                                cancellable=True,
-                            )
-                            menu.exec()
-                            ret = menu.get_messages()[-1]["text"]
-
-                    if ret:
-                        ret_str = str(ret)
-                        if self.get_settings()["function_call"]:
-                            tool_result = ToolResult(
-                                tool_use_id=tool_use["tool_use_id"],
-                                content=ret_str,
-                            )
-                            if ret_str.startswith("data:image/"):
-                                tool_result["image_urls"] = [ret_str]
-                                tool_result["content"] = "Image content returned."
-                            tool_results.append(tool_result)
-                        else:
-                            reply += f"""The {to_ordinal(i + 1)} tool ({tool_use["tool_name"]}) returned:
+                    )
+                else:
+                    reply += f"""ERROR in the {to_ordinal(i + 1)} tool ({tool_use["tool_name"]}):
 -------
-{ret_str}
+{str(call.error)}
 -------
 
 """
 
-                    else:
-                        if self.get_settings()["function_call"]:
-                            tool_results.append(
-                                ToolResult(
-                                    tool_use_id=tool_use["tool_use_id"],
-                                    content="Tool completed",
-                                )
-                            )
-                        else:
-                            reply += f"The {to_ordinal(i + 1)} tool ({tool_use['tool_name']}) completed successfully.\n\n"
-
-                except Exception as ex:
-                    has_error = True
-                    if self.get_settings()["function_call"]:
-                        tool_results.append(
-                            ToolResult(
-                                tool_use_id=tool_use["tool_use_id"],
-                                content=str(ex),
-                            )
-                        )
-                    else:
-                        reply += f"""ERROR in the {to_ordinal(i + 1)} tool ({tool_use["tool_name"]}):
+            elif call.ret:
+                ret_str = str(call.ret)
+                if self.get_settings()["function_call"]:
+                    tool_result = ToolResult(
+                        tool_use_id=tool_use["tool_use_id"],
+                        content=ret_str,
+                    )
+                    if ret_str.startswith("data:image/"):
+                        tool_result["image_urls"] = [ret_str]
+                        tool_result["content"] = "Image content returned."
+                    tool_results.append(tool_result)
+                else:
+                    reply += f"""The {to_ordinal(i + 1)} tool ({tool_use["tool_name"]}) returned:
 -------
-{str(ex)}
+{ret_str}
 -------
 
 """
-                except KeyboardInterrupt:
-                    interrupted = True
-                    if self.get_settings()["function_call"]:
-                        tool_results.append(
-                            ToolResult(
-                                tool_use_id=tool_use["tool_use_id"],
-                                content="Tool was interrupted by user",
-                            )
+
+            else:
+                if self.get_settings()["function_call"]:
+                    tool_results.append(
+                        ToolResult(
+                            tool_use_id=tool_use["tool_use_id"],
+                            content="Tool completed",
                         )
-                    else:
-                        reply += f"The {to_ordinal(i + 1)} tool using {tool_use['tool_name']} was interrupted by user.\n"
-                    break
+                    )
+                else:
+                    reply += f"The {to_ordinal(i + 1)} tool ({tool_use['tool_name']}) completed successfully.\n\n"
+
+            if self.get_settings()["function_call"] and call.duration is not None:
+                tool_results[-1]["duration"] = call.duration
 
         if not reply:
             self.on_response(text_content, done=not reply and not tool_results)
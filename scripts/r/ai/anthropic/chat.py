@@ -10,15 +10,18 @@ from typing import (
     Optional,
 )
 
-import aiohttp
 from ai.utils.message import Message
 from ai.utils.tooluse import ToolDefinition, ToolUse
 from ai.utils.usagemetadata import UsageMetadata
-from utils.http import iter_lines
+from utils.http import RequestStats, iter_sse_events, post
 from utils.imagedataurl import parse_image_data_url
 
 DEFAULT_MODEL = "claude-3-7-sonnet-latest"
 
+# https://docs.anthropic.com/en/docs/build-with-claude/prompt-caching
+# The prefix of a request up to a breakpoint is cached, at most 4 breakpoints.
+_CACHE_CONTROL = {"type": "ephemeral"}
+
 
 def _to_claude_message_content(message: Message) -> List[Dict[str, Any]]:
     content = []
@@ -77,6 +80,34 @@ def _to_claude_message_content(message: Message) -> List[Dict[str, Any]]:
     return content
 
 
+def _set_cache_breakpoints(payload: Dict[str, Any]):
+    """
+    Set cache breakpoints on the tools, the system prompt and the history, which
+    stay the same between the turns of a chat, so that they are read from the
+    cache instead of being processed again.
+    """
+    if payload.get("tools"):
+        payload["tools"][-1]["cache_control"] = _CACHE_CONTROL
+
+    if payload.get("system"):
+        payload["system"] = [
+            {
+                "type": "text",
+                "text": payload["system"],
+                "cache_control": _CACHE_CONTROL,
+            }
+        ]
+
+    # The last user message is cached for the next turn. The previous one is where
+    # the last turn was cached, which is still read when more content blocks have
+    # been added since than the cache looks back from the last breakpoint.
+    user_messages = [
+        m for m in payload["messages"] if m["role"] == "user" and m["content"]
+    ]
+    for message in user_messages[-2:]:
+        message["content"][-1]["cache_control"] = _CACHE_CONTROL
+
+
 async def complete_chat(
     messages: List[Message],
     out_message: Message,
@@ -136,89 +167,100 @@ async def complete_chat(
             }
             for tool in tools
         ]
+    _set_cache_breakpoints(payload)
+
+    stats = RequestStats()
+    if usage:
+        usage.request_stats = stats
+    async with post(
+        api_url, stats=stats, headers=headers, json=payload, raise_for_status=True
+    ) as response:
+        cb_text = None
+        cb_tool_use = None
+        tool_input_json = ""
+        async for event in iter_sse_events(response.content):
+            data = json.loads(event.data)
+            logging.debug(f"Received data: {data}")
+
+            if data["type"] == "message_start":
+                if usage:
+                    u = data["message"]["usage"]
+                    usage.input_tokens += u["input_tokens"]
+                    usage.output_tokens += u["output_tokens"]
+                    usage.cache_read_tokens += u.get("cache_read_input_tokens") or 0
+                    usage.cache_write_tokens += (
+                        u.get("cache_creation_input_tokens") or 0
+                    )
+                    usage.total_tokens = (
+                        usage.input_tokens
+                        + usage.cache_read_tokens
+                        + usage.cache_write_tokens
+                        + usage.output_tokens
+                    )
+
+            elif data["type"] == "message_delta":
+                if usage:
+                    u = data["usage"]
+                    usage.output_tokens += u["output_tokens"]
+                    usage.total_tokens = (
+                        usage.input_tokens
+                        + usage.cache_read_tokens
+                        + usage.cache_write_tokens
+                        + usage.output_tokens
+                    )
+
+            elif data["type"] == "message_stop":
+                break
+
+            elif data["type"] == "content_block_start":
+                content_block = data["content_block"]
+                if content_block["type"] == "tool_use":
+                    cb_tool_use = content_block.copy()
+                    tool_input_json = ""
+
+                    tool_use = ToolUse(
+                        tool_name=cb_tool_use["name"],
+                        args=cb_tool_use["input"],
+                        tool_use_id=cb_tool_use["id"],
+                    )
+                    if on_tool_use_start:
+                        on_tool_use_start(tool_use)
+
+                elif content_block["type"] == "text":
+                    cb_text = content_block.copy()
+
+            elif data["type"] == "content_block_delta":
+                if data["delta"]["type"] == "text_delta":
+                    text_delta = data["delta"]["text"]
+                    if text_delta:
+                        assert isinstance(cb_text, dict)
+                        cb_text["text"] += text_delta
+                        yield text_delta
+                        out_message["text"] += text_delta
+
+                if data["delta"]["type"] == "input_json_delta":
+                    partial_json = data["delta"]["partial_json"]
+                    tool_input_json += partial_json
+                    if on_tool_use_args_delta:
+                        on_tool_use_args_delta(partial_json)
+
+            elif data["type"] == "content_block_stop":
+                if cb_text:
+                    cb_text = None
+                elif cb_tool_use:
+                    cb_tool_use["input"] = (
+                        json.loads(tool_input_json) if tool_input_json else {}
+                    )
+                    tool_use = ToolUse(
+                        tool_name=cb_tool_use["name"],
+                        args=cb_tool_use["input"],
+                        tool_use_id=cb_tool_use["id"],
+                    )
+                    if on_tool_use:
+                        on_tool_use(tool_use)
+                    out_message.setdefault("tool_use", []).append(tool_use)
+                    cb_tool_use = None
+                    tool_input_json = ""
 
-    async with aiohttp.ClientSession(raise_for_status=True) as session:
-        async with session.post(api_url, headers=headers, json=payload) as response:
-            cb_text = None
-            cb_tool_use = None
-            tool_input_json = ""
-            async for line in iter_lines(response.content):
-                line = line.rstrip(b"\n")
-
-                if not line:
-                    continue
-
-                if not line.startswith(b"data: "):
-                    continue
-
-                data = json.loads(line[6:].decode("utf-8"))
-                logging.debug(f"Received data: {data}")
-
-                if data["type"] == "message_start":
-                    if usage:
-                        u = data["message"]["usage"]
-                        usage.input_tokens += u["input_tokens"]
-                        usage.output_tokens += u["output_tokens"]
-                        usage.total_tokens = usage.input_tokens + usage.output_tokens
-
-                elif data["type"] == "message_delta":
-                    if usage:
-                        u = data["usage"]
-                        usage.output_tokens += u["output_tokens"]
-                        usage.total_tokens = usage.input_tokens + usage.output_tokens
-
-                elif data["type"] == "message_stop":
-                    break
-
-                elif data["type"] == "content_block_start":
-                    content_block = data["content_block"]
-                    if content_block["type"] == "tool_use":
-                        cb_tool_use = content_block.copy()
-                        tool_input_json = ""
-
-                        tool_use = ToolUse(
-                            tool_name=cb_tool_use["name"],
-                            args=cb_tool_use["input"],
-                            tool_use_id=cb_tool_use["id"],
-                        )
-                        if on_tool_use_start:
-                            on_tool_use_start(tool_use)
-
-                    elif content_block["type"] == "text":
-                        cb_text = content_block.copy()
-
-                elif data["type"] == "content_block_delta":
-                    if data["delta"]["type"] == "text_delta":
-                        text_delta = data["delta"]["text"]
-                        if text_delta:
-                            assert isinstance(cb_text, dict)
-                            cb_text["text"] += text_delta
-                            yield text_delta
-                            out_message["text"] += text_delta
-
-                    if data["delta"]["type"] == "input_json_delta":
-                        partial_json = data["delta"]["partial_json"]
-                        tool_input_json += partial_json
-                        if on_tool_use_args_delta:
-                            on_tool_use_args_delta(partial_json)
-
-                elif data["type"] == "content_block_stop":
-                    if cb_text:
-                        cb_text = None
-                    elif cb_tool_use:
-                        cb_tool_use["input"] = (
-                            json.loads(tool_input_json) if tool_input_json else {}
-                        )
-                        tool_use = ToolUse(
-                            tool_name=cb_tool_use["name"],
-                            args=cb_tool_use["input"],
-                            tool_use_id=cb_tool_use["id"],
-                        )
-                        if on_tool_use:
-                            on_tool_use(tool_use)
-                        out_message.setdefault("tool_use", []).append(tool_use)
-                        cb_tool_use = None
-                        tool_input_json = ""
-
-                elif data["type"] == "error":
-                    raise Exception(f"Error from API: {data}")
+            elif data["type"] == "error":
+                raise Exception(f"Error from API: {data}")
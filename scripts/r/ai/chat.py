@@ -26,7 +26,10 @@ def get_context_text(context: str) -> str:
 
 
 def get_tool_result_text(tool_result: ToolResult) -> str:
-    return "\033[34m└ {}\033[0m".format(truncate_text(tool_result["content"]))
+    text = truncate_text(tool_result["content"])
+    if "duration" in tool_result:
+        text = "({:.1f}s) {}".format(tool_result["duration"], text)
+    return "\033[34m└ {}\033[0m".format(text)
 
 
 def get_tool_use_text(tool_use: ToolUse) -> str:
@@ -10,7 +10,7 @@ import tempfile
 from datetime import datetime
 from pathlib import Path
 from pprint import pformat
-from threading import Thread
+from threading import Lock, Thread
 from typing import Any, Dict, List, Literal, Optional, Tuple, Union
 from urllib.parse import unquote_to_bytes
 
@@ -32,6 +32,7 @@ from utils.editor import edit_text
 from utils.encode_image_base64 import encode_image_base64
 from utils.gitignore import create_gitignore
 from utils.historymanager import HistoryManager
+from utils.http import close_sessions
 from utils.jsonschema import JSONSchema
 from utils.jsonutil import load_json, save_json
 from utils.menu import Menu
@@ -59,6 +60,8 @@ _MAX_CHAT_HISTORY = 200
 
 _INTERRUPT_MESSAGE = "[INTERRUPTED]"
 
+_CLOSE_SESSIONS_TIMEOUT_SECS = 1.0
+
 EXPERIMENTAL_FOLLOW_NEW_MESSAGE = False
 
 
@@ -129,8 +132,27 @@ class Line:
         self.tool_use = tool_use
         self.tool_result = tool_result
         self.type = type
+        self.__summary: Optional[Tuple[tuple, str]] = None
 
     def __str__(self) -> str:
+        key = (
+            self.context,
+            self.reasoning,
+            self.tool_use,
+            self.tool_result,
+            self.image_url,
+        )
+        if not any(key):
+            return self.text
+
+        # Summarizing a large tool result scans all of its content, so the summary
+        # is only created once the line is rendered and is kept until the line is
+        # changed.
+        if self.__summary is None or self.__summary[0] != key:
+            self.__summary = (key, self.__get_summary())
+        return self.__summary[1]
+
+    def __get_summary(self) -> str:
         if self.context:
             return get_context_text(self.context)
         elif self.reasoning:
@@ -145,6 +167,47 @@ class Line:
             return self.text
 
 
+class _ChunkBatch:
+    """
+    Streamed chunks that have not been shown yet. The UI thread takes all of them
+    at once, so that it is only updated once per frame while the response is
+    being streamed.
+    """
+
+    def __init__(self, new_line: bool) -> None:
+        self.new_line = new_line
+        self.chunks: List[str] = []
+        self.taken = False
+        self.lock = Lock()
+
+    def add(self, chunk: str) -> bool:
+        with self.lock:
+            if self.taken:
+                return False
+            self.chunks.append(chunk)
+            return True
+
+    def take(self) -> str:
+        with self.lock:
+            self.taken = True
+            return "".join(self.chunks)
+
+
+def _find_first_line(lines: List[Line], msg_index: int) -> int:
+    """
+    Return the index of the first line of the message, or of the message after
+    it. The lines are ordered by their message index.
+    """
+    lo, hi = 0, len(lines)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if lines[mid].msg_index < msg_index:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
 class _ChatItem:
     def __init__(
         self,
@@ -213,9 +276,6 @@ class _SelectChatMenu(Menu[_ChatItem]):
     def get_item_text(self, item: _ChatItem) -> str:
         return item.preview
 
-    def match_item(self, patt: str, item: _ChatItem, index: int) -> int:
-        return super().match_item(patt, item, index)
-
 
 def _open_image(image_url: str):
     # Extract image data
@@ -435,7 +495,7 @@ class ChatMenu(Menu[Line]):
             # Delete all messages after.
             del self.get_messages()[msg_index + 1 :]
 
-            self.__refresh_lines()
+            self.__refresh_lines(from_msg_index=msg_index)
             self.__update_terminal_title()
 
             if message["role"] == "user":
@@ -602,7 +662,7 @@ class ChatMenu(Menu[Line]):
 
         self.__message_queue.clear()
 
-        self.__refresh_lines()
+        self.__refresh_lines(from_msg_index=from_msg_index)
         oldest_removed = removed_messages[0]
         if oldest_removed["role"] == "user":
             self.set_input(oldest_removed["text"])
@@ -726,6 +786,16 @@ class ChatMenu(Menu[Line]):
         elif self.__prompt_file:
             self.__load_prompt(self.__prompt_file)
 
+    def on_close(self):
+        self.__cancel_chat_completion()
+        # Close the kept-alive connections of the background loop.
+        future = asyncio.run_coroutine_threadsafe(close_sessions(), _loop)
+        try:
+            future.result(timeout=_CLOSE_SESSIONS_TIMEOUT_SECS)
+        except Exception:
+            pass
+        super().on_close()
+
     def on_tab_pressed(self) -> bool:
         if not self.__show_more():
             self.__load_prompt()
@@ -880,37 +950,51 @@ class ChatMenu(Menu[Line]):
         messages = self.get_messages(expand_context=True)
 
         async def chat_task():
+            batch: Optional[_ChunkBatch] = None
+
+            def post_event(func):
+                nonlocal batch
+
+                # The chunks received after this event must be shown after it.
+                batch = None
+                self.post_event(func)
+
             try:
-                chunk_index = 0
+                new_line = True
                 async for chunk in await complete_chat(
                     messages=messages,
                     model=self.get_settings()["model"],
                     system_prompt=self.get_system_prompt(),
                     tools=self.get_tools(),
-                    on_image=lambda image_url: self.post_event(
+                    on_image=lambda image_url: post_event(
                         lambda: self.on_image(image_url)
                     ),
-                    on_tool_use_start=lambda tool_use: self.post_event(
+                    on_tool_use_start=lambda tool_use: post_event(
                         lambda: self.on_tool_use_start(tool_use)
                     ),
-                    on_tool_use_args_delta=lambda text: self.post_event(
+                    on_tool_use_args_delta=lambda text: post_event(
                         lambda: self.on_tool_use_args_delta(text)
                     ),
-                    on_tool_use=lambda tool_use: self.post_event(
+                    on_tool_use=lambda tool_use: post_event(
                         lambda: self.on_tool_use(tool_use)
                     ),
-                    on_reasoning=lambda text: self.post_event(
+                    on_reasoning=lambda text: post_event(
                         lambda: self.on_reasoning(text)
                     ),
                     out_message=out_message,
                     usage=self.__usage,
                 ):
-                    self.post_event(
-                        lambda chunk_index=chunk_index, chunk=chunk: (
-                            self.__on_chat_chunk(chunk_index, chunk)
+                    # Add the chunk to the batch that has not been shown yet, if
+                    # any, instead of posting an event for every chunk.
+                    if batch is None or not batch.add(chunk):
+                        batch = _ChunkBatch(new_line=new_line)
+                        batch.add(chunk)
+                        self.post_event(
+                            lambda batch=batch: self.__on_chat_chunk(
+                                batch.take(), new_line=batch.new_line
+                            )
                         )
-                    )
-                    chunk_index += 1
+                    new_line = False
 
                 self.post_event(lambda: self.__on_chat_done())
 
@@ -971,9 +1055,9 @@ class ChatMenu(Menu[Line]):
                 next_text = self.__message_queue.pop(0)
                 self.send_message(next_text)
 
-    def __on_chat_chunk(self, chunk_index: int, chunk: str):
+    def __on_chat_chunk(self, chunk: str, new_line: bool):
         for i, a in enumerate(chunk.split("\n")):
-            if i > 0 or chunk_index == 0:
+            if i > 0 or new_line:
                 msg_index, subindex = self.get_message_index_and_subindex()
                 line = Line(
                     role="assistant",
@@ -1007,83 +1091,93 @@ class ChatMenu(Menu[Line]):
         self.__history_manager.delete_old_files()
         self.set_message(f"chat saved to {self.__chat_file}")
 
-    def __refresh_lines(self):
-        self.__lines[:] = []
-        for msg_index, message in enumerate(self.get_messages()):
-            subindex = 0
-
-            # Reasoning
-            for reasoning in message.get("reasoning", []):
-                self.__lines.append(
-                    Line(
-                        role=message["role"],
-                        msg_index=msg_index,
-                        subindex=subindex,
-                        reasoning=reasoning,
-                    )
-                )
-                subindex += 1
+    def __refresh_lines(self, from_msg_index: int = 0):
+        """
+        Recreate the lines of the messages starting from `from_msg_index`. The
+        lines of the messages before it are kept as is.
+        """
+        del self.__lines[_find_first_line(self.__lines, from_msg_index) :]
+        messages = self.get_messages()
+        for msg_index in range(from_msg_index, len(messages)):
+            self.__lines.extend(self._get_message_lines(messages[msg_index], msg_index))
+        self.update_screen()
 
-            # Text content
-            if message["text"]:
-                for line in message["text"].splitlines():
-                    self.__lines.append(
-                        Line(
-                            role=message["role"],
-                            msg_index=msg_index,
-                            subindex=subindex,
-                            text=line,
-                        )
-                    )
-                    subindex += 1
+    def _get_message_lines(self, message: Message, msg_index: int) -> List[Line]:
+        lines: List[Line] = []
+        subindex = 0
 
-            # Context
-            context = message.get("context")
-            if context:
-                self.__lines.append(
-                    Line(
-                        role=message["role"],
-                        msg_index=msg_index,
-                        subindex=subindex,
-                        context=context,
-                    )
+        # Reasoning
+        for reasoning in message.get("reasoning", []):
+            lines.append(
+                Line(
+                    role=message["role"],
+                    msg_index=msg_index,
+                    subindex=subindex,
+                    reasoning=reasoning,
                 )
-                subindex += 1
+            )
+            subindex += 1
 
-            # Image file
-            image_urls = message.get("image_urls", [])
-            for image_url in image_urls:
-                self.__lines.append(
+        # Text content
+        if message["text"]:
+            for line in message["text"].splitlines():
+                lines.append(
                     Line(
                         role=message["role"],
                         msg_index=msg_index,
                         subindex=subindex,
-                        image_url=image_url,
+                        text=line,
                     )
                 )
                 subindex += 1
 
-            # Tool uses
-            for tool_use in message.get("tool_use", []):
-                for line in self._get_tool_use_lines(
-                    tool_use, msg_index=msg_index, subindex=subindex
-                ):
-                    self.__lines.append(line)
-                    subindex += 1
+        # Context
+        context = message.get("context")
+        if context:
+            lines.append(
+                Line(
+                    role=message["role"],
+                    msg_index=msg_index,
+                    subindex=subindex,
+                    context=context,
+                )
+            )
+            subindex += 1
 
-            # Tool results
-            for tool_result in message.get("tool_result", []):
-                self.__lines.append(
-                    Line(
-                        role=message["role"],
-                        msg_index=msg_index,
-                        subindex=subindex,
-                        tool_result=tool_result,
-                    )
+        # Image file
+        image_urls = message.get("image_urls", [])
+        for image_url in image_urls:
+            lines.append(
+                Line(
+                    role=message["role"],
+                    msg_index=msg_index,
+                    subindex=subindex,
+                    image_url=image_url,
                 )
+            )
+            subindex += 1
+
+        # Tool uses
+        for tool_use in message.get("tool_use", []):
+            for line in self._get_tool_use_lines(
+                tool_use, msg_index=msg_index, subindex=subindex
+            ):
+                lines.append(line)
                 subindex += 1
 
-        self.update_screen()
+        # Tool results
+        for tool_result in message.get("tool_result", []):
+            lines.append(
+                Line(
+                    role=message["role"],
+                    msg_index=msg_index,
+                    subindex=subindex,
+                    tool_result=tool_result,
+                )
+            )
+            subindex += 1
+
+        return lines
 
     def load_chat(self, file: str):
         if not os.path.exists(file):
@@ -1146,6 +1240,8 @@ class ChatMenu(Menu[Line]):
     def get_status_text(self) -> str:
         s = "chat: "
         s += f"tokens={self.__usage} "
+        if self.__usage.request_stats:
+            s += f"{self.__usage.request_stats} "
         s += "cfg=" + str(self.__settings_menu.data) + "\n"
         s += super().get_status_text()
         return s
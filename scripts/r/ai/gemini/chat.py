@@ -4,11 +4,10 @@ import os
 import uuid
 from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
 
-import aiohttp
 from ai.utils.message import Message
 from ai.utils.tooluse import ToolDefinition, ToolUse
 from ai.utils.usagemetadata import UsageMetadata
-from utils.http import check_for_status, iter_lines
+from utils.http import RequestStats, check_for_status, iter_sse_events, post
 from utils.imagedataurl import parse_image_data_url
 
 logger = logging.getLogger(__name__)
@@ -262,27 +261,26 @@ async def complete_chat(
 
     logger.debug(f"payload: {payload}")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            endpoint_url,
-            headers=headers,
-            json=payload,
-        ) as response:
-            await check_for_status(response)
-
-            async for line in iter_lines(response.content):
-                line = line.strip()
-                if not line.startswith(b"data: "):
-                    continue
-
-                data = json.loads(line[6:].decode("utf-8"))
-                logger.debug(f"data: {data}")
-
-                for text in _process_response_data(
-                    data,
-                    out_message=out_message,
-                    usage=usage,
-                    on_image=on_image,
-                    on_tool_use=on_tool_use,
-                ):
-                    yield text
+    stats = RequestStats()
+    if usage:
+        usage.request_stats = stats
+    async with post(
+        endpoint_url,
+        stats=stats,
+        headers=headers,
+        json=payload,
+    ) as response:
+        await check_for_status(response)
+
+        async for event in iter_sse_events(response.content):
+            data = json.loads(event.data)
+            logger.debug(f"data: {data}")
+
+            for text in _process_response_data(
+                data,
+                out_message=out_message,
+                usage=usage,
+                on_image=on_image,
+                on_tool_use=on_tool_use,
+            ):
+                yield text
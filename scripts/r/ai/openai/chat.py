@@ -10,11 +10,10 @@ from typing import (
     Optional,
 )
 
-import aiohttp
 from ai.utils.message import Message
 from ai.utils.tooluse import ToolDefinition, ToolUse
 from ai.utils.usagemetadata import UsageMetadata
-from utils.http import check_for_status, iter_lines
+from utils.http import RequestStats, check_for_status, iter_sse_events, post
 
 DEFAULT_MODEL = "gpt-4o"
 
@@ -159,50 +158,46 @@ async def complete_chat(
 
     logger.debug(f"payload: {payload}")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, json=payload) as response:
-            await check_for_status(response)
-
-            async for line in iter_lines(response.content):
-                line = line.rstrip(b"\n")
-
-                if not line:
-                    continue
-
-                if line.startswith(b"data: "):
-                    data = json.loads(line[6:].decode("utf-8"))
-                    logger.debug(f"Received data: {data}")
-
-                    if data["type"] == "response.completed":
-                        if usage:
-                            u = data["response"]["usage"]
-                            usage.total_tokens = u["total_tokens"]
-                            usage.input_tokens = u["input_tokens"]
-                            usage.output_tokens = u["output_tokens"]
-                        return
-                    elif data["type"] == "response.output_text.delta":
-                        delta = data["delta"]
-                        assert isinstance(delta, str), "Delta must be a string"
-                        yield delta
-                        out_message["text"] += delta
-                    elif data["type"] == "response.output_item.added":
-                        item = data["item"]
-                        if item["type"] == "function_call":
-                            tool_use = ToolUse(
-                                tool_name=item["name"],
-                                args={},
-                                tool_use_id=item["id"],
-                            )
-                            if on_tool_use_start:
-                                on_tool_use_start(tool_use)
-                    elif data["type"] == "response.output_item.done":
-                        item = data["item"]
-                        if item["type"] == "function_call":
-                            tool_use = ToolUse(
-                                tool_name=item["name"],
-                                args=json.loads(item["arguments"]),
-                                tool_use_id=item["id"],
-                            )
-                            if on_tool_use:
-                                on_tool_use(tool_use)
-                            out_message.setdefault("tool_use", []).append(tool_use)
+    stats = RequestStats()
+    if usage:
+        usage.request_stats = stats
+    async with post(url, stats=stats, headers=headers, json=payload) as response:
+        await check_for_status(response)
+
+        async for event in iter_sse_events(response.content):
+            data = json.loads(event.data)
+            logger.debug(f"Received data: {data}")
+
+            if data["type"] == "response.completed":
+                if usage:
+                    u = data["response"]["usage"]
+                    usage.total_tokens = u["total_tokens"]
+                    usage.input_tokens = u["input_tokens"]
+                    usage.output_tokens = u["output_tokens"]
+                return
+            elif data["type"] == "response.output_text.delta":
+                delta = data["delta"]
+                assert isinstance(delta, str), "Delta must be a string"
+                yield delta
+                out_message["text"] += delta
+            elif data["type"] == "response.output_item.added":
+                item = data["item"]
+                if item["type"] == "function_call":
+                    tool_use = ToolUse(
+                        tool_name=item["name"],
+                        args={},
+                        tool_use_id=item["id"],
+                    )
+                    if on_tool_use_start:
+                        on_tool_use_start(tool_use)
+            elif data["type"] == "response.output_item.done":
+                item = data["item"]
+                if item["type"] == "function_call":
+                    tool_use = ToolUse(
+                        tool_name=item["name"],
+                        args=json.loads(item["arguments"]),
+                        tool_use_id=item["id"],
+                    )
+                    if on_tool_use:
+                        on_tool_use(tool_use)
+                    out_message.setdefault("tool_use", []).append(tool_use)
@@ -3,11 +3,10 @@ import logging
 import os
 from typing import AsyncIterator, Callable, Dict, List, Optional
 
-import aiohttp
 from ai.utils.message import Message
 from ai.utils.tooluse import ToolDefinition, ToolUse
 from ai.utils.usagemetadata import UsageMetadata
-from utils.http import check_for_status, iter_lines
+from utils.http import RequestStats, check_for_status, iter_sse_events, post
 
 
 async def complete_chat(
@@ -127,90 +126,87 @@ async def complete_chat(
 
     logging.debug(f"payload: {payload}")
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(
-            endpoint_url,
-            headers=headers,
-            json=payload,
-        ) as response:
-            await check_for_status(response)
-
-            async for line in iter_lines(response.content):
-                if not line:
-                    continue
-
-                if not line.startswith(b"data: "):
-                    continue
-
-                data_str = line[6:].decode("utf-8")
-                if data_str == "[DONE]":
-                    return
-
-                try:
-                    data = json.loads(data_str)
-                    logging.debug(f"data: {data}")
-                except json.JSONDecodeError:
-                    logging.debug(f"Skipping malformed chunk: {data_str}")
-                    continue
-
-                if "usage" in data:
-                    if usage:
-                        u = data["usage"]
-                        usage.total_tokens = u["total_tokens"]
-                        usage.input_tokens = u["prompt_tokens"]
-                        usage.output_tokens = u["completion_tokens"]
-
-                for choice in data.get("choices", []):
-                    delta = choice.get("delta", {})
-
-                    tool_calls = delta.get("tool_calls")
-                    if tool_calls:
-                        logging.debug(f"tool call delta: {tool_calls}")
-                        for tool_call in tool_calls:
-                            if tool_call["type"] == "function":
-                                function = tool_call["function"]
-                                if function:
-                                    tool_use = ToolUse(
-                                        tool_name=function["name"],
-                                        args=json.loads(function["arguments"]),
-                                        tool_use_id=tool_call["id"],
-                                    )
-                                    if on_tool_use:
-                                        on_tool_use(tool_use)
-                                    out_message.setdefault("tool_use", []).append(
-                                        tool_use
-                                    )
-
-                    content = delta.get("content")
-                    if content:
-                        logging.debug(f"yielding content chunk: {content}")
-                        yield content
-                        out_message["text"] += content
-
-                    reasoning_details = delta.get("reasoning_details")
-                    if reasoning_details:
-                        assert isinstance(reasoning_details, list)
-                        for reasoning_detail in reasoning_details:
-                            if reasoning_detail["type"] == "reasoning.text":
-                                reasoning_text = reasoning_detail["text"]
-                                if on_reasoning:
-                                    on_reasoning(reasoning_text)
-                                out_message.setdefault("reasoning", []).append(
-                                    reasoning_text
+    stats = RequestStats()
+    if usage:
+        usage.request_stats = stats
+    async with post(
+        endpoint_url,
+        stats=stats,
+        headers=headers,
+        json=payload,
+    ) as response:
+        await check_for_status(response)
+
+        async for event in iter_sse_events(response.content):
+            data_str = event.data
+            if data_str == "[DONE]":
+                return
+
+            try:
+                data = json.loads(data_str)
+                logging.debug(f"data: {data}")
+            except json.JSONDecodeError:
+                logging.debug(f"Skipping malformed chunk: {data_str}")
+                continue
+
+            if "usage" in data:
+                if usage:
+                    u = data["usage"]
+                    usage.total_tokens = u["total_tokens"]
+                    usage.input_tokens = u["prompt_tokens"]
+                    usage.output_tokens = u["completion_tokens"]
+
+            for choice in data.get("choices", []):
+                delta = choice.get("delta", {})
+
+                tool_calls = delta.get("tool_calls")
+                if tool_calls:
+                    logging.debug(f"tool call delta: {tool_calls}")
+                    for tool_call in tool_calls:
+                        if tool_call["type"] == "function":
+                            function = tool_call["function"]
+                            if function:
+                                tool_use = ToolUse(
+                                    tool_name=function["name"],
+                                    args=json.loads(function["arguments"]),
+                                    tool_use_id=tool_call["id"],
                                 )
-
-                        out_message.setdefault("reasoning_details", []).extend(
-                            reasoning_details
-                        )
-
-                    images = delta.get("images")
-                    if images:
-                        assert isinstance(images, list)
-                        for image in images:
-                            if image["type"] == "image_url":
-                                image_url: str = image["image_url"]["url"]
-                                if on_image:
-                                    on_image(image_url)
-                                out_message.setdefault("image_urls", []).append(
-                                    image_url
+                                if on_tool_use:
+                                    on_tool_use(tool_use)
+                                out_message.setdefault("tool_use", []).append(
+                                    tool_use
                                 )
+
+                content = delta.get("content")
+                if content:
+                    logging.debug(f"yielding content chunk: {content}")
+                    yield content
+                    out_message["text"] += content
+
+                reasoning_details = delta.get("reasoning_details")
+                if reasoning_details:
+                    assert isinstance(reasoning_details, list)
+                    for reasoning_detail in reasoning_details:
+                        if reasoning_detail["type"] == "reasoning.text":
+                            reasoning_text = reasoning_detail["text"]
+                            if on_reasoning:
+                                on_reasoning(reasoning_text)
+                            out_message.setdefault("reasoning", []).append(
+                                reasoning_text
+                            )
+
+                    out_message.setdefault("reasoning_details", []).extend(
+                        reasoning_details
+                    )
+
+                images = delta.get("images")
+                if images:
+                    assert isinstance(images, list)
+                    for image in images:
+                        if image["type"] == "image_url":
+                            image_url: str = image["image_url"]["url"]
+                            if on_image:
+                                on_image(image_url)
+                            out_message.setdefault("image_urls", []).append(
+                                image_url
+                            )
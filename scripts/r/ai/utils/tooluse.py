@@ -32,6 +32,9 @@ class ToolResult(TypedDict):
     content: str
     image_urls: NotRequired[List[str]]
 
+    # Wall time of the tool call in seconds, which is only shown to the user.
+    duration: NotRequired[float]
+
 
 @dataclass
 class ToolParam:
@@ -1,4 +1,7 @@
 from dataclasses import dataclass
+from typing import Optional
+
+from utils.http import RequestStats
 
 
 @dataclass
@@ -7,10 +10,21 @@ class UsageMetadata:
     input_tokens: int = 0
     output_tokens: int = 0
 
+    # Input tokens read from and written to the prompt cache, which are not
+    # counted in `input_tokens`.
+    cache_read_tokens: int = 0
+    cache_write_tokens: int = 0
+
+    # Latency of the last request.
+    request_stats: Optional[RequestStats] = None
+
     def reset(self):
         self.total_tokens = 0
         self.input_tokens = 0
         self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self.request_stats = None
 
     def __str__(self):
         def format_tokens(n):
@@ -18,4 +32,12 @@ class UsageMetadata:
                 return f"{n // 1000}k"
             return str(n)
 
-        return format_tokens(max(self.total_tokens, self.input_tokens + self.output_tokens))
+        s = format_tokens(
+            max(self.total_tokens, self.input_tokens + self.output_tokens)
+        )
+        if self.cache_read_tokens or self.cache_write_tokens:
+            s += " (cache read=%s write=%s)" % (
+                format_tokens(self.cache_read_tokens),
+                format_tokens(self.cache_write_tokens),
+            )
+        return s
@@ -3,8 +3,9 @@ import logging
 import os
 
 from _shutil import call_echo, get_files
-from utils.android import adb_install2, get_pkg_name_apk
+from utils.android import adb_install2, get_pkg_name_apk, restart_app
 from utils.logger import setup_logger
+from utils.menu.devicetaskmenu import DeviceTaskMenu
 from utils.term import set_terminal_title
 
 if __name__ == "__main__":
@@ -16,34 +17,45 @@ if __name__ == "__main__":
     parser.add_argument("-r", "--run", default=False, action="store_true")
     parser.add_argument("-f", "--force_reinstall", default=False, action="store_true")
     parser.add_argument("-p", "--grant-permissions", default=False, action="store_true")
+    parser.add_argument(
+        "--all-devices",
+        action="store_true",
+        help="install on all connected devices at the same time",
+    )
 
     args = parser.parse_args()
 
-    pkg = None
     if args.files:
-        for file in args.files:
-            adb_install2(
-                file,
-                force_reinstall=args.force_reinstall,
-                grant_permissions=args.grant_permissions,
-            )
-
-            if len(args.files) == 1 and args.run:
-                pkg = get_pkg_name_apk(file)
-
+        files = args.files
     else:
         files = get_files()
         for file in files:
             assert os.path.splitext(file)[1].lower() == ".apk"
 
+    def install():
+        for file in files:
             adb_install2(
                 file,
                 force_reinstall=args.force_reinstall,
                 grant_permissions=args.grant_permissions,
             )
 
-            if len(files) == 1:
-                pkg = get_pkg_name_apk(file)
+    run_app = len(files) == 1 and (args.run or not args.files)
+    pkg = None
+    if args.all_devices:
+        run_pkg = get_pkg_name_apk(files[0]) if run_app else None
+
+        def install_and_run():
+            install()
+            if run_pkg is not None:
+                restart_app(run_pkg, use_monkey=bool(os.environ.get("USE_MONKEY")))
+
+        DeviceTaskMenu(install_and_run, prompt="install").exec()
+    else:
+        install()
+
+        if run_app:
+            pkg = get_pkg_name_apk(files[0])
 
     if pkg is not None:
         # Run app
@@ -2,22 +2,33 @@ import logging
 import os
 import re
 import subprocess
+from array import array
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from functools import lru_cache
 from pathlib import Path
-from queue import Queue
-from typing import DefaultDict, List, Optional, Set, Tuple
+from typing import Any, DefaultDict, Dict, List, Optional, Set, Tuple
 
 from dev.callgraph.sourcelang import filename_to_lang
 from tree_sitter import Node, Query, QueryCursor, Tree
 from tree_sitter_language_pack import get_language, get_parser
 from utils.defaultordereddict import DefaultOrderedDict
+from utils.jsonstore import get_json_store
 from utils.orderedset import OrderedSet
+from utils.script.path import get_data_dir
 
 SCOPE_SEP = "::"
 CLASS_PREFIX = ""
 
+# Bump this whenever the extracted results change, e.g. when a query is updated,
+# so that the cached results are discarded.
+_CACHE_VERSION = 1
+
+# Below this number of files, starting worker processes takes longer than
+# parsing the files.
+_MIN_FILES_FOR_POOL = 8
+
 
 def _get_node_text(node):
     return node.text.decode()
@@ -30,6 +41,40 @@ class Scope:
         default_factory=lambda: DefaultOrderedDict(Scope)
     )
 
+    def copy(self) -> "Scope":
+        scope = Scope()
+        for name, child in self.scopes.items():
+            scope.scopes[name] = child.copy()
+        return scope
+
+
+@dataclass
+class _GraphIndex:
+    """
+    Compact adjacency of a call graph. Each node is identified by its index in
+    `names`, and the callees of node `i` are
+    `callees[callee_offsets[i] : callee_offsets[i + 1]]` (CSR format); likewise
+    for the callers.
+    """
+
+    names: List[str]
+    ids: Dict[str, int]
+    callee_offsets: array
+    callees: array
+    caller_offsets: array
+    callers: array
+
+
+def _create_csr(
+    names: List[str], ids: Dict[str, int], adjacency: Dict[str, Any]
+) -> Tuple[array, array]:
+    offsets = array("i", [0])
+    targets = array("i")
+    for name in names:
+        targets.extend(ids[x] for x in adjacency.get(name, ()))
+        offsets.append(len(targets))
+    return offsets, targets
+
 
 @dataclass
 class CallGraph:
@@ -46,6 +91,53 @@ class CallGraph:
 
     highlighted_nodes: Set[str] = field(default_factory=set)
 
+    _index: Optional[_GraphIndex] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def get_index(self) -> _GraphIndex:
+        """
+        Return the compact adjacency of the graph, which is built on first use
+        and rebuilt after the graph is modified.
+        """
+        if self._index is None:
+            # Callers are numbered in the order their edges were added, so that
+            # walking the ids in order visits the edges in the same order.
+            names = list(self.edges.keys())
+            names.extend(self.nodes.difference(self.edges.keys()))
+            ids = {name: i for i, name in enumerate(names)}
+            callee_offsets, callees = _create_csr(names, ids, self.edges)
+            caller_offsets, callers = _create_csr(names, ids, self.reverse_edges)
+            self._index = _GraphIndex(
+                names=names,
+                ids=ids,
+                callee_offsets=callee_offsets,
+                callees=callees,
+                caller_offsets=caller_offsets,
+                callers=callers,
+            )
+        return self._index
+
+    def copy(self) -> "CallGraph":
+        """
+        Return a copy of the graph, which can be modified without affecting
+        this one.
+        """
+        graph = CallGraph(
+            nodes=set(self.nodes),
+            edges=defaultdict(
+                OrderedSet, ((k, OrderedSet(v)) for k, v in self.edges.items())
+            ),
+            reverse_edges=defaultdict(
+                set, ((k, set(v)) for k, v in self.reverse_edges.items())
+            ),
+            scope=self.scope.copy(),
+            highlighted_nodes=set(self.highlighted_nodes),
+        )
+        # The index is never modified in place, so it can be shared.
+        graph._index = self._index
+        return graph
+
     def add_scope(self, name: str):
         full_name = []
         scope = self.scope
@@ -56,6 +148,7 @@ class CallGraph:
     def add_node(self, node: str):
         self.nodes.add(node)
         self.add_scope(name=node)
+        self._index = None
 
     def add_edge(self, from_node: str, to_node: str):
         # Avoid self-loop
@@ -67,6 +160,7 @@ class CallGraph:
 
         self.edges[from_node].add(to_node)
         self.reverse_edges[to_node].add(from_node)
+        self._index = None
 
 
 def _parse_tree(
@@ -126,6 +220,7 @@ def _parse_tree(
     return functions, calls
 
 
+@lru_cache(maxsize=None)
 def _get_query(lang: str) -> Query:
     query_scm_file = os.path.join(
         Path(__file__).parent.resolve(),
@@ -151,9 +246,9 @@ def _get_module_name(filepath: str, use_full_path=False):
 
 def _add_module_node(graph: CallGraph, module: str) -> None:
     graph.nodes.add(module)
+    graph._index = None
 
 
-@lru_cache(maxsize=None)
 def _get_tree(file: str) -> Tree:
     parser = get_parser(filename_to_lang(file))
 
@@ -163,23 +258,115 @@ def _get_tree(file: str) -> Tree:
     return parser.parse(source_code.encode())
 
 
-def _add_callers_or_callees_to_graph(
-    node: str,
-    max_depth: int,
-    graph: CallGraph,
-    new_graph: CallGraph,
-    find_callers: bool,
-):
-    q: Queue[Tuple[str, int]] = Queue()
-    q.put((node, 0))
-    while not q.empty():
-        n, d = q.get()
-        if d < max_depth:
-            for connected_node in (
-                graph.reverse_edges[n] if find_callers else graph.edges[n]
-            ):
-                new_graph.add_node(connected_node)
-                q.put((connected_node, d + 1))
+def _extract_file(file: str) -> Tuple[List[str], List[Tuple[str, List[str]]]]:
+    """
+    Parse the file and return its functions and calls in a picklable and
+    JSON-serializable form. This runs in the worker processes.
+    """
+    functions, calls = _parse_tree(
+        lang=filename_to_lang(file),
+        module=_get_module_name(file),
+        tree=_get_tree(file),
+    )
+    return functions, [(caller, list(callees)) for caller, callees in calls.items()]
+
+
+def _get_cache_file() -> str:
+    return os.path.join(get_data_dir(), "callgraph_cache.json")
+
+
+def _extract_files(
+    files: List[str],
+) -> Dict[str, Tuple[List[str], List[Tuple[str, List[str]]]]]:
+    """
+    Return the functions and calls of each file. The results are cached by the
+    path, mtime and size of the file, so only new and modified files are parsed,
+    in parallel.
+    """
+    cache = get_json_store(_get_cache_file())
+    cached = cache.load()
+
+    results: Dict[str, Tuple[List[str], List[Tuple[str, List[str]]]]] = {}
+    stats: Dict[str, Tuple[int, int]] = {}
+    files_to_parse: List[str] = []
+    for file in files:
+        try:
+            st = os.stat(file)
+        except OSError as e:
+            print(f"WARN: {e}")
+            continue
+        stats[file] = (st.st_mtime_ns, st.st_size)
+
+        entry: Optional[Dict[str, Any]] = cached.get(os.path.abspath(file))
+        if (
+            entry is not None
+            and entry["version"] == _CACHE_VERSION
+            and (entry["mtime"], entry["size"]) == stats[file]
+        ):
+            results[file] = (entry["functions"], entry["calls"])
+        else:
+            files_to_parse.append(file)
+
+    logging.info(
+        f"Parse {len(files_to_parse)} of {len(stats)} files "
+        f"({len(stats) - len(files_to_parse)} cached)"
+    )
+
+    new_entries: Dict[str, Any] = {}
+
+    def add_result(file: str, result):
+        results[file] = result
+        mtime, size = stats[file]
+        new_entries[os.path.abspath(file)] = {
+            "version": _CACHE_VERSION,
+            "mtime": mtime,
+            "size": size,
+            "functions": result[0],
+            "calls": result[1],
+        }
+
+    if len(files_to_parse) >= _MIN_FILES_FOR_POOL:
+        with ProcessPoolExecutor() as executor:
+            futures = [(f, executor.submit(_extract_file, f)) for f in files_to_parse]
+            for file, future in futures:
+                try:
+                    add_result(file, future.result())
+                except Exception as e:
+                    print(f"WARN: {file}: {e}")
+    else:
+        for file in files_to_parse:
+            try:
+                add_result(file, _extract_file(file))
+            except Exception as e:
+                print(f"WARN: {file}: {e}")
+
+    # Written in one go, as each update is appended to the log of the store.
+    cache.update(new_entries)
+
+    # Keep the order of the input files.
+    return {file: results[file] for file in files if file in results}
+
+
+def _find_reachable_nodes(
+    sources: List[int], max_depth: int, offsets: array, targets: array
+) -> Set[int]:
+    """
+    Return the nodes that are at most `max_depth` edges away from any of the
+    source nodes, using a single breadth-first search from all the sources.
+    """
+    visited = set(sources)
+    frontier = sources
+    for _ in range(max_depth):
+        next_frontier: List[int] = []
+        for n in frontier:
+            for t in targets[offsets[n] : offsets[n + 1]]:
+                if t not in visited:
+                    visited.add(t)
+                    next_frontier.append(t)
+        if not next_frontier:
+            break
+        frontier = next_frontier
+    return visited
 
 
 def _filter_graph(
@@ -189,50 +376,135 @@ def _filter_graph(
     match_callees: Optional[int] = None,
     ignore_case=False,
 ) -> CallGraph:
-    filtered_nodes: Set[str] = set()
+    """
+    Return a new graph with the nodes matching `regex`, as well as their callers
+    and callees up to the given depth. The input graph is never returned, as it
+    may be shared by the cache of `_build_call_graph()`.
+    """
+    if not regex:
+        return graph.copy()
+
+    index = graph.get_index()
 
     # Filter nodes
-    for n in graph.nodes:
-        if regex and re.search(regex, n, re.IGNORECASE if ignore_case else 0):
-            filtered_nodes.add(n)
-
-    if filtered_nodes:
-        filtered_graph = CallGraph()
-
-        for node in graph.nodes:
-            if node in filtered_nodes:
-                # Add filtered nodes
-                filtered_graph.add_node(node)
-                filtered_graph.highlighted_nodes.add(node)
-
-                # Add caller and callee nodes
-                if match_callers is not None:
-                    _add_callers_or_callees_to_graph(
-                        node=node,
-                        max_depth=match_callers,
-                        graph=graph,
-                        new_graph=filtered_graph,
-                        find_callers=True,
-                    )
-
-                if match_callees is not None:
-                    _add_callers_or_callees_to_graph(
-                        node=node,
-                        max_depth=match_callees,
-                        graph=graph,
-                        new_graph=filtered_graph,
-                        find_callers=False,
-                    )
-
-        # Add edges
-        for caller, callees in graph.edges.items():
-            for callee in callees:
-                if caller in filtered_graph.nodes and callee in filtered_graph.nodes:
-                    filtered_graph.add_edge(caller, callee)
-
-        return filtered_graph
-    else:
-        return graph
+    patt = re.compile(regex, re.IGNORECASE if ignore_case else 0)
+    filtered_nodes = [i for i, n in enumerate(index.names) if patt.search(n)]
+    if not filtered_nodes:
+        return graph.copy()
+
+    node_ids = set(filtered_nodes)
+
+    # Add caller and callee nodes
+    if match_callers is not None:
+        node_ids |= _find_reachable_nodes(
+            filtered_nodes, match_callers, index.caller_offsets, index.callers
+        )
+    if match_callees is not None:
+        node_ids |= _find_reachable_nodes(
+            filtered_nodes, match_callees, index.callee_offsets, index.callees
+        )
+
+    filtered_graph = CallGraph()
+    for i in sorted(node_ids):
+        filtered_graph.add_node(index.names[i])
+    for i in filtered_nodes:
+        filtered_graph.highlighted_nodes.add(index.names[i])
+
+    # Add edges. Both ends have been added as nodes already.
+    for i in sorted(node_ids):
+        caller = index.names[i]
+        for j in index.callees[index.callee_offsets[i] : index.callee_offsets[i + 1]]:
+            if j in node_ids:
+                callee = index.names[j]
+                filtered_graph.edges[caller].add(callee)
+                filtered_graph.reverse_edges[callee].add(caller)
+
+    return filtered_graph
+
+
+def _get_last_word(s: str) -> Optional[str]:
+    match = re.search(r"\w+$", s)
+    return match.group(0) if match else None
+
+
+def _add_call_edges(graph: CallGraph, calls: DefaultOrderedDict) -> None:
+    """
+    Add an edge from each caller to every function whose name ends with the
+    callee. Instead of matching the callee against all the nodes, only the
+    nodes whose names end with the same word are matched.
+    """
+    nodes_by_last_word: DefaultDict[Optional[str], List[str]] = defaultdict(list)
+
+    def index_node(node: str):
+        nodes_by_last_word[_get_last_word(node)].append(node)
+
+    for node in graph.nodes:
+        index_node(node)
+
+    for caller, callees in calls.items():
+        for callee in callees:
+            last_word = _get_last_word(callee.removesuffix("()"))
+            candidates = (
+                nodes_by_last_word[last_word]
+                if last_word is not None
+                else list(graph.nodes)
+            )
+            callee_regex = re.compile(r"\b" + callee + "$")
+            matched_callees = [
+                function_name
+                for function_name in candidates
+                if callee_regex.search(function_name)
+            ]
+            for callee in matched_callees:
+                if callee != caller:  # avoid self-loop
+                    # The caller may be a class, which is not a node yet.
+                    if caller not in graph.nodes:
+                        graph.add_node(caller)
+                        index_node(caller)
+                    graph.add_edge(caller, callee)
+                    logging.info(f"Call: {caller} -> {callee}")
+
+
+def _get_file_stats(files: List[str]) -> Tuple[Tuple[str, int, int], ...]:
+    stats = []
+    for file in files:
+        try:
+            st = os.stat(file)
+            stats.append((file, st.st_mtime_ns, st.st_size))
+        except OSError:
+            stats.append((file, 0, 0))
+    return tuple(stats)
+
+
+@lru_cache(maxsize=4)
+def _build_call_graph(file_stats: Tuple[Tuple[str, int, int], ...]) -> CallGraph:
+    """
+    Build the unfiltered call graph of the files. The graph is reused by the
+    following queries on the same files, as long as none of them is modified,
+    so it must not be modified by the callers.
+    """
+    graph = CallGraph()
+
+    calls = DefaultOrderedDict(OrderedSet)
+
+    # Add nodes
+    logging.info("Build nodes...")
+    files = [file for file, _, _ in file_stats]
+    for file, (functions, calls2) in _extract_files(files).items():
+        _add_module_node(
+            graph=graph,
+            module=_get_module_name(file),
+        )
+
+        for function_name in functions:
+            graph.add_node(function_name)
+        for caller, callees in calls2:
+            calls[caller] = OrderedSet(callees)
+
+    # Add edges
+    _add_call_edges(graph=graph, calls=calls)
+
+    return graph
 
 
 def generate_call_graph(
@@ -242,61 +514,18 @@ def generate_call_graph(
     match_callees: Optional[int] = None,
     ignore_case=False,
 ) -> CallGraph:
-    graph = CallGraph()
-
-    calls = DefaultOrderedDict(OrderedSet)
-
     if regex:
         rg_args = ["rg", "-l", regex]
         if ignore_case:
             rg_args.insert(1, "-i")
-        subprocess.call(rg_args)
         result = subprocess.run(rg_args, capture_output=True, text=True, check=False)
         matched_files = set(result.stdout.splitlines())
         if files:
             files = [f for f in files if f in matched_files]
         else:
-            files = list(matched_files)
-
-    # Add nodes
-    logging.info("Build nodes...")
-    for file in files:
-        logging.info(f"Process file: {file}")
-
-        try:
-            lang = filename_to_lang(file)
-            module = _get_module_name(file)
-            tree = _get_tree(file)
-
-            _add_module_node(
-                graph=graph,
-                module=module,
-            )
-
-            functions, calls2 = _parse_tree(
-                lang=lang,
-                module=module,
-                tree=tree,
-            )
-
-            for function_name in functions:
-                graph.add_node(function_name)
-            calls.update(calls2)
-        except Exception as e:
-            print(f"WARN: {e}")
+            files = sorted(matched_files)
 
-    # Add edges
-    for caller, callees in calls.items():
-        for callee in callees:
-            matched_callees = [
-                function_name
-                for function_name in graph.nodes
-                if re.search(r"\b" + callee + "$", function_name)
-            ]
-            for callee in matched_callees:
-                if callee != caller:  # avoid self-loop
-                    graph.add_edge(caller, callee)
-                    logging.info(f"Call: {caller} -> {callee}")
+    graph = _build_call_graph(_get_file_stats(files))
 
     return _filter_graph(
         graph=graph,
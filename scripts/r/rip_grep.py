@@ -1,15 +1,28 @@
 import argparse
-import json
 import os
 import re
 import shlex
 import signal
 import subprocess
 import sys
+import threading
+from array import array
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from threading import Thread
-from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Literal,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    overload,
+)
 
 from _script import start_script
 from utils.jsonutil import load_json, save_json
@@ -18,22 +31,198 @@ from utils.menu import Menu
 _MODULE_NAME = Path(__file__).stem
 _DEFAULT_CONTEXT = 0
 
+# Number of matches to show at first and each time more are requested. Reading
+# the output of rg is paused in between, so that a broad pattern does not flood
+# the memory.
+_MATCH_PAGE_SIZE = 1000
+
+_FILE = 0
+_SEPARATOR = 1
+_MATCHED_LINE = 2
+_CONTEXT_LINE = 3
+
+_LINE_TYPES: Tuple[Literal["file", "matched_line", "context_line"], ...] = (
+    "file",
+    "file",
+    "matched_line",
+    "context_line",
+)
+
+# e.g. "12:345:text" for a match or "12-345-text" for a context line, which
+# follows the file path and a null byte.
+_RG_LINE_PREFIX = re.compile(rb"(\d+)([:-])(\d+)[:-]")
+
+
+@dataclass
+class _Match:
+    file: str
+
+
+@dataclass
+class _Line:
+    text: str
+    type: Literal["file", "matched_line", "context_line"]
+    match: _Match
+    line_number: Optional[int] = None
+
+    def __str__(self) -> str:
+        return self.text
+
+
+@lru_cache(maxsize=4096)
+def _read_line(file: str, offset: int) -> str:
+    try:
+        with open(file, "rb") as f:
+            f.seek(offset)
+            return f.readline().decode("utf-8", errors="replace").rstrip()
+    except OSError:
+        return ""
+
+
+class _GrepResults(Sequence[_Line]):
+    """
+    Rows of the search results grouped by file. Each row is stored compactly as
+    a file id, line number and the byte offset of the line in the file, and its
+    text is only read from the file when the row is shown.
+    """
+
+    def __init__(self, path: str, context: int = 0):
+        # The file paths printed by rg are relative to the directory it runs in.
+        self.__root = path if os.path.isdir(path) else ""
+        self.__context = context
+        self.__files: List[_Match] = []
+        self.__file_ids: Dict[bytes, int] = {}
+        self.__last_file_id = -1
+        self.__last_line_number = 0
+
+        self.__row_file_ids = array("I")
+        self.__row_line_numbers = array("I")
+        self.__row_offsets = array("Q")
+        self.__row_types = array("B")
+
+        self.match_count = 0
+        self.max_matches = _MATCH_PAGE_SIZE
+        self.cancelled = False
+        self.__cond = threading.Condition()
+
+    def __len__(self) -> int:
+        # The type is appended last, so that the other fields of a row are
+        # always there when it is counted.
+        return len(self.__row_types)
+
+    @overload
+    def __getitem__(self, index: int) -> _Line: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[_Line]: ...
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[_Line, List[_Line]]:
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError("row index out of range")
+
+        row_type = self.__row_types[index]
+        match = self.__files[self.__row_file_ids[index]]
+        if row_type == _FILE:
+            return _Line(match.file, type="file", match=match)
+        elif row_type == _SEPARATOR:
+            return _Line("", type="file", match=match)
+        else:
+            return _Line(
+                _read_line(
+                    os.path.join(self.__root, match.file), self.__row_offsets[index]
+                ),
+                type=_LINE_TYPES[row_type],
+                match=match,
+                line_number=self.__row_line_numbers[index],
+            )
+
+    def __append_row(self, file_id: int, line_number: int, offset: int, type: int):
+        self.__row_file_ids.append(file_id)
+        self.__row_line_numbers.append(line_number)
+        self.__row_offsets.append(offset)
+        self.__row_types.append(type)
+
+    def add_line(self, file: bytes, line_number: int, offset: int, is_match: bool):
+        file_id = self.__file_ids.get(file)
+        if file_id is None:
+            file_id = len(self.__files)
+            self.__file_ids[file] = file_id
+            self.__files.append(
+                _Match(file=os.fsdecode(file).replace(os.path.sep, "/"))
+            )
+
+        # A new code block
+        if file_id != self.__last_file_id:
+            self.__append_row(file_id, 0, 0, _FILE)
+        elif line_number != self.__last_line_number + 1 and self.__context > 0:
+            self.__append_row(file_id, 0, 0, _SEPARATOR)
+        self.__last_file_id = file_id
+        self.__last_line_number = line_number
+
+        self.__append_row(
+            file_id, line_number, offset, _MATCHED_LINE if is_match else _CONTEXT_LINE
+        )
+        if is_match:
+            self.match_count += 1
+
+    def wait_for_more(self) -> bool:
+        """
+        Block until another match can be added, and return False if the search
+        has been cancelled in the meantime.
+        """
+        with self.__cond:
+            while not self.cancelled and self.match_count >= self.max_matches:
+                self.__cond.wait()
+            return not self.cancelled
+
+    def is_paused(self) -> bool:
+        return self.match_count >= self.max_matches
+
+    def show_more(self):
+        with self.__cond:
+            self.max_matches = self.match_count + _MATCH_PAGE_SIZE
+            self.__cond.notify_all()
+
+    def cancel(self):
+        with self.__cond:
+            self.cancelled = True
+            self.__cond.notify_all()
+
 
 def run_ripgrep(
     pattern: str,
     path: str,
+    results: _GrepResults,
     context: int = 0,
     exclude: Optional[str] = None,
-    on_match: Optional[Callable[[str, List[Tuple[bool, int, str]]], None]] = None,
+    on_update: Optional[Callable[[], None]] = None,
     on_message: Optional[Callable[[str], None]] = None,
     on_process: Optional[Callable[[subprocess.Popen], None]] = None,
 ):
+    """
+    Run rg and add the matched lines to `results` as they arrive. Instead of
+    decoding the `--json` output, the file path, line number and byte offset are
+    parsed from the plain output, and the lines are read back from the files
+    when they are shown.
+    """
     args = [
         "rg",
         "--ignore-case",
         "-C",
         str(context),
-        "--json",
+        "--null",
+        "--with-filename",
+        "--line-number",
+        "--byte-offset",
+        "--no-heading",
+        "--no-context-separator",
+        "--color",
+        "never",
         "--glob",
         "!*.bak",
     ]
@@ -41,7 +230,7 @@ def run_ripgrep(
         args += ["--glob", "!" + exclude]
 
     # Search pattern
-    args.append(pattern)
+    args += ["--regexp", pattern]
 
     # Search file path (if specified)
     if os.path.isfile(path):
@@ -54,97 +243,67 @@ def run_ripgrep(
         args,
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        bufsize=1,
-        text=True,
-        encoding="utf-8",
         cwd=path if os.path.isdir(path) else None,
     )
 
     if on_process:
         on_process(process)
 
-    # variables
-    last_file_path = ""
-    last_line_number = 0
-    lines: List[Tuple[bool, int, str]] = []
-
     try:
-        while True:
-            assert process.stdout
-            json_str = process.stdout.readline()
-            if not json_str:
+        assert process.stdout
+        for line in process.stdout:
+            file, sep, rest = line.partition(b"\0")
+            match = _RG_LINE_PREFIX.match(rest) if sep else None
+            if match is None:
+                continue
+
+            is_match = match.group(2) == b":"
+            if is_match and not results.wait_for_more():
+                break
+            if results.cancelled:
                 break
 
-            data = json.loads(json_str)
-            data_type = data.get("type")
-            if data_type in ("context", "match"):
-                file_path = data["data"]["path"]["text"]
-                data_lines = data["data"]["lines"]
-                line_text = data_lines["text"].rstrip()
-                line_number = data["data"]["line_number"]
-
-                # A code block is ready
-                if last_file_path and (
-                    file_path != last_file_path or line_number != last_line_number + 1
-                ):
-                    if on_match:
-                        on_match(last_file_path, lines)
-                    lines.clear()
-
-                lines.append(
-                    (
-                        True if data_type == "match" else False,
-                        line_number,
-                        line_text,
-                    )
+            results.add_line(
+                file,
+                line_number=int(match.group(1)),
+                offset=int(match.group(3)),
+                is_match=is_match,
+            )
+            if on_update:
+                on_update()
+
+            if on_message and results.is_paused():
+                on_message(
+                    f"showing first {results.match_count} matches, "
+                    "press alt+m for more"
                 )
-                last_file_path = file_path
-                last_line_number = line_number
 
-        if last_file_path and lines:
-            if on_match:
-                on_match(last_file_path, lines)
+        if results.cancelled:
+            # The search may have been cancelled before the process was known.
+            process.kill()
+            process.wait()
+            return
 
         assert process.stderr
-        stderr_output = process.stderr.read()
+        stderr_output = process.stderr.read().decode("utf-8", errors="replace")
         if stderr_output:
             if on_message:
                 on_message(f"error: {stderr_output.strip()}")
 
         process.wait()
         if on_message:
-            if process.returncode != 0:
+            if process.returncode == 1 and not stderr_output:
+                on_message("no matches found")
+            elif process.returncode not in (0, 1):
                 on_message(f"rg exited with code {process.returncode}")
             else:
-                on_message("search completed")
+                on_message(f"search completed ({results.match_count} matches)")
 
     except Exception as e:
         if on_message:
             on_message(str(e))
 
 
-@dataclass
-class _Match:
-    file: str
-
-
-class _Line:
-    def __init__(
-        self,
-        text: str,
-        type: Literal["file", "matched_line", "context_line"],
-        match: _Match,
-        line_number: Optional[int] = None,
-    ) -> None:
-        self.text: str = text
-        self.type: Literal["file", "matched_line", "context_line"] = type
-        self.match: _Match = match
-        self.line_number = line_number
-
-    def __str__(self) -> str:
-        return self.text
-
-
 class GrepMenu(Menu[_Line]):
     def __init__(
         self,
@@ -157,10 +316,10 @@ class GrepMenu(Menu[_Line]):
         self.__context = context
         self.__path = path if path else os.getcwd()
         self.__exclude = exclude
-        self.__last_file: Optional[str] = None
+        self.__results = _GrepResults(self.__path)
+        self.__highlight_regex: Optional[re.Pattern] = None
         self.__data_file = os.path.join(".config", f"{_MODULE_NAME}.json")
         self.__data: Dict[str, Any] = load_json(self.__data_file, default={})
-        self.__pattern = ""
         self.__thread: Optional[Thread] = None
         self.__process: Optional[subprocess.Popen] = None
 
@@ -173,14 +332,19 @@ class GrepMenu(Menu[_Line]):
 
         self.add_command(self.__list_search_history, hotkey="ctrl+l")
         self.add_command(self.__edit_file, hotkey="ctrl+e")
+        self.add_command(self.__show_more, hotkey="alt+m")
 
         if pattern:
             self.set_input(pattern)
 
     def get_item_text(self, line: _Line) -> str:
-        return (
-            line.text if line.type == "file" else f"{line.line_number:3d} {line.text}"
-        )
+        if line.type == "file":
+            return line.text
+
+        text = line.text
+        if line.type == "matched_line" and self.__highlight_regex is not None:
+            text = self.__highlight_regex.sub("\x1b[1;31m\\1\x1b[0m", text)
+        return f"{line.line_number:3d} {text}"
 
     def __list_search_history(self):
         history: List[str] = self.__data["history"]
@@ -203,34 +367,8 @@ class GrepMenu(Menu[_Line]):
                 ],
             )
 
-    def __add_match(self, file: str, lines: List[Tuple[bool, int, str]]):
-        file_path = file.replace(os.path.sep, "/")
-        match = _Match(file=file_path)
-
-        if match.file != self.__last_file:
-            self.append_item(_Line(match.file, type="file", match=match))
-        elif _DEFAULT_CONTEXT > 0:
-            self.append_item(_Line("", type="file", match=match))
-        self.__last_file = match.file
-
-        for is_match, line_number, line in lines:
-            self.append_item(
-                _Line(
-                    (
-                        re.sub(
-                            "(" + self.__pattern + ")",
-                            "\x1b[1;31m\\1\x1b[0m",
-                            line,
-                            flags=re.IGNORECASE,
-                        )
-                        if is_match
-                        else line
-                    ),
-                    type="matched_line" if is_match else "context_line",
-                    match=match,
-                    line_number=line_number,
-                )
-            )
+    def __show_more(self):
+        self.__results.show_more()
 
     def get_item_color(self, line: _Line) -> str:
         if line.type == "file":
@@ -245,9 +383,19 @@ class GrepMenu(Menu[_Line]):
     def __start_rg(self, pattern: str):
         self.__stop_rg()
 
-        self.items.clear()
-        self.__last_file = None
-        self.__pattern = pattern
+        # Lines are read from the files again, which may have been edited.
+        _read_line.cache_clear()
+        self.__results = _GrepResults(self.__path, context=self.__context)
+        self.items = self.__results  # type: ignore
+        self.reset_selection()
+        self.update_screen()
+
+        try:
+            self.__highlight_regex = re.compile(
+                "(" + pattern + ")", flags=re.IGNORECASE
+            )
+        except re.error:
+            self.__highlight_regex = None
 
         # Save search history
         if "history" not in self.__data:
@@ -259,23 +407,26 @@ class GrepMenu(Menu[_Line]):
         self.__data["history"].insert(0, pattern)
         save_json(self.__data_file, self.__data)
 
-        def on_match(file, lines):
-            self.__add_match(file=file, lines=lines)
+        results = self.__results
 
         def on_message(message):
-            self.set_message(message)
+            # Ignore the messages from a cancelled search.
+            if not results.cancelled:
+                self.set_message(message)
 
         def on_process(process):
-            self.__process = process
+            if not results.cancelled:
+                self.__process = process
 
         self.__thread = Thread(
             target=run_ripgrep,
             kwargs=dict(
                 pattern=pattern,
                 path=self.__path,
+                results=results,
                 context=self.__context,
                 exclude=self.__exclude,
-                on_match=on_match,
+                on_update=self.update_screen,
                 on_message=on_message,
                 on_process=on_process,
             ),
@@ -283,6 +434,8 @@ class GrepMenu(Menu[_Line]):
         self.__thread.start()
 
     def __stop_rg(self):
+        # Also wakes up the reader thread if it is waiting for "show more".
+        self.__results.cancel()
         if self.__process:
             if sys.platform == "win32":
                 os.kill(self.__process.pid, signal.CTRL_C_EVENT)
@@ -0,0 +1,88 @@
+import argparse
+import threading
+import time
+
+from _scriptmanager import ScriptManager
+from utils.fswatch import watch_directory
+from utils.script.path import get_script_directories
+
+
+def _measure_cpu_time(func, duration: float) -> float:
+    start = time.process_time()
+    func(duration)
+    return time.process_time() - start
+
+
+def _idle_with_polling(script_manager: ScriptManager, interval: float):
+    def run(duration: float):
+        end_time = time.time() + duration
+        while time.time() < end_time:
+            script_manager.refresh_all_scripts()
+            time.sleep(interval)
+
+    return run
+
+
+def _idle_with_watcher(script_manager: ScriptManager):
+    def run(duration: float):
+        script_manager.start_watching_scripts()
+        time.sleep(duration)
+        script_manager.pop_changed_files()
+        script_manager.stop_watching_scripts()
+
+    return run
+
+
+def _idle_with_polling_watcher(interval: float):
+    def run(duration: float):
+        stop_event = threading.Event()
+        threads = [
+            threading.Thread(
+                target=lambda path=d.path: [
+                    _
+                    for _ in watch_directory(
+                        path, stop_event=stop_event, poll=True, poll_interval=interval
+                    )
+                ],
+                daemon=True,
+            )
+            for d in get_script_directories()
+        ]
+        for t in threads:
+            t.start()
+        time.sleep(duration)
+        stop_event.set()
+        for t in threads:
+            t.join()
+
+    return run
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare the idle CPU time of script refresh strategies."
+    )
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    args = parser.parse_args()
+
+    script_manager = ScriptManager(start_daemon=False)
+    script_manager.refresh_all_scripts()
+    print(f"scripts: {len(script_manager.scripts)}")
+
+    for name, func in [
+        (
+            f"refresh_all_scripts() every {args.interval}s",
+            _idle_with_polling(script_manager, args.interval),
+        ),
+        ("watch_directory()", _idle_with_watcher(script_manager)),
+        (
+            f"watch_directory(poll=True) every {args.interval}s",
+            _idle_with_polling_watcher(args.interval),
+        ),
+    ]:
+        cpu_time = _measure_cpu_time(func, args.duration)
+        print(
+            f"{name:<48}: cpu {cpu_time:.3f}s"
+            f" ({cpu_time / args.duration * 100:.2f}%)"
+        )
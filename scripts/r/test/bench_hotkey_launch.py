@@ -0,0 +1,97 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List
+
+from _script import Script
+from _scriptmanager import ScriptManager
+from _scriptserver import ScriptServer
+from utils.script.path import get_bin_dir
+
+
+def _create_script(temp_dir: str) -> str:
+    """
+    Create a background script that records the time when it is executed.
+    """
+    script_path = os.path.join(temp_dir, "hotkey_bench.py")
+    with open(script_path, "w") as f:
+        f.write(
+            "import sys, time\n"
+            "with open(sys.argv[1], 'w') as f:\n"
+            "    f.write(str(time.time()))\n"
+        )
+    with open(os.path.join(temp_dir, "hotkey_bench.config.json"), "w") as f:
+        json.dump({"background": True, "template": False}, f)
+    return script_path
+
+
+def _measure_latency(launcher: str, script_path: str, repeat: int) -> List[float]:
+    """
+    Return the time from starting the launcher to the script being executed.
+    """
+    out_file = script_path + ".out"
+    latencies = []
+    for _ in range(repeat):
+        if os.path.exists(out_file):
+            os.remove(out_file)
+
+        start_time = time.time()
+        subprocess.check_call(
+            [
+                sys.executable,
+                os.path.join(get_bin_dir(), launcher),
+                "--restart-instance=auto",
+                script_path,
+                out_file,
+            ]
+        )
+        while not os.path.exists(out_file) or os.path.getsize(out_file) == 0:
+            time.sleep(0.001)
+        with open(out_file) as f:
+            latencies.append(float(f.read()) - start_time)
+    return latencies
+
+
+def _print_latencies(name: str, latencies: List[float]):
+    latencies = sorted(latencies)
+    print(
+        f"{name:<40}: min {latencies[0] * 1000:.1f}ms"
+        f" median {latencies[len(latencies) // 2] * 1000:.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the latency from a global hotkey to script execution."
+    )
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        script_path = _create_script(temp_dir)
+
+        _print_latencies(
+            "start_script.py",
+            _measure_latency("start_script.py", script_path, args.repeat),
+        )
+        _print_latencies(
+            "start_script_client.py (no server)",
+            _measure_latency("start_script_client.py", script_path, args.repeat),
+        )
+
+        script_manager = ScriptManager(start_daemon=False)
+        script_manager.scripts.append(Script(script_path))
+        script_server = ScriptServer(script_manager=script_manager)
+        script_server.start_server()
+        time.sleep(0.5)
+        try:
+            _print_latencies(
+                "start_script_client.py",
+                _measure_latency("start_script_client.py", script_path, args.repeat),
+            )
+        finally:
+            script_server.stop_server()
@@ -0,0 +1,91 @@
+import argparse
+import asyncio
+import json
+import time
+from typing import AsyncIterator, List
+
+from utils.http import iter_lines, iter_sse_events
+
+
+class _FakeContent:
+    def __init__(self, data: bytes, chunk_size: int):
+        self.data = data
+        self.chunk_size = chunk_size
+
+    async def iter_chunked(self, n: int) -> AsyncIterator[bytes]:
+        # The chunks are as large as the network delivers them, not `n`.
+        for i in range(0, len(self.data), self.chunk_size):
+            yield self.data[i : i + self.chunk_size]
+
+
+async def _iter_lines_old(content, chunk_size: int = 64 * 1024):
+    buffer = b""
+    async for chunk in content.iter_chunked(chunk_size):
+        buffer += chunk
+
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            yield line
+
+    if buffer:
+        yield buffer
+
+
+async def _parse_old(content) -> List[str]:
+    events = []
+    async for line in _iter_lines_old(content):
+        line = line.rstrip(b"\n")
+        if line.startswith(b"data: "):
+            events.append(line[6:].decode("utf-8"))
+    return events
+
+
+async def _parse_new(content) -> List[str]:
+    return [event.data async for event in iter_sse_events(content)]
+
+
+async def _count_lines(content) -> int:
+    return sum([1 async for _ in iter_lines(content)])
+
+
+def _create_stream(events: int) -> bytes:
+    s = ""
+    for i in range(events):
+        data = {"type": "content_block_delta", "index": 0, "delta": {"text": str(i)}}
+        s += "event: content_block_delta\ndata: " + json.dumps(data) + "\n\n"
+    return s.encode("utf-8")
+
+
+def _measure(func, data: bytes, chunk_size: int):
+    start = time.perf_counter()
+    result = asyncio.run(func(_FakeContent(data, chunk_size)))
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark parsing SSE streams.")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    for events in (10000, 50000, 100000):
+        data = _create_stream(events)
+        old_time, old_events = _measure(_parse_old, data, args.chunk_size)
+        new_time, new_events = _measure(_parse_new, data, args.chunk_size)
+        assert old_events == new_events
+        print(
+            f"events={events:<7} size={len(data) / 1e6:.1f}MB"
+            f" old={old_time * 1000:.1f}ms"
+            f" iter_sse_events={new_time * 1000:.1f}ms"
+        )
+
+    # A single long line split into many small chunks.
+    for size in (1, 4, 16):
+        data = b"x" * (size * 1024 * 1024) + b"\n"
+        old_time, _ = _measure(_parse_old, data, 4096)
+        new_time, lines = _measure(_count_lines, data, 4096)
+        assert lines == 1
+        print(
+            f"line={size}MB chunk=4KB"
+            f" old={old_time * 1000:.1f}ms"
+            f" iter_lines={new_time * 1000:.1f}ms"
+        )
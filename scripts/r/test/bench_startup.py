@@ -0,0 +1,69 @@
+import argparse
+import os
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+from utils.script.path import get_my_script_root
+
+# Modules that should never be imported when starting a script, e.g. by a
+# global hotkey.
+_MENU_MODULES = ("curses", "utils.menu")
+
+
+def _import_time(module: str) -> Tuple[int, List[Tuple[str, int, int]]]:
+    """
+    Import the module in a fresh interpreter and return the total import time
+    and the (module, self time, cumulative time) of each import, in us.
+    """
+    root = get_my_script_root()
+    env = os.environ.copy()
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.join(root, "libs"), root, env.get("PYTHONPATH", "")]
+    )
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+
+    imports: List[Tuple[str, int, int]] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if self_us.strip().isdigit():
+            imports.append((name.strip(), int(self_us), int(cumulative_us)))
+    total = sum(self_us for _, self_us, _ in imports)
+    return total, imports
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Measure the import time of the modules used at startup."
+    )
+    parser.add_argument(
+        "modules", nargs="*", default=["_script", "_scriptmanager", "myscripts"]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    for module in args.modules:
+        # Keep the fastest run to filter out noise.
+        runs = [_import_time(module) for _ in range(args.repeat)]
+        total, imports = min(runs, key=lambda x: x[0])
+
+        menu_modules = sorted(
+            name for name, _, _ in imports if name.startswith(_MENU_MODULES)
+        )
+        print(f"{module}: {total / 1000:.1f}ms, {len(imports)} modules")
+        print(f"  menu modules: {', '.join(menu_modules) or '(none)'}")
+
+        cumulative: Dict[str, int] = {name: us for name, _, us in imports}
+        for name, us in sorted(cumulative.items(), key=lambda x: -x[1])[
+            1 : args.top + 1
+        ]:
+            print(f"  {us / 1000:8.1f}ms  {name}")
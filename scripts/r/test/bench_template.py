@@ -0,0 +1,46 @@
+import argparse
+import time
+
+from utils.template import Template, render_template
+
+
+def _create_template(sections: int) -> str:
+    s = ""
+    for i in range(sections):
+        s += f"## Section {i}\n"
+        s += "{{if show_table}}"
+        s += "{{for row in range(rows)}}| {{row}} | {{row * " + str(i) + "}} |\n{{end}}"
+        s += "{{else}}(hidden){{end}}\n"
+        s += "{{title.upper()}}: {{count = count + 1}}{{count}}\n"
+    return s
+
+
+def _measure(func, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark template rendering.")
+    parser.add_argument("--rows", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    context = {"show_table": True, "rows": args.rows, "title": "hello", "count": 0}
+    for sections in (100, 200, 400):
+        text = _create_template(sections)
+        template = Template(text)
+
+        compile_time = _measure(lambda: Template.compile(template, text + " "), 1)
+        render_time = _measure(lambda: template.render(context), args.repeat)
+        cached_render_time = _measure(
+            lambda: render_template(text, context=context), args.repeat
+        )
+        print(
+            f"sections={sections:<4} size={len(text):<7}"
+            f" compile={compile_time * 1000:.1f}ms"
+            f" render={render_time * 1000:.1f}ms"
+            f" render_template={cached_render_time * 1000:.1f}ms"
+        )
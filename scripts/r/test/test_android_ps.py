@@ -0,0 +1,38 @@
+import unittest
+
+from utils.android import _parse_process_names
+
+
+class TestParseProcessNames(unittest.TestCase):
+    def test_cmdline(self):
+        out = (
+            "PID CMDLINE\n"
+            "    1 /init second_stage\n"
+            " 1234 com.example.app\n"
+            " 1240 com.example.app:remote\n"
+        )
+        self.assertEqual(
+            _parse_process_names(out),
+            {
+                1: "/init second_stage",
+                1234: "com.example.app",
+                1240: "com.example.app:remote",
+            },
+        )
+
+    def test_legacy_toolbox(self):
+        out = (
+            "USER     PID   PPID  VSIZE  RSS     WCHAN    PC         NAME\n"
+            "root      1     0     8908   632   c0163d18 0000e46c S /init\n"
+            "u0_a52    1234  120   512340 34000 ffffffff 00000000 S com.example.app\n"
+        )
+        self.assertEqual(
+            _parse_process_names(out), {1: "/init", 1234: "com.example.app"}
+        )
+
+    def test_empty(self):
+        self.assertEqual(_parse_process_names(""), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+
+from utils.jsonstore import JsonStore
+from utils.jsonutil import load_json, update_json
+
+
+class TestJsonStore(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.file = os.path.join(self.temp_dir.name, "data.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_update(self):
+        with open(self.file, "w") as f:
+            json.dump({"a": 1}, f)
+
+        store = JsonStore(self.file)
+        store.update({"b": 2})
+        self.assertEqual(store.load(), {"a": 1, "b": 2})
+
+        # Changes made by another instance are visible.
+        JsonStore(self.file).update({"a": 3})
+        self.assertEqual(store.get("a"), 3)
+
+    def test_ignore_partial_line(self):
+        store = JsonStore(self.file)
+        store.update({"a": 1})
+        with open(store.log_file, "ab") as f:
+            f.write(b'{"b": ')
+
+        store = JsonStore(self.file)
+        self.assertEqual(store.load(), {"a": 1})
+        store.update({"c": 3})
+        self.assertEqual(JsonStore(self.file).load(), {"a": 1, "c": 3})
+
+    def test_external_edit(self):
+        store = JsonStore(self.file)
+        store.update({"a": 1, "b": 2})
+
+        # The log written before the JSON file was edited is ignored.
+        with open(self.file, "w") as f:
+            json.dump({"a": 3}, f)
+        self.assertEqual(store.load(), {"a": 3})
+        self.assertEqual(JsonStore(self.file).load(), {"a": 3})
+
+        store.update({"c": 4})
+        self.assertEqual(JsonStore(self.file).load(), {"a": 3, "c": 4})
+
+    def test_compact(self):
+        store = JsonStore(self.file)
+        store.update({"a": 1})
+        store.compact()
+        with open(self.file) as f:
+            self.assertEqual(json.load(f), {"a": 1})
+
+        store.update({"b": 2})
+        self.assertEqual(JsonStore(self.file).load(), {"a": 1, "b": 2})
+
+    def test_update_json(self):
+        update_json(self.file, {"a": 1})
+        update_json(self.file, {"b": 2}, store=True)
+        self.assertEqual(load_json(self.file, default={}, store=True), {"a": 1, "b": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
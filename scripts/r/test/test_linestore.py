@@ -0,0 +1,84 @@
+import os
+import tempfile
+import time
+import unittest
+
+from utils.menu.linestore import FileLines, LineStore
+from utils.menu.matcher import ItemMatcher
+
+
+class TestLineStore(unittest.TestCase):
+    def test_spill(self):
+        lines = ["line %d" % i for i in range(1000)]
+        store = LineStore(max_lines=100)
+        store.extend(lines)
+        self.assertEqual(len(store), len(lines))
+        self.assertGreater(store.spilled_count, 0)
+        self.assertEqual(list(store), lines)
+        self.assertEqual(store[-1], lines[-1])
+
+        # The snapshot does not change when lines are appended.
+        snapshot = store.copy()
+        store.append("new line")
+        self.assertEqual(len(snapshot), len(lines))
+
+        store.clear()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(snapshot[0], lines[0])
+
+    def test_search(self):
+        lines = ["foo", "", "bar foo", "Foo bar", "baz", "foo"] * 50
+        store = LineStore(max_lines=16)
+        store.extend(lines)
+
+        matcher = ItemMatcher(fuzzy=False)
+        for patt in ["foo", "^foo$", "^$", r"foo\s+bar", r"bar\s"]:
+            regex = matcher.get_line_regex(patt)
+            assert regex is not None
+            self.assertEqual(
+                store.search(regex),
+                [i for i, line in enumerate(lines) if matcher.match(patt, line, i)],
+                patt,
+            )
+
+
+class TestFileLines(unittest.TestCase):
+    def test_file_lines(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            files = []
+            expected = []
+            for i, (text, lines) in enumerate(
+                [
+                    ("foo\r\n\nbar foo\r\n", ["foo", "", "bar foo"]),
+                    ("x" * 100000 + "\nbaz", ["x" * 100000, "baz"]),
+                ]
+            ):
+                file = os.path.join(temp_dir, "%d.log" % i)
+                with open(file, "w", newline="") as f:
+                    f.write(text)
+                files.append(file)
+                expected += ["%d: %s" % (i, line) for line in lines]
+
+            file_lines = FileLines(files, prefixes=["0: ", "1: "])
+            while not file_lines.is_indexed():
+                time.sleep(0.01)
+            self.assertEqual(list(file_lines), expected)
+
+            matcher = ItemMatcher(fuzzy=False)
+            for patt in ["foo", "^0: foo$", ": $", "^1", "baz$"]:
+                regex = matcher.get_line_regex(patt)
+                assert regex is not None
+                self.assertEqual(
+                    file_lines.search(regex),
+                    [
+                        i
+                        for i, line in enumerate(expected)
+                        if matcher.match(patt, line, i)
+                    ],
+                    patt,
+                )
+            file_lines.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+from utils.menu.matcher import ItemMatcher
+
+
+def _match_all(matcher: ItemMatcher, patt: str, items):
+    matches = [
+        (i, rank)
+        for i in matcher.get_candidates(patt, items)
+        if (rank := matcher.match(patt, items[i], i)) > 0
+    ]
+    matcher.set_matched_indices(patt, (i for i, _ in matches), len(items))
+    return [i for i, _ in sorted(matches, key=lambda x: x[1], reverse=True)]
+
+
+class TestItemMatcher(unittest.TestCase):
+    def test_fuzzy_match(self):
+        matcher = ItemMatcher()
+        items = ["Apple Pie", "pineapple", "Banana"]
+        self.assertEqual(_match_all(matcher, "", items), [0, 1, 2])
+        self.assertEqual(_match_all(matcher, "APP", items), [0, 1])
+        self.assertEqual(_match_all(matcher, "app pie", items), [0])
+        self.assertEqual(_match_all(matcher, "xyz", items), [])
+
+    def test_rank_word_start(self):
+        matcher = ItemMatcher()
+        items = ["dialog.py", "logcat.py", "r/log.sh"]
+        self.assertEqual(_match_all(matcher, "log", items), [1, 2, 0])
+
+    def test_rank_contiguity(self):
+        matcher = ItemMatcher()
+        items = ["open file menu", "open menu file", "menu_open_file"]
+        self.assertEqual(_match_all(matcher, "open file", items), [0, 2, 1])
+
+    def test_items_changed_in_place(self):
+        class Item:
+            def __init__(self, text: str):
+                self.text = text
+
+            def __str__(self) -> str:
+                return self.text
+
+        matcher = ItemMatcher()
+        items = [Item("foo"), Item("bar")]
+        self.assertEqual(_match_all(matcher, "bar", items), [1])
+
+        # Replaced items are not taken from the cache.
+        items = [Item("bar"), items[1]]
+        self.assertEqual(_match_all(matcher, "bar", items), [0, 1])
+
+        items[1].text = "baz"
+        matcher.invalidate()
+        self.assertEqual(_match_all(matcher, "bar", items), [0])
+
+    def test_narrow_down_previous_matches(self):
+        matcher = ItemMatcher()
+        items = ["foo", "foobar", "bar"]
+        self.assertEqual(_match_all(matcher, "fo", items), [0, 1])
+        self.assertEqual(list(matcher.get_candidates("foob", items)), [0, 1])
+
+        # Items appended since the last match are also candidates.
+        items.append("foobaz")
+        self.assertEqual(_match_all(matcher, "foob", items), [1, 3])
+
+        # Changed items invalidate the previous matches.
+        items[0] = "foobar2"
+        self.assertEqual(_match_all(matcher, "foobar", items), [0, 1])
+
+    def test_items_appended_during_search(self):
+        matcher = ItemMatcher()
+        items = ["foo", "bar", "foobar"]
+        snapshot = list(items)
+        candidates = list(matcher.get_candidates("f", snapshot))
+
+        # An item is appended and matched on another thread during the search.
+        items.append("foo2")
+        matcher.match("f", items[3], 3)
+
+        matches = [i for i in candidates if matcher.match("f", snapshot[i], i) > 0]
+        matcher.set_matched_indices("f", matches, len(snapshot))
+        self.assertEqual(list(matcher.get_candidates("fo", items)), [0, 2, 3])
+
+    def test_regex_match(self):
+        matcher = ItemMatcher(fuzzy=False)
+        items = ["ERROR: a", "info: b", "error: c"]
+        self.assertEqual(_match_all(matcher, "^error", items), [0, 2])
+        self.assertEqual(_match_all(matcher, "^error|info", items), [0, 1, 2])
+        self.assertEqual(_match_all(matcher, "(", items), [])
+
+    def test_index_pattern(self):
+        matcher = ItemMatcher()
+        items = ["a", "b", "c"]
+        self.assertEqual(_match_all(matcher, ":2", items), [1])
+        self.assertEqual(_match_all(matcher, ":23", items), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
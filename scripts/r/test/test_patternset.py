@@ -0,0 +1,38 @@
+import re
+import unittest
+
+from utils.patternset import PatternSet, get_required_literal
+
+
+class TestPatternSet(unittest.TestCase):
+    def test_required_literal(self):
+        self.assertEqual(get_required_literal(re.compile(r"https?://\S+")), "http")
+        self.assertEqual(get_required_literal(re.compile(r"ab(cd)?ef")), "ab")
+        self.assertEqual(get_required_literal(re.compile(r"(?:xyz)+")), "xyz")
+        self.assertIsNone(get_required_literal(re.compile(r"foo|bar")))
+        self.assertIsNone(get_required_literal(re.compile(r"(?i)foo")))
+        self.assertIsNone(get_required_literal(re.compile(r"(?:foo)?\d+")))
+
+    def test_search(self):
+        patterns: PatternSet[str] = PatternSet()
+        patterns.add(r"https?://\S+", "url")
+        patterns.add(r"https?://\S+", "url2")
+        patterns.add(r"^\d+$", "number")
+        patterns.add(r"(?i)FOO", "foo")
+        self.assertEqual(len(patterns), 4)
+        self.assertEqual(list(patterns.search("see http://a.b")), ["url", "url2"])
+        self.assertEqual(list(patterns.search("123")), ["number"])
+        self.assertEqual(list(patterns.search("foo")), ["foo"])
+        self.assertEqual(list(patterns.search("bar")), [])
+
+    def test_finditer(self):
+        patterns: PatternSet[str] = PatternSet()
+        patterns.add(r"\d+", "number")
+        self.assertEqual(
+            [(value, m.group(0)) for value, m in patterns.finditer("1 22 333")],
+            [("number", "1"), ("number", "22"), ("number", "333")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,91 @@
+import json
+import os
+import socket
+import tempfile
+import time
+import unittest
+import urllib.error
+import urllib.request
+
+from _script import Script
 from _scriptmanager import ScriptManager
 from _scriptserver import ScriptServer
 from utils.logger import setup_logger
 
+
+class _FakeScriptManager:
+    def __init__(self, script: Script):
+        self.script = script
+
+    def get_script_by_path(self, script_path: str):
+        return self.script if script_path == self.script.script_path else None
+
+
+def _get_free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestStartScript(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.script_file = os.path.join(self.temp_dir.name, "hello.sh")
+        with open(self.script_file, "w") as f:
+            f.write("echo hello\n")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def start_script(self, config, args=[]) -> int:
+        with open(os.path.splitext(self.script_file)[0] + ".config.json", "w") as f:
+            json.dump(config, f)
+
+        port = _get_free_port()
+        server = ScriptServer(
+            _FakeScriptManager(Script(self.script_file)),  # type: ignore
+            port=port,
+        )
+        server.start_server()
+        try:
+            req = urllib.request.Request(
+                f"http://127.0.0.1:{port}/start-script",
+                data=json.dumps({"file": self.script_file, "args": args}).encode(),
+                method="POST",
+            )
+            for _ in range(50):
+                try:
+                    with urllib.request.urlopen(req) as resp:
+                        return resp.status
+                except urllib.error.HTTPError as ex:
+                    return ex.code
+                except urllib.error.URLError:
+                    # The server is not listening yet.
+                    time.sleep(0.1)
+            raise Exception("Cannot connect to the script server")
+        finally:
+            server.stop_server()
+
+    def test_script_asks_for_input(self):
+        for config in [
+            {"newWindow": True, "args.userInput": True},
+            {"newWindow": True, "args.selectFiles": True},
+            {"background": True, "args.selectDir": True},
+            {"background": True, "var.required": "_TEST_SCRIPT_SERVER_UNSET_VAR"},
+        ]:
+            with self.subTest(config=config):
+                self.assertEqual(self.start_script(config), 409)
+
+    def test_script_runs_in_foreground(self):
+        self.assertEqual(self.start_script({"newWindow": False}), 409)
+
+    def test_args_passed(self):
+        with open(os.path.splitext(self.script_file)[0] + ".config.json", "w") as f:
+            json.dump({"newWindow": True, "args.userInput": True}, f)
+        script = Script(self.script_file)
+        self.assertTrue(script.needs_user_input([]))
+        self.assertFalse(script.needs_user_input(["hello"]))
+
 if __name__ == "__main__":
     setup_logger()
     script_manager = ScriptManager(start_daemon=False)
@@ -0,0 +1,193 @@
+import functools
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import tarfile
+from typing import List, Optional, Tuple
+
+import numpy as np
+from _filelock import FileLock
+from PIL import Image
+
+CACHE_DIR = "tmp/cache/clips"
+
+# The least recently used files are removed once the cache grows beyond this.
+MAX_CACHE_SIZE = 10 * 1024 * 1024 * 1024
+
+# Number of bytes read from both ends of a file to compute its fingerprint.
+_FINGERPRINT_BLOCK_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=None)
+def _get_file_fingerprint(file: str, size: int, mtime_ns: int) -> str:
+    h = hashlib.md5(("%d:%d" % (size, mtime_ns)).encode())
+    with open(file, "rb") as f:
+        h.update(f.read(_FINGERPRINT_BLOCK_SIZE))
+        if size > _FINGERPRINT_BLOCK_SIZE:
+            f.seek(max(_FINGERPRINT_BLOCK_SIZE, size - _FINGERPRINT_BLOCK_SIZE))
+            h.update(f.read())
+    return h.hexdigest()
+
+
+def get_file_fingerprint(file: str) -> str:
+    """
+    Return a hash of the file size, mtime and the first and last megabyte of
+    the content, which is much cheaper than hashing a whole video file. The
+    mtime catches the edits that change neither the size nor both ends.
+    """
+    st = os.stat(file)
+    return _get_file_fingerprint(os.path.abspath(file), st.st_size, st.st_mtime_ns)
+
+
+def _get_cache_file(file: str, ext: str, **params) -> str:
+    key = json.dumps(
+        {"file": get_file_fingerprint(file), **params},
+        sort_keys=True,
+    )
+    return os.path.join(CACHE_DIR, hashlib.md5(key.encode("utf-8")).hexdigest() + ext)
+
+
+def _evict(max_size: int = MAX_CACHE_SIZE):
+    files: List[Tuple[float, int, str]] = []
+    total_size = 0
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                st = entry.stat()
+                files.append((st.st_mtime, st.st_size, entry.path))
+                total_size += st.st_size
+
+    # The mtime of a cache file is updated whenever it is used.
+    files.sort()
+    for _, size, path in files:
+        if total_size <= max_size:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+            logging.debug(f"Evicted {path} from clip cache")
+        except OSError:
+            # The file may still be open in another process on Windows.
+            pass
+
+
+def _get_or_create(cache_file: str, create) -> str:
+    """
+    Return `cache_file` after creating it with `create(tmp_file)` if it does not
+    exist yet. The lock prevents worker processes that load the same clip from
+    creating it more than once.
+    """
+    key = os.path.splitext(os.path.basename(cache_file))[0]
+    with FileLock("videoedit_clipcache_" + key):
+        if os.path.exists(cache_file):
+            os.utime(cache_file)
+            return cache_file
+
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp_file = "%s.%d.tmp" % (cache_file, os.getpid())
+        try:
+            create(tmp_file)
+            os.replace(tmp_file, cache_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    _evict()
+    return cache_file
+
+
+def get_video_proxy(file: str, size: Tuple[int, int]) -> str:
+    """
+    Return a copy of the video file scaled to `size` (width, height), so that
+    the full resolution source does not have to be decoded and scaled again.
+    The audio stream is copied as is.
+    """
+    w, h = size
+
+    def create(out_file: str):
+        print("Create proxy for %s (%dx%d)" % (file, w, h))
+        subprocess.check_call(
+            [
+                "ffmpeg",
+                "-hide_banner",
+                "-loglevel",
+                "error",
+                "-i",
+                file,
+                "-map",
+                "0:v:0",
+                "-map",
+                "0:a?",
+                "-vf",
+                "scale=%d:%d:flags=bicubic" % (w, h),
+                "-c:v",
+                "libx264",
+                "-preset",
+                "veryfast",
+                "-crf",
+                "12",
+                # Unlike yuv420p, this allows odd sizes and keeps sharp edges
+                # in screen recordings.
+                "-pix_fmt",
+                "yuv444p",
+                "-c:a",
+                "copy",
+                "-f",
+                "matroska",
+                "-y",
+                out_file,
+            ]
+        )
+
+    return _get_or_create(_get_cache_file(file, ".mkv", size=[w, h]), create)
+
+
+def get_image_seq_frames(
+    tar_file: str, size: Optional[Tuple[int, int]] = None
+) -> np.ndarray:
+    """
+    Return the frames of an image sequence stored as a .tar file, optionally
+    scaled to `size` (width, height), as a memory-mapped array of shape
+    (frames, height, width, channels).
+    """
+
+    def create(out_file: str):
+        print("Convert image sequence %s" % tar_file)
+        with tarfile.open(tar_file, "r") as t:
+            members = [m for m in t.getmembers() if m.isfile()]
+            frames: Optional[np.memmap] = None
+            mode = "RGB"
+            for i, member in enumerate(members):
+                fp = t.extractfile(member)
+                assert fp is not None
+                with fp:
+                    im = Image.open(fp)
+                    if frames is None:
+                        if im.mode in ("RGBA", "LA") or "transparency" in im.info:
+                            mode = "RGBA"
+                    im = im.convert(mode)
+                    if size is not None and im.size != tuple(size):
+                        im = im.resize(size, resample=Image.Resampling.BILINEAR)
+
+                    # Frames are written one by one, so the whole sequence
+                    # never has to be kept in memory.
+                    if frames is None:
+                        frames = np.lib.format.open_memmap(
+                            out_file,
+                            mode="w+",
+                            dtype=np.uint8,
+                            shape=(len(members), im.height, im.width, len(mode)),
+                        )
+                    frames[i] = np.asarray(im)
+
+            if frames is None:
+                raise Exception("No image found in %s" % tar_file)
+            frames.flush()
+            del frames
+
+    cache_file = _get_cache_file(
+        tar_file, ".npy", size=list(size) if size is not None else None
+    )
+    return np.load(_get_or_create(cache_file, create), mmap_mode="r")
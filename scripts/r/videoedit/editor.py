@@ -1,11 +1,14 @@
+import copy
 import functools
 import json
 import math
+import multiprocessing
 import os
 import re
 import subprocess
 import tarfile
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pprint import pprint
 from typing import Any, Dict, List, Literal, Optional, Sequence, Tuple, Union
 
@@ -28,9 +31,10 @@ from moviepy.editor import (
 from PIL import Image
 from utils.template import render_template
 
-from . import common
-from .export_movy_animation import export_movy_animation
-from .render_text import render_text
+from videoedit import clipcache, common
+from videoedit.export_movy_animation import export_movy_animation
+from videoedit.preview import preview_video
+from videoedit.render_text import render_text
 
 SCRIPT_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -47,7 +51,7 @@ class VideoClip:
         # Timing
         self.file = None
         self.start = 0
-        self.duration = None
+        self.duration: Optional[float] = None
         self.subclip: Optional[Tuple[float, ...]] = None
         self.frame = None
         self.loop = False
@@ -60,6 +64,7 @@ class VideoClip:
         self.transparent = True  # TODO: remove
         self.auto_extend = True
         self.filtering: Literal["linear", "nearest"] = "linear"
+        self.prescaled = False
 
         # Vfx
         self.speed = 1
@@ -73,7 +78,7 @@ class VideoClip:
         self.vol = None
 
         # Metadata
-        self.mpy_clip = None
+        self.mpy_clip: Any = None
 
     def __repr__(self):
         return f"VideoClip({os.path.basename(self.file)}, t={self.start:.1f}, d={self.duration:.1f})"
@@ -738,16 +743,11 @@ def _get_video_resolution(file):
     return resolution
 
 
-def _create_image_seq_clip(tar_file):
-    print("Load animation clip from %s" % tar_file)
-    image_files = []
-    t = tarfile.open(tar_file, "r")
-    for member in t.getmembers():
-        with t.extractfile(member) as fp:
-            im = Image.open(fp)
-            image_files.append(np.array(im))
-
-    clip = ImageSequenceClip(image_files, fps=IMAGE_SEQUENCE_FPS)
+def _create_image_seq_clip(tar_file, size=None):
+    # The frames are decoded once into the clip cache and memory-mapped from
+    # there, instead of being loaded into memory on every run.
+    frames = clipcache.get_image_seq_frames(tar_file, size=size)
+    clip = ImageSequenceClip(list(frames), fps=IMAGE_SEQUENCE_FPS)
     return clip
 
 
@@ -775,33 +775,54 @@ def _load_mpy_clip(
             h = height
         return (w, h)
 
-    def load_video_file_clip(f):
-        nonlocal scale
-
-        # Have ffmpeg resize the frames before returning them - faster speed.
-        if (
+    def need_scale():
+        return (
             scale[0] != 1.0
             or scale[1] != 1.0
             or width is not None
             or height is not None
-        ) and filtering == "linear":
+        ) and filtering == "linear"
+
+    def get_target_size(w, h):
+        w2, h2 = compute_size(w, h)
+        return (int(w2 * scale[1]), int(h2 * scale[0]))
+
+    def load_video_file_clip(f):
+        if need_scale():
             w, h = _get_video_resolution(f)
-            w, h = compute_size(w, h)
-            target_resolution = [int(h * scale[0]), int(w * scale[1])]
+            target_size = get_target_size(w, h)
+            # Decode a proxy that is already scaled down to the target size,
+            # which is much faster than decoding and scaling the source on
+            # every run.
+            if target_size[0] * target_size[1] < w * h:
+                return VideoFileClip(clipcache.get_video_proxy(f, target_size))
         else:
-            target_resolution = None
+            target_size = None
 
         return VideoFileClip(
             f,
-            target_resolution=target_resolution,
+            target_resolution=(
+                (target_size[1], target_size[0]) if target_size is not None else None
+            ),
             # has_mask=transparent and f.endswith(".gif"),
         )
 
+    def get_image_seq_size(f):
+        with tarfile.open(f, "r") as t:
+            for member in t:
+                if member.isfile():
+                    with t.extractfile(member) as fp:
+                        return Image.open(fp).size
+        raise Exception("No image found in %s" % f)
+
     if file is None:
         clip = ColorClip((200, 200), color=(0, 0, 0)).set_duration(2)
 
     elif file.endswith(".tar"):
-        clip = _create_image_seq_clip(file)
+        clip = _create_image_seq_clip(
+            file,
+            size=get_target_size(*get_image_seq_size(file)) if need_scale() else None,
+        )
 
     elif file.endswith(".pptx"):
         from ppt.export_ppt import export_slide, export_video
@@ -829,6 +850,23 @@ def _load_mpy_clip(
     return clip
 
 
+def _load_video_clip(clip_info: VideoClip):
+    clip_info.mpy_clip = _load_mpy_clip(
+        file=clip_info.file,
+        scale=clip_info.scale,
+        frame=clip_info.frame,
+        transparent=clip_info.transparent,
+        width=clip_info.width,
+        height=clip_info.height,
+        filtering=clip_info.filtering,
+    )
+    # Video files and image sequences are scaled when they are decoded.
+    clip_info.prescaled = (
+        isinstance(clip_info.mpy_clip, (VideoFileClip, ImageSequenceClip))
+        and clip_info.filtering == "linear"
+    )
+
+
 def _add_video_clip(
     file=None,
     speed=None,
@@ -942,17 +980,7 @@ def _add_video_clip(
     clip_info.filtering = filtering
 
     # Load mpy clip
-    clip_info.mpy_clip = _load_mpy_clip(
-        file=clip_info.file,
-        scale=clip_info.scale,
-        frame=clip_info.frame,
-        transparent=clip_info.transparent,
-        width=clip_info.width,
-        height=clip_info.height,
-        filtering=filtering,
-    )
-    if isinstance(clip_info.mpy_clip, VideoFileClip) and filtering == "linear":
-        clip_info.scale = (1.0, 1.0)  # HACK: video file clip are pre-scaled
+    _load_video_clip(clip_info)
 
     # Duration
     if duration is None:
@@ -1222,10 +1250,16 @@ def _update_mpy_clip(
     height,
     vol,
     filtering: Literal["linear", "nearest"],
+    prescaled=False,
     **kwargs,
 ):
     assert duration is not None
 
+    if prescaled:
+        scale = (1.0, 1.0)
+        width = None
+        height = None
+
     # Must adjust clip speed first
     if speed is not None:
         clip = clip.fx(
@@ -1287,8 +1321,7 @@ def _update_mpy_clip(
             target_size = (int(clip.w * scale[0]), int(clip.h * scale[1]))
 
         if filtering == "linear":
-            if not isinstance(clip, VideoFileClip):  # VideoFileClip are pre-scaled
-                clip = clip.resize(target_size)
+            clip = clip.resize(target_size)
         else:
 
             def resize_nearest(target_size):
@@ -1393,25 +1426,14 @@ def set_audio_only(audio_only=True):
         print("Audio only enabled.")
 
 
-def export_video(*, resolution, preview=False):
-    resolution = [int(x * _state.global_scale) for x in resolution]
-
-    audio_clips = []
-
-    # Update clip duration for each track
-    for track in _state.video_tracks.values():
-        _update_clip_duration(track)
-
-    # TODO: post-process video track clips
-
-    # Output
-    for track_name, track in _state.video_tracks.items():
-        if len(track) > 0:
-            pprint({track_name: track})
-
-    # Update MoviePy clip object in each track.
+def _create_mpy_video_clips(tracks: Dict[str, List[VideoClip]]):
+    """
+    Update the MoviePy clip object of each clip, and return the video clips to
+    be composited along with the audio clips split from them.
+    """
     video_clips = []
-    for track_name, track in _state.video_tracks.items():
+    audio_clips = []
+    for track_name, track in tracks.items():
         for i, clip_info in enumerate(track):
             assert clip_info.mpy_clip is not None
             assert clip_info.duration is not None
@@ -1510,6 +1532,233 @@ def export_video(*, resolution, preview=False):
 
             video_clips.append(clip_info.mpy_clip.set_start(clip_info.start))
 
+    return video_clips, audio_clips
+
+
+# Segments shorter than this are merged into the next one.
+MIN_SEGMENT_DURATION = 10.0
+
+
+class _Segment:
+    def __init__(self, start: float, end: float):
+        self.start = start
+        self.end = end
+
+        # Copies of the clips that overlap the segment, without MoviePy clip
+        # objects, so that they can be sent to worker processes.
+        self.video_tracks: Dict[str, List[VideoClip]] = OrderedDict()
+
+    def get_hash(self, resolution) -> str:
+        clips = []
+        for track_name, track in self.video_tracks.items():
+            for clip_info in track:
+                spec = {k: v for k, v in vars(clip_info).items() if k != "mpy_clip"}
+                # Use the time relative to the segment, so that a segment that
+                # is only shifted in the timeline does not need to be rendered
+                # again.
+                spec["start"] = clip_info.start - self.start
+                if clip_info.file is not None and os.path.exists(clip_info.file):
+                    spec["mtime"] = os.path.getmtime(clip_info.file)
+                clips.append([track_name, spec])
+
+        return get_hash(
+            json.dumps(
+                {
+                    "duration": self.end - self.start,
+                    "resolution": list(resolution),
+                    "fps": FPS,
+                    "globalScale": _state.global_scale,
+                    "clips": clips,
+                },
+                sort_keys=True,
+                default=str,
+            ),
+            digit=32,
+        )
+
+
+def _get_clip_end(track: List[VideoClip], i: int) -> float:
+    # The clip is extended if the next clip crossfades into it.
+    duration = track[i].duration
+    assert duration is not None
+    end = track[i].start + duration
+    if i < len(track) - 1:
+        end += track[i + 1].crossfade
+    return end
+
+
+def _plan_segments(tracks: Dict[str, List[VideoClip]]) -> List[_Segment]:
+    """
+    Split the timeline at clip boundaries into segments that can be rendered
+    independently. The timeline is never cut in the middle of a fade or a
+    crossfade.
+    """
+    end = 0.0
+    cut_points = set()
+    transitions: List[Tuple[float, float]] = []
+    for track in tracks.values():
+        for i, clip_info in enumerate(track):
+            clip_end = _get_clip_end(track, i)
+            end = max(end, clip_end)
+
+            # Cut at frame boundaries.
+            cut_points.add(round(clip_info.start * FPS) / FPS)
+            cut_points.add(round(clip_end * FPS) / FPS)
+
+            if clip_info.crossfade:
+                transitions.append(
+                    (clip_info.start, clip_info.start + clip_info.crossfade)
+                )
+            if clip_info.fadein:
+                transitions.append((clip_info.start, clip_info.start + clip_info.fadein))
+            if clip_info.fadeout:
+                transitions.append((clip_end - clip_info.fadeout, clip_end))
+
+    if end <= 0:
+        return []
+
+    bounds = [0.0]
+    for t in sorted(cut_points):
+        if t - bounds[-1] < MIN_SEGMENT_DURATION or end - t < MIN_SEGMENT_DURATION:
+            continue
+        if any(a < t < b for a, b in transitions):
+            continue
+        bounds.append(t)
+    bounds.append(end)
+
+    segments: List[_Segment] = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        segment = _Segment(start, end)
+        for track_name, track in tracks.items():
+            indices = set()
+            for i, clip_info in enumerate(track):
+                if clip_info.start < end and _get_clip_end(track, i) > start:
+                    indices.add(i)
+                    # Needed to tell whether the clip is extended by a crossfade.
+                    if i < len(track) - 1:
+                        indices.add(i + 1)
+
+            clips = []
+            for i in sorted(indices):
+                clip_info = copy.copy(track[i])
+                clip_info.mpy_clip = None
+                clips.append(clip_info)
+            segment.video_tracks[track_name] = clips
+        segments.append(segment)
+
+    return segments
+
+
+def _render_segment(
+    segment: _Segment, resolution, fps: int, global_scale: float, out_file: str
+):
+    _state.global_scale = global_scale
+    for track in segment.video_tracks.values():
+        for clip_info in track:
+            _load_video_clip(clip_info)
+
+    video_clips, _ = _create_mpy_video_clips(segment.video_tracks)
+    clip = (
+        CompositeVideoClip(video_clips, size=resolution)
+        .set_duration(segment.end)
+        .subclip(segment.start, segment.end)
+    )
+
+    tmp_file = out_file + ".tmp.mp4"
+    clip.write_videofile(
+        tmp_file,
+        audio=False,
+        codec="libx264",
+        fps=fps,
+        ffmpeg_params=["-crf", "19"],
+        logger=None,
+    )
+    os.replace(tmp_file, out_file)
+
+
+def _export_video_segments(
+    segments: List[_Segment], resolution, audio_clip, jobs: int
+) -> str:
+    segment_dir = os.path.join("tmp", "segments")
+    os.makedirs(segment_dir, exist_ok=True)
+
+    segment_files = []
+    segments_to_render: Dict[str, _Segment] = {}
+    for segment in segments:
+        segment_file = os.path.join(segment_dir, segment.get_hash(resolution) + ".mp4")
+        segment_files.append(segment_file)
+        if not os.path.exists(segment_file):
+            segments_to_render[segment_file] = segment
+
+    print(
+        "Render %d of %d segments with %d processes..."
+        % (len(segments_to_render), len(segments), jobs)
+    )
+    if segments_to_render:
+        # Do not fork, as the MoviePy clips of this process hold ffmpeg readers.
+        with ProcessPoolExecutor(
+            max_workers=jobs, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _render_segment,
+                    segment,
+                    resolution,
+                    FPS,
+                    _state.global_scale,
+                    segment_file,
+                )
+                for segment_file, segment in segments_to_render.items()
+            ]
+            for future in as_completed(futures):
+                future.result()
+
+    # Remove the segments that are no longer used.
+    for file in os.listdir(segment_dir):
+        file = os.path.join(segment_dir, file)
+        if file not in segment_files:
+            os.remove(file)
+
+    list_file = "%s.segments.txt" % out_filename
+    with open(list_file, "w", encoding="utf-8") as f:
+        for segment_file in segment_files:
+            f.write("file '%s'\n" % os.path.abspath(segment_file).replace("\\", "/"))
+
+    # Concatenate the segments without re-encoding.
+    out_file = "%s.mp4" % out_filename
+    args = ["ffmpeg", "-y", "-f", "concat", "-safe", "0", "-i", list_file]
+    if audio_clip is not None:
+        audio_file = "%s.mp3" % out_filename
+        audio_clip.write_audiofile(audio_file, fps=44100)
+        args += ["-i", audio_file, "-map", "0:v", "-map", "1:a"]
+    args += ["-c", "copy", out_file]
+    subprocess.check_call(args)
+
+    return out_file
+
+
+def export_video(*, resolution, preview=False, stream_preview=False, jobs=1):
+    resolution = [int(x * _state.global_scale) for x in resolution]
+
+    # Update clip duration for each track
+    for track in _state.video_tracks.values():
+        _update_clip_duration(track)
+
+    # TODO: post-process video track clips
+
+    # Output
+    for track_name, track in _state.video_tracks.items():
+        if len(track) > 0:
+            pprint({track_name: track})
+
+    # Segments are rendered from the clips before they are updated below.
+    segments = None
+    if jobs > 1 and not preview and not stream_preview and not _state.audio_only:
+        segments = _plan_segments(_state.video_tracks)
+
+    # Update MoviePy clip object in each track.
+    video_clips, audio_clips = _create_mpy_video_clips(_state.video_tracks)
+
     if len(video_clips) == 0:
         video_clips.append(ColorClip((200, 200), color=(0, 1, 0)).set_duration(2))
         # raise Exception("no video clips??")
@@ -1583,11 +1832,30 @@ def export_video(*, resolution, preview=False):
         return "%s.mp3" % out_filename
 
     else:
-        if preview:
+        if stream_preview:
+            preview_video(
+                final_clip,
+                fps=FPS,
+                audio_clip=final_clip.audio,
+                audio_file="%s.mp3" % out_filename,
+                mpv_args={"geometry": "33%-0%+0%"},
+            )
+        elif preview:
             final_clip.preview(fps=15)
             import pygame
 
             pygame.quit()
+        elif segments:
+            return _export_video_segments(
+                segments,
+                resolution,
+                (
+                    final_clip.audio.set_duration(final_clip.duration)
+                    if final_clip.audio is not None
+                    else None
+                ),
+                jobs,
+            )
         else:
             final_clip.write_videofile(
                 "%s.mp4" % out_filename,
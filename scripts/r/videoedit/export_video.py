@@ -25,7 +25,7 @@ from videoedit.project import create_project
 
 os.environ["FFMPEG_BINARY"] = shutil.which("ffmpeg")
 
-from . import automation, common, editor
+from videoedit import automation, common, editor
 
 SCRIPT_ROOT = os.path.dirname(os.path.abspath(__file__))
 
@@ -256,8 +256,20 @@ if __name__ == "__main__":
     parser.add_argument("--remove_unused_recordings", action="store_true")
     parser.add_argument("--stat", action="store_true")
     parser.add_argument("--preview", action="store_true")
+    parser.add_argument(
+        "--stream-preview",
+        action="store_true",
+        help="stream a low-resolution preview into mpv while rendering",
+    )
     parser.add_argument("--force", action="store_true")
     parser.add_argument("--closed-captions", action="store_true")
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="render the video in segments with multiple processes",
+    )
 
     args = parser.parse_args()
 
@@ -336,7 +348,7 @@ if __name__ == "__main__":
             editor.reset()
             keep_awake()
 
-            if args.preview:
+            if args.preview or args.stream_preview:
                 editor.enable_preview()
 
             if args.force:
@@ -347,12 +359,16 @@ if __name__ == "__main__":
 
             _parse_text(s, apis=common.apis)
 
-            out: str = editor.export_video(resolution=(1920, 1080))
-
-            mpv_extra_args = []
-            if args.preview:
-                mpv_extra_args.append("--geometry=33%-0%+0%")
-            _open_mpv_single_instance(out, mpv_extra_args)
+            out = editor.export_video(
+                resolution=(1920, 1080),
+                stream_preview=args.stream_preview,
+                jobs=args.jobs,
+            )
+            if out is not None:
+                mpv_extra_args = []
+                if args.preview:
+                    mpv_extra_args.append("--geometry=33%-0%+0%")
+                _open_mpv_single_instance(out, mpv_extra_args)
 
     except common.VideoEditException as ex:
         print2("ERROR: %s" % ex, color="red")
@@ -0,0 +1,111 @@
+import http.server
+import logging
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .python_mpv_jsonipc import MPV
+
+# Only every Nth frame is rendered for preview.
+PREVIEW_FRAME_STEP = 3
+
+
+class _PreviewServer(http.server.ThreadingHTTPServer):
+    def __init__(self, clip, fps: float):
+        super().__init__(("127.0.0.1", 0), _PreviewHandler)
+        self.clip = clip
+        self.fps = fps
+
+        # MoviePy clips cannot render frames from multiple threads at once.
+        self.render_lock = threading.Lock()
+
+    def get_url(self) -> str:
+        return "http://127.0.0.1:%d/preview" % self.server_address[1]
+
+
+class _PreviewHandler(http.server.BaseHTTPRequestHandler):
+    server: _PreviewServer
+
+    def do_GET(self):
+        # The length is unknown, so the stream ends when the connection is
+        # closed.
+        self.protocol_version = "HTTP/1.0"
+        self.send_response(200)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.end_headers()
+
+        clip = self.server.clip
+        n_frames = int(clip.duration * self.server.fps)
+        with self.server.render_lock:
+            for i in range(n_frames):
+                frame = clip.get_frame(i / self.server.fps)
+                try:
+                    self.wfile.write(
+                        np.ascontiguousarray(frame, dtype=np.uint8).tobytes()
+                    )
+                except (BrokenPipeError, ConnectionResetError):
+                    # mpv has been closed.
+                    break
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def preview_video(
+    clip,
+    fps: float,
+    audio_clip=None,
+    audio_file: Optional[str] = None,
+    frame_step: int = PREVIEW_FRAME_STEP,
+    mpv_args: Optional[dict] = None,
+):
+    """
+    Play the clip in mpv while it is being rendered, instead of encoding it to
+    a file first.
+
+    Only every `frame_step`-th frame is rendered. The frames are streamed to
+    mpv as raw RGB over a local HTTP connection. The audio is mixed in the
+    background and added once it has been written to `audio_file`.
+
+    Returns when mpv is closed.
+    """
+    preview_fps = fps / frame_step
+    w, h = clip.size
+
+    server = _PreviewServer(clip, preview_fps)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    quit_event = threading.Event()
+    mpv = MPV(
+        quit_callback=quit_event.set,
+        force_window=True,
+        keep_open=True,
+        cache=True,
+        # Only affects the main stream, not the external audio file.
+        demuxer="rawvideo",
+        demuxer_rawvideo_w=w,
+        demuxer_rawvideo_h=h,
+        demuxer_rawvideo_fps=preview_fps,
+        demuxer_rawvideo_mp_format="rgb24",
+        **(mpv_args or {}),
+    )
+    mpv.play(server.get_url())
+
+    if audio_clip is not None and audio_file is not None:
+
+        def write_audio():
+            os.makedirs(os.path.dirname(os.path.abspath(audio_file)), exist_ok=True)
+            audio_clip.write_audiofile(audio_file, fps=44100, logger=None)
+            if not quit_event.is_set():
+                mpv.command("audio-add", os.path.abspath(audio_file), "select")
+
+        threading.Thread(target=write_audio, daemon=True).start()
+
+    try:
+        quit_event.wait()
+    finally:
+        mpv.terminate()
+        server.shutdown()
+        server.server_close()